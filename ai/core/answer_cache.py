@@ -0,0 +1,118 @@
+import threading
+from dataclasses import dataclass
+from typing import Hashable, List, Optional, Text
+
+import faiss
+import numpy as np
+
+from ai.core.metrics import metrics
+
+# Neighbours checked per lookup, since the nearest one may be in another language.
+SEARCH_K = 4
+
+
+@dataclass
+class CachedAnswer:
+    question: Text
+    answer: Text
+    language: Text
+    tokens: int
+    # Names the question must share with a new one to reuse the answer.
+    entities: Hashable = ()
+
+
+class SemanticAnswerCache:
+    """Past answers indexed by question embedding, for near-duplicate questions.
+
+    Embeddings are L2-normalized in an inner-product FAISS index, so scores
+    are cosine similarities. A hit must also name the same entities, such as
+    locations and days, since questions differing only in those are close
+    in embedding space but have different answers. Every entry belongs to one knowledge-base and
+    prompt version (`context`); when the context changes, the cache is
+    emptied on the next lookup or insert. When full, the oldest half of the
+    entries is dropped.
+    """
+
+    def __init__(self, max_size: int = 5000, threshold: float = 0.97):
+        self.max_size = max_size
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._index: Optional[faiss.IndexFlatIP] = None
+        self._entries: List[CachedAnswer] = []
+        self._vectors: List[np.ndarray] = []
+        self._context: Hashable = None
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _reset(self, context: Hashable):
+        if self._entries:
+            metrics.incr("answer_cache.invalidations")
+        self._index = None
+        self._entries = []
+        self._vectors = []
+        self._context = context
+
+    def _rebuild(self):
+        self._index = faiss.IndexFlatIP(self._vectors[0].shape[1])
+        self._index.add(np.vstack(self._vectors))
+
+    def get(
+        self, embedding: List[float], language: Text, context: Hashable, entities: Hashable = ()
+    ) -> Optional[CachedAnswer]:
+        if not self.max_size:
+            return None
+
+        with self._lock:
+            if context != self._context:
+                self._reset(context)
+            hit = None
+            if self._index is not None:
+                scores, positions = self._index.search(self._normalize(embedding), SEARCH_K)
+                for score, position in zip(scores[0], positions[0]):
+                    if position < 0 or score < self.threshold:
+                        break
+                    entry = self._entries[position]
+                    if entry.language == language and entry.entities == entities:
+                        hit = entry
+                        break
+
+        if hit is None:
+            metrics.incr("answer_cache.misses")
+            return None
+        metrics.incr("answer_cache.hits")
+        metrics.incr("answer_cache.tokens_saved", hit.tokens)
+        return hit
+
+    def add(self, embedding: List[float], entry: CachedAnswer, context: Hashable):
+        if not self.max_size:
+            return
+
+        with self._lock:
+            if context != self._context:
+                self._reset(context)
+            vector = self._normalize(embedding)
+            self._entries.append(entry)
+            self._vectors.append(vector)
+            if len(self._entries) > self.max_size:
+                keep = self.max_size // 2
+                self._entries = self._entries[-keep:]
+                self._vectors = self._vectors[-keep:]
+                self._rebuild()
+            elif self._index is None:
+                self._rebuild()
+            else:
+                self._index.add(vector)
+
+    def stats(self) -> dict:
+        hits = metrics.counter("answer_cache.hits")
+        misses = metrics.counter("answer_cache.misses")
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hit_ratio": hits / (hits + misses) if hits + misses else None,
+        }
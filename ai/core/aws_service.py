@@ -1,35 +1,252 @@
+import hashlib
+import json
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
 import boto3
+from boto3.s3.transfer import TransferConfig
+
 from ai.core.constants import AWSConstants
+from ai.core.faiss_io import LOAD_MODE_MMAP, write_mmap_index
+from ai.core.metrics import metrics
+from config.config import Settings
+
+# Files that are written locally and never synced: memory-mapped index copies
+# are rebuilt after a download, and the embedding databases and CSV import
+# checkpoints belong to the machine that wrote them.
+EXCLUDED_SUFFIXES = (
+    ".tmp",
+    ".mmap.faiss",
+    ".progress",
+    ".sqlite3",
+    ".sqlite3-journal",
+    ".sqlite3-wal",
+    ".sqlite3-shm",
+)
+EXCLUDED_NAMES = (".lock", AWSConstants.SYNC_MANIFEST_FILE)
+# Pointer files go last, so a reader never sees a pointer to missing files.
+POINTER_FILES = ("CURRENT",)
+# Most keys S3 deletes in one request.
+DELETE_BATCH_SIZE = 1000
+
 
 class AWSService:
-    def __init__(self) -> None:
+    """Incremental sync of a local folder with the S3 bucket.
+
+    Both directions compare S3 ETags with the ETags of the local files, as
+    computed by S3 for the same multipart settings, and only transfer what
+    differs. Local ETags are cached by size and modification time in a
+    manifest file, so unchanged files are not hashed again. Transfers run
+    concurrently and large files use multipart transfers.
+
+    Deletions are mirrored too, after the pointer files, so a reader never
+    sees a pointer to deleted files. Only files present on both sides after
+    the previous sync are deleted; files that were never synced, such as
+    local databases, are left alone.
+
+    The S3 client can be injected, e.g. a client of a local S3 stand-in.
+    """
+
+    def __init__(self, s3_client=None) -> None:
         # Set your AWS credentials and region
         self.aws_access_key = AWSConstants.AWS_ACCESS_KEY
         self.aws_secret_key = AWSConstants.AWS_SECRET_ACCESS_KEY
         self.region_name = AWSConstants.REGION_NAME
+        self.s3_bucket = AWSConstants.S3_BUCKET
         # Initialize the S3 client
-        self.s3 = boto3.client('s3', aws_access_key_id=self.aws_access_key, aws_secret_access_key=self.aws_secret_key, region_name=self.region_name)
+        self.s3 = s3_client or boto3.client(
+            's3',
+            aws_access_key_id=self.aws_access_key,
+            aws_secret_access_key=self.aws_secret_key,
+            region_name=self.region_name,
+            endpoint_url=AWSConstants.ENDPOINT_URL or None,
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=AWSConstants.MULTIPART_THRESHOLD,
+            multipart_chunksize=AWSConstants.MULTIPART_CHUNKSIZE,
+            max_concurrency=AWSConstants.MULTIPART_CONCURRENCY,
+        )
 
-    def upload_to_s3(self, local_folder):
-        s3_bucket = AWSConstants.S3_BUCKET
+    @staticmethod
+    def _is_excluded(relative_path: str) -> bool:
+        name = os.path.basename(relative_path)
+        return (
+            name in EXCLUDED_NAMES
+            or name.endswith(EXCLUDED_SUFFIXES)
+            or any(part.startswith(".tmp-") for part in relative_path.split("/"))
+        )
 
-        # Iterate through the local files and upload them to S3
-        for root, dirs, files in os.walk(local_folder):
+    def _etag(self, file_path: str) -> str:
+        """The ETag S3 computes for an upload with `self.transfer_config`."""
+        file_md5 = hashlib.md5()
+        part_digests = []
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.transfer_config.multipart_chunksize), b""):
+                file_md5.update(chunk)
+                part_digests.append(hashlib.md5(chunk).digest())
+
+        if os.path.getsize(file_path) < self.transfer_config.multipart_threshold:
+            return file_md5.hexdigest()
+        return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+    @staticmethod
+    def _load_sync_state(local_folder: str) -> Tuple[dict, Set[str]]:
+        """Cached local ETags, and the keys on both sides after the last sync."""
+        manifest_path = os.path.join(local_folder, AWSConstants.SYNC_MANIFEST_FILE)
+        try:
+            with open(manifest_path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}, set()
+        if "files" not in state:
+            # Written before deletions were mirrored.
+            return state, set()
+        return state["files"], set(state["synced"])
+
+    def _local_manifest(self, local_folder: str, synced: Optional[Set[str]] = None) -> Dict[str, str]:
+        """ETags of the local files keyed by S3 key.
+
+        `synced` replaces the keys recorded as on both sides, when given.
+        """
+        cached, previously_synced = self._load_sync_state(local_folder)
+
+        entries = {}
+        for root, _, files in os.walk(local_folder):
             for file in files:
                 local_file_path = os.path.join(root, file)
                 s3_key = os.path.relpath(local_file_path, local_folder).replace('\\', '/')
-                self.s3.upload_file(local_file_path, s3_bucket, s3_key)
-                print(f'Uploaded {local_file_path} to s3://{s3_bucket}/{s3_key}')
-
-    def download_from_s3(self):
-        s3_bucket = AWSConstants.S3_BUCKET
-        objects = self.s3.list_objects_v2(Bucket=s3_bucket)
-        for obj in objects.get('Contents', []):
-            s3_key = obj['Key']
-            local_file_path = os.path.join("files/", s3_key)
+                if self._is_excluded(s3_key):
+                    continue
+                stat = os.stat(local_file_path)
+                entry = cached.get(s3_key)
+                if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+                    entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "etag": self._etag(local_file_path)}
+                entries[s3_key] = entry
+
+        self._save_local_manifest(local_folder, entries, previously_synced if synced is None else synced)
+        return {s3_key: entry["etag"] for s3_key, entry in entries.items()}
+
+    @staticmethod
+    def _save_local_manifest(local_folder: str, entries: dict, synced: Set[str]):
+        os.makedirs(local_folder, exist_ok=True)
+        manifest_path = os.path.join(local_folder, AWSConstants.SYNC_MANIFEST_FILE)
+        tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"files": entries, "synced": sorted(synced)}, f)
+        os.replace(tmp_path, manifest_path)
+
+    def _remote_manifest(self, prefix: str = "") -> Dict[str, str]:
+        """ETags of the objects under `prefix`, over every listing page."""
+        remote = {}
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.s3_bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                remote[obj['Key']] = obj['ETag'].strip('"')
+        return remote
+
+    @staticmethod
+    def _ordered(keys: List[str]) -> Tuple[List[str], List[str]]:
+        data = [key for key in keys if os.path.basename(key) not in POINTER_FILES]
+        pointers = [key for key in keys if os.path.basename(key) in POINTER_FILES]
+        return data, pointers
+
+    def _run(self, fn, keys: List[str], delete=None, deleted: List[str] = ()):
+        """Transfer `keys` with `fn`, pointers last, then `delete` the `deleted` keys."""
+        data, pointers = self._ordered(keys)
+        with ThreadPoolExecutor(max_workers=AWSConstants.SYNC_CONCURRENCY) as executor:
+            # `list` re-raises the first transfer error.
+            list(executor.map(fn, data))
+        for key in pointers:
+            fn(key)
+        if deleted:
+            delete(deleted)
+
+    def upload_to_s3(self, local_folder: str, prefix: str = "") -> dict:
+        """Upload the files of `local_folder` whose ETag differs from S3, and delete removed ones."""
+        start = time.perf_counter()
+        _, synced = self._load_sync_state(local_folder)
+        local = self._local_manifest(local_folder)
+        remote = self._remote_manifest(prefix)
+
+        changed = [
+            s3_key for s3_key, etag in local.items()
+            if remote.get(prefix + s3_key) != etag
+        ]
+        deleted = [
+            s3_key[len(prefix):] for s3_key in remote
+            if s3_key[len(prefix):] not in local and s3_key[len(prefix):] in synced
+        ]
+
+        def upload(s3_key: str):
+            local_file_path = os.path.join(local_folder, s3_key)
+            self.s3.upload_file(local_file_path, self.s3_bucket, prefix + s3_key, Config=self.transfer_config)
+            logging.info(f'Uploaded {local_file_path} to s3://{self.s3_bucket}/{prefix + s3_key}')
+
+        def delete(s3_keys: List[str]):
+            for i in range(0, len(s3_keys), DELETE_BATCH_SIZE):
+                batch = s3_keys[i : i + DELETE_BATCH_SIZE]
+                self.s3.delete_objects(
+                    Bucket=self.s3_bucket,
+                    Delete={"Objects": [{"Key": prefix + s3_key} for s3_key in batch], "Quiet": True},
+                )
+            logging.info(f'Deleted {len(s3_keys)} objects from s3://{self.s3_bucket}/{prefix}')
+
+        self._run(upload, changed, delete, deleted)
+        self._local_manifest(local_folder, synced=set(local))
+        return self._report("upload", len(local), changed, deleted, local_folder, start)
+
+    def download_from_s3(self, local_folder: str = AWSConstants.LOCAL_FOLDER, prefix: str = "") -> dict:
+        """Download the objects under `prefix` whose ETag differs from the local file."""
+        start = time.perf_counter()
+        remote = {
+            s3_key[len(prefix):]: etag
+            for s3_key, etag in self._remote_manifest(prefix).items()
+            if not s3_key.endswith("/") and not self._is_excluded(s3_key[len(prefix):])
+        }
+        _, synced = self._load_sync_state(local_folder)
+        local = self._local_manifest(local_folder)
+
+        changed = [s3_key for s3_key, etag in remote.items() if local.get(s3_key) != etag]
+        deleted = [s3_key for s3_key in local if s3_key not in remote and s3_key in synced]
+        build_mmap_index = Settings().VECTORSTORE_LOAD_MODE == LOAD_MODE_MMAP
+
+        def download(s3_key: str):
+            local_file_path = os.path.join(local_folder, s3_key)
             os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
-            with open(local_file_path, "wb") as f:
-                self.s3.download_fileobj(s3_bucket, s3_key, f)
-                f.close()
-            print(f'Downloaded s3://{s3_bucket}/{s3_key} to {local_file_path}')
+            # Readers never see a partially downloaded file.
+            tmp_path = f"{local_file_path}.{os.getpid()}.tmp"
+            self.s3.download_file(self.s3_bucket, prefix + s3_key, tmp_path, Config=self.transfer_config)
+            os.replace(tmp_path, local_file_path)
+            logging.info(f'Downloaded s3://{self.s3_bucket}/{prefix + s3_key} to {local_file_path}')
+            if build_mmap_index and os.path.basename(s3_key) == "index.faiss":
+                # Before the pointers are downloaded, so new versions are memory-mapped from the start.
+                write_mmap_index(os.path.dirname(local_file_path))
+
+        def delete(s3_keys: List[str]):
+            for s3_key in s3_keys:
+                local_file_path = os.path.join(local_folder, s3_key)
+                if os.path.exists(local_file_path):
+                    os.remove(local_file_path)
+            logging.info(f'Deleted {len(s3_keys)} files removed from s3://{self.s3_bucket}/{prefix}')
+
+        self._run(download, changed, delete, deleted)
+        # Cache the ETags of the downloaded files.
+        self._local_manifest(local_folder, synced=set(remote))
+        return self._report("download", len(remote), changed, deleted, local_folder, start)
+
+    @staticmethod
+    def _report(
+        direction: str, num_files: int, changed: List[str], deleted: List[str], local_folder: str, start: float
+    ) -> dict:
+        seconds = time.perf_counter() - start
+        metrics.incr(f"s3_sync.{direction}_files", len(changed))
+        metrics.incr(f"s3_sync.{direction}_deletions", len(deleted))
+        metrics.observe(f"s3_sync.{direction}_seconds", seconds)
+        logging.info(
+            f"S3 {direction} of {local_folder}: {len(changed)} of {num_files} files transferred, "
+            f"{len(deleted)} deleted in {seconds:.2f}s"
+        )
+        return {"files": num_files, "transferred": len(changed), "deleted": len(deleted), "seconds": seconds}
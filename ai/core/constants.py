@@ -9,12 +9,35 @@ class BaseConstants:
     ROOT_PATH = os.path.abspath(os.path.join(__file__, "../.."))
 
 class IngestDataConstants(BaseConstants):
+    # Model whose tokenizer sizes chunks and counts their tokens.
+    TOKENIZER_MODEL = 'gpt-3.5-turbo'
     CHUNK_SIZE = 4000
     CHUNK_OVERLAP = 500
     TEMP_DB_FOLDER = 'files/vectorstores/'
     MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB
     ALLOWED_EXTENSIONS = ["pdf", "json"]
     TEMP_UPLOADED_FOLDER = 'tmp/uploaded/'
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+    # Texts per embeddings API request.
+    EMBEDDING_BATCH_SIZE = 500
+    INGEST_JOB_LEASE_SECONDS = 120
+    INGEST_JOB_POLL_SECONDS = 5
+    SEGMENT_COMPACTION_THRESHOLD = 8
+    SNAPSHOT_RETENTION = 2
+    PDF_PAGES_PER_TASK = 16
+    # Parse tasks queued per pool worker; bounds the pages held in memory.
+    PARSE_TASKS_IN_FLIGHT = 2
+    STREAM_BATCH_SIZE = 32
+    STREAM_QUEUE_SIZE = 64
+    SENSOR_BULK_BATCH_SIZE = 2000
+    SENSOR_DATA_CSV = 'files/sensordata.csv'
+    SENSOR_DB_BATCH_SIZE = 5000
+    # Metadata key of the SensorDataLib id in the sensor library vectorstore.
+    SENSOR_DATA_ID_KEY = 'sensor_data_id'
+    # Metadata key of a chunk's embedding_store.content_hash.
+    CONTENT_HASH_KEY = 'content_hash'
+    # Metadata key of a chunk's token count, computed when it is split.
+    NUM_TOKENS_KEY = 'num_tokens'
 
 class LangChainOpenAIConstants(BaseConstants):
     type_to_cls_dict_plus: Dict[str, Type[Union[BaseLLM, ChatOpenAI]]] = {k: v for k, v in type_to_cls_dict.items()}
@@ -27,6 +50,45 @@ class LangChainOpenAIConstants(BaseConstants):
     KNOWLEDGE_BASE_RETRIEVER_DESCRIPTION: str = (
         "Searches and returns documents in the knowledge base"
     )
+    RETRIEVER_TIMEOUT_SECONDS: float = 5.0
+    DIAMOND_NO_DATA_ANSWER: str = "NO DATA"
+    # Vectorstores of short questions that also get a lexical (BM25) index.
+    LEXICAL_INDEXES = ("diamond_dataset", "sensor_lib")
+    LEXICAL_MATCH_THRESHOLD: float = 0.9
+
+class SensorStoreConstants(BaseConstants):
+    # "Today" and "yesterday" in questions are days of the sensors' time zone.
+    TIMEZONE = "Asia/Ho_Chi_Minh"
+    # How often each process checks whether the readings were reloaded.
+    REFRESH_CHECK_SECONDS = 30
+    # Id of the SensorDataVersion stamp.
+    VERSION_ID = "sensor_data_lib"
+    # Matched against the question after diacritic folding.
+    LATEST_WORDS = ("hien tai", "bay gio", "moi nhat", "now", "current", "currently", "latest")
+    TODAY_WORDS = ("hom nay", "today")
+    YESTERDAY_WORDS = ("hom qua", "yesterday")
+    # Questions asking for advice, causes, effects or forecasts about a
+    # reading are more than a lookup and are left to the LLM.
+    INTENT_WORDS = (
+        "nen", "lam gi", "lam sao", "tai sao", "vi sao", "anh huong", "khac phuc", "xu ly", "bien phap",
+        "du bao", "so sanh", "should", "why", "how to", "what to do", "affect", "forecast", "compare",
+    )
+    LATEST_TEMPLATES: Dict[str, str] = {
+        "Vietnamese": "{parameter} tại {location} lúc {time:%H:%M %d/%m/%Y} là {value:g} {unit}.",
+        "English": "The {parameter} at {location} was {value:g} {unit} at {time:%H:%M %d/%m/%Y}.",
+    }
+    DAY_TEMPLATES: Dict[str, str] = {
+        "Vietnamese": (
+            "{parameter} tại {location} ngày {day:%d/%m/%Y}: trung bình {mean:.2f} {unit}, "
+            "thấp nhất {min:g} {unit}, cao nhất {max:g} {unit}. "
+            "Giá trị mới nhất lúc {time:%H:%M} là {value:g} {unit}."
+        ),
+        "English": (
+            "The {parameter} at {location} on {day:%d/%m/%Y}: average {mean:.2f} {unit}, "
+            "minimum {min:g} {unit}, maximum {max:g} {unit}. "
+            "The latest reading, at {time:%H:%M}, was {value:g} {unit}."
+        ),
+    }
 
 
 class AWSConstants(BaseConstants):
@@ -34,3 +96,10 @@ class AWSConstants(BaseConstants):
     AWS_SECRET_ACCESS_KEY = Settings().AWS_SECRET_ACCESS_KEY
     REGION_NAME = Settings().AWS_REGION
     S3_BUCKET = Settings().AWS_S3_BUCKET
+    ENDPOINT_URL = Settings().AWS_S3_ENDPOINT_URL
+    LOCAL_FOLDER = 'files/'
+    SYNC_MANIFEST_FILE = '.s3-sync.json'
+    SYNC_CONCURRENCY = 16
+    MULTIPART_THRESHOLD = 8 * 1024 * 1024  # 8MB
+    MULTIPART_CHUNKSIZE = 8 * 1024 * 1024  # 8MB
+    MULTIPART_CONCURRENCY = 4
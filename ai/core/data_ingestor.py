@@ -1,25 +1,64 @@
 import logging
 import os
+import queue
+import threading
 import time
-
-
-from typing import List, Text, Tuple
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Text, Tuple
 
 from langchain.document_loaders import PyPDFium2Loader, UnstructuredFileLoader, UnstructuredExcelLoader, CSVLoader
+from langchain.docstore.document import Document
 from langchain.text_splitter import TokenTextSplitter
-from langchain.vectorstores import FAISS
 
 from llama_index import download_loader
 
 from ai.core.constants import IngestDataConstants
+from ai.core.document_parser import (
+    add_token_counts,
+    count_pdf_pages,
+    discard_executor,
+    get_executor,
+    parse_and_split,
+    split_documents,
+    text_splitter,
+)
+from ai.core.embedding_store import content_hash
+from ai.core.faiss_io import from_embeddings, get_index_config
+from ai.core.metrics import metrics
+from ai.core.segmented_vectorstore import append_segment, content_hashes, docstore_ids, schedule_compaction
 from ai.llm.base_model.langchain_openai import openai_embedding_with_backoff
 
 class DataIngestor:
     """Ingest data with different format to create vectorstore"""
-    def __init__(self, lang: str = ""):
+    def __init__(self, lang: str = "", on_progress: Optional[Callable[[dict], None]] = None):
         self.lang = lang
         self.vectorstore_path = IngestDataConstants.TEMP_DB_FOLDER
         self.sensor_data_lib_path = os.path.join(self.vectorstore_path, "sensor_data_lib")
+        self.on_progress = on_progress
+        self.stats = {"stage": "queued", "num_chunks": 0, "num_skipped_chunks": 0, "timings": {}}
+
+    def _report_progress(self):
+        if self.on_progress is not None:
+            self.on_progress(self.stats)
+
+    def _add_timing(self, stage: Text, seconds: float):
+        timings = self.stats["timings"]
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def _stage(self, stage: Text):
+        """Report `stage` as the current one and add its duration to the timings."""
+        self.stats["stage"] = stage
+        self._report_progress()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_timing(stage, time.perf_counter() - start)
 
     def create_vectorstore(self) -> Tuple[Text, Text]:
         try:
@@ -34,39 +73,184 @@ class DataIngestor:
         finally:
             return self.vectorstore_path, self.sensor_data_lib_path
         
+    @staticmethod
+    def _text_splitter() -> TokenTextSplitter:
+        return text_splitter()
+
     def _save_vectorstore(self, raw_documents: List, vectorstore_path: Text, id: str = None):
-        text_splitter = TokenTextSplitter(
-            model_name="gpt-3.5-turbo",
-            chunk_size=IngestDataConstants.CHUNK_SIZE,
-            chunk_overlap=IngestDataConstants.CHUNK_OVERLAP,
-        )
+        with self._stage("splitting"):
+            splitted_documents = split_documents(raw_documents, self._text_splitter())
+        self._save_chunks(splitted_documents, vectorstore_path, id)
+
+    def _save_vectorstore_streaming(self, pages: Iterator[Document], vectorstore_path: Text):
+        """Split, embed and index pages as they are parsed.
 
-        splitted_documents = text_splitter.split_documents(raw_documents)
+        A producer thread parses and splits pages into a bounded queue, so it
+        never runs more than `STREAM_QUEUE_SIZE` chunks ahead of embedding.
+        Every `STREAM_BATCH_SIZE` chunks are written as a segment and become
+        searchable before the rest of the file has been parsed.
+        """
+        chunks: "queue.Queue" = queue.Queue(maxsize=IngestDataConstants.STREAM_QUEUE_SIZE)
+        done = object()
+        stop = threading.Event()
+        errors = []
+
+        def produce():
+            try:
+                text_splitter = self._text_splitter()
+                start = time.perf_counter()
+                for page in pages:
+                    if stop.is_set():
+                        return
+                    page_chunks = split_documents([page], text_splitter)
+                    self._add_timing("parsing", time.perf_counter() - start)
+                    for chunk in page_chunks:
+                        chunks.put(chunk)
+                    start = time.perf_counter()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                chunks.put(done)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        try:
+            batch = []
+            while True:
+                chunk = chunks.get()
+                if chunk is done:
+                    break
+                batch.append(chunk)
+                if len(batch) >= IngestDataConstants.STREAM_BATCH_SIZE:
+                    # The pages before the one of the last chunk are fully indexed after this batch.
+                    self.stats["pages_done"] = batch[-1].metadata.get("page", 0)
+                    self._save_chunks(batch, vectorstore_path)
+                    batch = []
+            if batch:
+                self.stats["pages_done"] = self.stats.get("num_pages", 0)
+                self._save_chunks(batch, vectorstore_path)
+        finally:
+            # Unblock the producer if embedding or indexing failed midway.
+            stop.set()
+            while producer.is_alive():
+                try:
+                    chunks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+        if errors:
+            raise errors[0]
+
+    def _save_chunks(self, splitted_documents: List[Document], vectorstore_path: Text, id: str = None):
         embeddings = openai_embedding_with_backoff()
 
-        if os.path.exists(f"{vectorstore_path}/index.faiss"):
-            vectorstore = FAISS.load_local(vectorstore_path, embeddings=embeddings)
-            if id:
-                vectorstore.add_documents(splitted_documents, ids=[id])
-            else:
-                vectorstore.add_documents(splitted_documents)
+        # Skip chunks this vectorstore already contains, e.g. on re-upload.
+        hashes = [content_hash(embeddings.model, doc.page_content) for doc in splitted_documents]
+        if not id:
+            seen = content_hashes(vectorstore_path)
+            new_documents = []
+            for doc, hash in zip(splitted_documents, hashes):
+                if hash not in seen:
+                    seen.add(hash)
+                    doc.metadata[IngestDataConstants.CONTENT_HASH_KEY] = hash
+                    new_documents.append(doc)
+            self.stats["num_skipped_chunks"] += len(splitted_documents) - len(new_documents)
+            if not new_documents:
+                logging.info(f"All {len(splitted_documents)} chunks already ingested into {vectorstore_path}")
+                self._report_progress()
+                return
+            splitted_documents = new_documents
         else:
-            texts = [doc.page_content for doc in splitted_documents]
-            if id:
-                vectorstore = FAISS.from_texts(texts, embeddings, ids=[id])
-            else:
-                vectorstore = FAISS.from_texts(texts, embeddings)
-        
-        vectorstore.save_local(vectorstore_path)
-        time.sleep(60)
+            for doc in splitted_documents:
+                doc.metadata[IngestDataConstants.SENSOR_DATA_ID_KEY] = id
+
+        with self._stage("embedding"):
+            vectors = embeddings.embed_documents([doc.page_content for doc in splitted_documents])
+
+        # New documents go into their own small segment; the existing index is
+        # never loaded or rewritten here.
+        with self._stage("indexing"):
+            segment = from_embeddings(
+                splitted_documents,
+                vectors,
+                embeddings,
+                index_config={"type": "flat"},
+                ids=[id] if id else None,
+            )
+            append_segment(vectorstore_path, segment)
+        schedule_compaction(vectorstore_path, embeddings)
+
+        self.stats["num_chunks"] += len(splitted_documents)
+        self._report_progress()
         
+    def ingest_files(self, files: List[Tuple[Text, Text]]):
+        """Ingest several `(path, extension)` files at once.
+
+        Parsing and splitting run in a process pool so they use every core.
+        PDFs are parsed `PDF_PAGES_PER_TASK` pages at a time and at most
+        `PARSE_TASKS_IN_FLIGHT` tasks per worker are queued, so only a bounded
+        number of pages is held in memory. Chunks are embedded and indexed
+        here as soon as their task finishes, while the rest is still parsed.
+        """
+        vectorstore_path = self.create_vectorstore()[0]
+        executor = get_executor()
+        pages_per_task = IngestDataConstants.PDF_PAGES_PER_TASK
+        max_in_flight = (os.cpu_count() or 1) * IngestDataConstants.PARSE_TASKS_IN_FLIGHT
+
+        self.stats["files_done"] = 0
+        pending: Dict[Future, int] = {}
+        start = time.perf_counter()
+        try:
+            # Page counts are read in the pool too: pdfium may crash on a bad file.
+            page_counts = {
+                file_index: executor.submit(count_pdf_pages, path)
+                for file_index, (path, extension) in enumerate(files)
+                if extension == "pdf"
+            }
+            tasks = []
+            for file_index, (path, extension) in enumerate(files):
+                if file_index in page_counts:
+                    for page in range(0, max(page_counts[file_index].result(), 1), pages_per_task):
+                        tasks.append((file_index, (path, extension, (page, page + pages_per_task))))
+                else:
+                    tasks.append((file_index, (path, extension, None)))
+            tasks_left = Counter(file_index for file_index, _ in tasks)
+            tasks = iter(tasks)
+
+            while True:
+                for file_index, args in islice(tasks, max_in_flight - len(pending)):
+                    pending[executor.submit(parse_and_split, *args)] = file_index
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_index = pending.pop(future)
+                    splitted_documents = future.result()
+                    self._add_timing("parsing", time.perf_counter() - start)
+                    self._save_chunks(splitted_documents, vectorstore_path)
+                    tasks_left[file_index] -= 1
+                    if not tasks_left[file_index]:
+                        self.stats["files_done"] += 1
+                        self._report_progress()
+                    start = time.perf_counter()
+        except BrokenProcessPool:
+            discard_executor(executor)
+            raise
+        finally:
+            # Do not leave the rest of a failed job queued in the shared pool.
+            for future in pending:
+                future.cancel()
+
     def ingest_pdf(self, pdf_path: Text):
         vectorstore_path = self.create_vectorstore()[0]
 
         loader = PyPDFium2Loader(pdf_path)
-        raw_documents = loader.load()
+        # Lets progress be reported by page while the file is streamed.
+        self.stats["num_pages"] = count_pdf_pages(pdf_path)
 
-        self._save_vectorstore(raw_documents, vectorstore_path)
+        self._save_vectorstore_streaming(loader.lazy_load(), vectorstore_path)
 
     
     def ingest_json(self, json_path: list):
@@ -113,3 +297,58 @@ class DataIngestor:
         raw_documents = loader.load()
 
         self._save_vectorstore(raw_documents, vectorstore_path, id)
+
+    def bulk_load_sensor_data_questions(self, rows: Iterable[dict]) -> int:
+        """Embed sensor questions in large batches and write them as one segment.
+
+        Each row holds the `SensorDataLib` `id` and its `question`; the id is
+        used as the docstore id, so the UUID-to-vector mapping is kept. Rows
+        whose id is already in the vectorstore are skipped, so loading the
+        same table again adds nothing.
+        """
+        vectorstore_path = self.create_vectorstore()[1]
+        embeddings = openai_embedding_with_backoff()
+        batch_size = IngestDataConstants.SENSOR_BULK_BATCH_SIZE
+        start = time.perf_counter()
+
+        seen = docstore_ids(vectorstore_path)
+        num_skipped = 0
+        documents, ids, vectors = [], [], []
+        for row in rows:
+            if row["id"] in seen:
+                num_skipped += 1
+                continue
+            seen.add(row["id"])
+            ids.append(row["id"])
+            documents.append(
+                Document(
+                    page_content=row["question"],
+                    # Same source layout as load_sensor_data_question.
+                    metadata={
+                        "source": os.path.join(vectorstore_path, row["id"], "content.txt"),
+                        IngestDataConstants.SENSOR_DATA_ID_KEY: row["id"],
+                    },
+                )
+            )
+            if len(documents) - len(vectors) >= batch_size:
+                vectors.extend(embeddings.embed_documents([doc.page_content for doc in documents[len(vectors):]]))
+                logging.info(f"Embedded {len(vectors)} sensor questions")
+        vectors.extend(embeddings.embed_documents([doc.page_content for doc in documents[len(vectors):]]))
+
+        if documents:
+            add_token_counts(documents)
+            vectorstore = from_embeddings(
+                documents, vectors, embeddings, index_config=get_index_config(vectorstore_path), ids=ids
+            )
+            append_segment(vectorstore_path, vectorstore)
+            schedule_compaction(vectorstore_path, embeddings)
+
+        elapsed = time.perf_counter() - start
+        metrics.incr("ingest.sensor_questions", len(documents))
+        metrics.incr("ingest.sensor_questions_skipped", num_skipped)
+        logging.info(
+            f"Imported {len(documents)} sensor questions in {elapsed:.1f}s "
+            f"({len(documents) / elapsed if elapsed else 0:.1f} rows/s), "
+            f"skipped {num_skipped} already loaded"
+        )
+        return len(documents)
@@ -1,20 +1,47 @@
-import csv 
-from ai.schemas.db_model import SensorDataLib
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
 from datetime import datetime
+from itertools import islice
+from typing import List, Optional, Tuple
 
-async def db_builder():
-    print("""
-        ------------------------
-        START
-        ------------------------
-    """)
-    with open('files/sensordata.csv', 'r', encoding='utf-8') as file:
-        csvreader = csv.reader(file)
-        for row in csvreader:
-            try:
-                time = datetime.strptime(row[7], '%Y-%m-%d %H:%M:%S')
-            except:
-                time = datetime.strptime(row[7], '%Y-%m-%d')
+from beanie.odm.utils.dump import get_dict
+from fastapi.concurrency import run_in_threadpool
+from pymongo import ReplaceOne
+
+from ai.core.constants import IngestDataConstants
+from ai.core.metrics import metrics
+from ai.core.sensor_store import sensor_store
+from ai.schemas.db_model import SensorDataLib
+
+
+# Formats of the time column; only tried when `fromisoformat` rejects a value.
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d")
+
+
+def _parse_time(value: str) -> datetime:
+    # fromisoformat is much faster than strptime, but before Python 3.11 it
+    # rejects dates and hours that are not zero-padded, e.g. "2023-1-5 7:00:00".
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format)
+        except ValueError:
+            pass
+    raise ValueError(f"time {value!r} does not match any of {TIME_FORMATS}")
+
+
+def _parse_batch(rows: List[List[str]]) -> Tuple[List[ReplaceOne], int]:
+    """Validate a batch of CSV rows into upserts keyed on the row id."""
+    operations, num_invalid = [], 0
+    for row in rows:
+        try:
             sensor_data = SensorDataLib(
                 id=row[0],
                 question=row[1],
@@ -23,11 +50,109 @@ async def db_builder():
                 location=row[4],
                 value=float(row[5]),
                 unit=row[6],
-                time=time
+                time=_parse_time(row[7]),
             )
-            await sensor_data.create()
+        except (ValueError, IndexError) as e:
+            num_invalid += 1
+            logging.warning(f"Skipping invalid sensor data row {row[:1]}: {e}")
+            continue
+        document = get_dict(sensor_data, to_db=True)
+        operations.append(ReplaceOne({"_id": document["_id"]}, document, upsert=True))
+    return operations, num_invalid
+
+
+def _checkpoint_path(csv_path: str) -> str:
+    return f"{csv_path}.progress"
+
+
+def _load_checkpoint(csv_path: str) -> int:
+    """Rows already written by a previous run over the same file."""
+    try:
+        with open(_checkpoint_path(csv_path)) as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return 0
+    stat = os.stat(csv_path)
+    if checkpoint.get("size") != stat.st_size or checkpoint.get("mtime_ns") != stat.st_mtime_ns:
+        return 0
+    return checkpoint["rows_done"]
+
+
+def _save_checkpoint(csv_path: str, rows_done: int):
+    stat = os.stat(csv_path)
+    tmp_path = f"{_checkpoint_path(csv_path)}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "rows_done": rows_done}, f)
+    os.replace(tmp_path, _checkpoint_path(csv_path))
+
+
+async def db_builder(csv_path: str = IngestDataConstants.SENSOR_DATA_CSV, resume: bool = True) -> dict:
+    """Load the sensor data CSV into SensorDataLib.
+
+    The file is streamed in batches that are validated in a worker thread
+    and written with unordered bulk upserts keyed on the row id, so running
+    it again updates rows instead of duplicating them. Parsing the next batch
+    overlaps with writing the previous one. Progress is checkpointed after
+    every batch; an interrupted run over an unchanged file resumes where it
+    stopped.
+    """
+    print("""
+        ------------------------
+        START
+        ------------------------
+    """)
+    collection = SensorDataLib.get_motor_collection()
+    batch_size = IngestDataConstants.SENSOR_DB_BATCH_SIZE
+    rows_done = _load_checkpoint(csv_path) if resume else 0
+    if rows_done:
+        logging.info(f"Resuming {csv_path} after {rows_done} rows")
+
+    start = time.perf_counter()
+    num_written, num_invalid = 0, 0
+    pending_write: Optional[asyncio.Task] = None
+
+    async def write_batch(operations: List[ReplaceOne], rows_done: int):
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+        await run_in_threadpool(_save_checkpoint, csv_path, rows_done)
+
+    with open(csv_path, 'r', encoding='utf-8') as file:
+        csvreader = csv.reader(file)
+        # Skipping still parses the rows, which is cheap next to writing them.
+        for _ in islice(csvreader, rows_done):
+            pass
+
+        while True:
+            rows = list(islice(csvreader, batch_size))
+            if not rows:
+                break
+            operations, batch_invalid = await run_in_threadpool(_parse_batch, rows)
+            num_invalid += batch_invalid
+
+            if pending_write is not None:
+                await pending_write
+            rows_done += len(rows)
+            num_written += len(operations)
+            pending_write = asyncio.create_task(write_batch(operations, rows_done))
+
+        if pending_write is not None:
+            await pending_write
+
+    if os.path.exists(_checkpoint_path(csv_path)):
+        os.remove(_checkpoint_path(csv_path))
+
+    elapsed = time.perf_counter() - start
+    metrics.incr("db_builder.rows", num_written)
+    metrics.incr("db_builder.invalid_rows", num_invalid)
+    logging.info(
+        f"Loaded {num_written} sensor data rows ({num_invalid} invalid) in {elapsed:.1f}s "
+        f"({num_written / elapsed if elapsed else 0:.0f} rows/s)"
+    )
+
+    await sensor_store.publish()
     print("""
         ------------------------
         SCRIPT DONE
         ------------------------
     """)
+    return {"rows": num_written, "invalid_rows": num_invalid, "seconds": elapsed}
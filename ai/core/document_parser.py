@@ -0,0 +1,117 @@
+"""
+CPU-bound parsing and splitting, kept free of app state so it can run in
+worker processes.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Text, Tuple
+
+import tiktoken
+from langchain.docstore.document import Document
+from langchain.document_loaders import PyPDFium2Loader
+from langchain.text_splitter import TokenTextSplitter
+from llama_index import download_loader
+
+from ai.core.constants import IngestDataConstants
+
+
+def text_splitter() -> TokenTextSplitter:
+    return TokenTextSplitter(
+        model_name=IngestDataConstants.TOKENIZER_MODEL,
+        chunk_size=IngestDataConstants.CHUNK_SIZE,
+        chunk_overlap=IngestDataConstants.CHUNK_OVERLAP,
+    )
+
+
+def add_token_counts(documents: List[Document]) -> List[Document]:
+    """Store each document's token count in its metadata.
+
+    The count lets the retrieval chain fit documents into the prompt without
+    tokenizing them again on every request.
+    """
+    encoding = tiktoken.encoding_for_model(IngestDataConstants.TOKENIZER_MODEL)
+    token_ids = encoding.encode_batch([document.page_content for document in documents], disallowed_special=())
+    for document, ids in zip(documents, token_ids):
+        document.metadata[IngestDataConstants.NUM_TOKENS_KEY] = len(ids)
+    return documents
+
+
+def split_documents(documents: List[Document], splitter: Optional[TokenTextSplitter] = None) -> List[Document]:
+    """Split documents into chunks, with their token counts, see `add_token_counts`."""
+    return add_token_counts((splitter or text_splitter()).split_documents(documents))
+
+
+def load_pdf_pages(file_path: Text, start: int, stop: int) -> List[Document]:
+    """Pages `start` to `stop` of a PDF, as `PyPDFium2Loader` would load them."""
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(file_path, autoclose=True)
+    try:
+        documents = []
+        for page_number in range(start, min(stop, len(pdf))):
+            page = pdf[page_number]
+            text_page = page.get_textpage()
+            content = text_page.get_text_range()
+            text_page.close()
+            page.close()
+            documents.append(Document(page_content=content, metadata={"source": file_path, "page": page_number}))
+        return documents
+    finally:
+        pdf.close()
+
+
+def count_pdf_pages(file_path: Text) -> int:
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(file_path, autoclose=True)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def load_documents(file_path: Text, extension: Text, pages: Optional[Tuple[int, int]] = None) -> List[Document]:
+    """Documents of a file, or only of pages `[start, stop)` of a PDF."""
+    if extension == "pdf":
+        if pages is not None:
+            return load_pdf_pages(file_path, *pages)
+        return PyPDFium2Loader(file_path).load()
+    if extension == "json":
+        JSONReader = download_loader("JSONReader")
+        return [d.to_langchain_format() for d in JSONReader().load_data(file_path)]
+    raise ValueError(f"Unsupported file extension {extension}")
+
+
+def parse_and_split(file_path: Text, extension: Text, pages: Optional[Tuple[int, int]] = None) -> List[Document]:
+    return split_documents(load_documents(file_path, extension, pages))
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Process pool sized to the machine, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawn rather than fork: the server process runs threads.
+            _executor = ProcessPoolExecutor(
+                max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def discard_executor(executor: ProcessPoolExecutor):
+    """Drop a pool broken by a crashed worker, so the next call creates a new one.
+
+    A `ProcessPoolExecutor` whose worker died, e.g. pdfium crashing on a bad
+    file, raises `BrokenProcessPool` for every later task.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
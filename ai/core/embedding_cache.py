@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Text
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from ai.core.metrics import metrics
+from ai.core.text_normalization import normalize_text
+
+
+class EmbeddingCache:
+    """Query embedding cache keyed by embedding model and normalized text.
+
+    Entries live in a bounded in-memory LRU. When `persist_path` is set, they
+    are also written to a SQLite file that survives restarts and is consulted
+    on memory misses.
+    """
+
+    def __init__(self, max_size: int = 10000, persist_path: Optional[Text] = None):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Text, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    def key(self, model: Text, text: Text) -> Text:
+        # Normalized like the response and answer cache keys.
+        return f"{model}\x00{normalize_text(text)}"
+
+    def _remember(self, key: Text, vector: List[float]):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, model: Text, text: Text) -> Optional[List[float]]:
+        key = self.key(model, text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                metrics.incr("embedding_cache.memory_hits")
+                return vector
+
+            if self._db is not None:
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype="float32").tolist()
+                    self._remember(key, vector)
+                    metrics.incr("embedding_cache.disk_hits")
+                    return vector
+
+        metrics.incr("embedding_cache.misses")
+        return None
+
+    def set(self, model: Text, text: Text, vector: List[float]):
+        key = self.key(model, text)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    (key, np.asarray(vector, dtype="float32").tobytes()),
+                )
+                self._db.commit()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "max_size": self.max_size, "persistent": self._db is not None}
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that answers repeated queries from an `EmbeddingCache`."""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get(self.model, text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.set(self.model, text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self.cache.get(self.model, text)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self.cache.set(self.model, text, vector)
+        return vector
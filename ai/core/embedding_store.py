@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Text
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from ai.core.metrics import metrics
+
+# SQLite limits the number of bound parameters per statement.
+QUERY_BATCH_SIZE = 500
+
+
+def content_hash(model: Text, text: Text) -> Text:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Persistent content-addressed store of document embeddings.
+
+    Vectors are keyed by the hash of the embedding model and the chunk text,
+    so unchanged chunks are never sent to the API twice.
+    """
+
+    def __init__(self, path: Text):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._db.commit()
+
+    def _select(self, sql: Text, keys: List[Text], *params) -> list:
+        rows = []
+        with self._lock:
+            for i in range(0, len(keys), QUERY_BATCH_SIZE):
+                batch = keys[i : i + QUERY_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows.extend(self._db.execute(sql.format(placeholders=placeholders), (*params, *batch)).fetchall())
+        return rows
+
+    def get_many(self, hashes: List[Text]) -> Dict[Text, List[float]]:
+        rows = self._select("SELECT hash, vector FROM embeddings WHERE hash IN ({placeholders})", hashes)
+        return {hash: np.frombuffer(vector, dtype="float32").tolist() for hash, vector in rows}
+
+    def put_many(self, vectors: Dict[Text, List[float]]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)",
+                [(hash, np.asarray(vector, dtype="float32").tobytes()) for hash, vector in vectors.items()],
+            )
+            self._db.commit()
+
+
+class ContentAddressedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends chunks missing from an `EmbeddingStore`."""
+
+    def __init__(self, embeddings: Embeddings, store: EmbeddingStore):
+        self.embeddings = embeddings
+        self.store = store
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+
+    def stored_vectors(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Vectors of `texts` already in the store, None where missing; never calls the API."""
+        hashes = [content_hash(self.model, text) for text in texts]
+        stored = self.store.get_many(list(set(hashes)))
+        return [stored.get(hash) for hash in hashes]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [content_hash(self.model, text) for text in texts]
+        stored = self.store.get_many(list(set(hashes)))
+
+        missing = {hash: text for hash, text in zip(hashes, texts) if hash not in stored}
+        metrics.incr("embedding_store.hits", len(texts) - len(missing))
+        metrics.incr("embedding_store.misses", len(missing))
+        if missing:
+            new_vectors = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self.store.put_many(new_vectors)
+            stored.update(new_vectors)
+
+        return [stored[hash] for hash in hashes]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.get_event_loop().run_in_executor(None, self.embed_documents, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
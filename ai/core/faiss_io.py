@@ -0,0 +1,164 @@
+import logging
+import os
+import pickle
+import uuid
+from typing import List, Optional, Text
+
+import faiss
+import numpy as np
+import yaml
+from langchain.docstore.document import Document
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores import FAISS
+
+from ai.core.constants import BaseConstants, IngestDataConstants
+
+LOAD_MODE_MEMORY = "memory"
+LOAD_MODE_MMAP = "mmap"
+MMAP_INDEX_FILE = "index.mmap.faiss"
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+# FAISS warns below 39 training points per centroid.
+MIN_POINTS_PER_CENTROID = 39
+
+
+def get_index_config(vectorstore_path: Text) -> dict:
+    """Index settings of the vectorstore stored at `vectorstore_path`."""
+    with open(os.path.join(BaseConstants.ROOT_PATH, "configs/vectorstores/config.yaml")) as f:
+        configs = yaml.safe_load(f)
+
+    vectorstore_path = os.path.normpath(vectorstore_path)
+    for config in configs.values():
+        path = os.path.normpath(os.path.join(IngestDataConstants.TEMP_DB_FOLDER, config["path"]))
+        if path == vectorstore_path:
+            return config.get("index", {})
+    return {"type": "flat"}
+
+
+def build_index(vectors: np.ndarray, index_config: dict) -> faiss.Index:
+    """Build and train an L2 index of the configured type over `vectors`.
+
+    Falls back to an exact flat index when there are too few vectors to
+    train the requested quantizer.
+    """
+    index_type = index_config.get("type", "flat")
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"index type {index_type} not allowed. Valid values are: {INDEX_TYPES}")
+
+    n, d = vectors.shape
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, index_config.get("M", 32))
+        index.hnsw.efConstruction = index_config.get("efConstruction", 40)
+        index.hnsw.efSearch = index_config.get("efSearch", 64)
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = min(index_config.get("nlist", max(1, int(4 * np.sqrt(n)))), n // MIN_POINTS_PER_CENTROID)
+        nbits = index_config.get("nbits", 8)
+        if nlist < 1 or (index_type == "ivf_pq" and n < 2 ** nbits):
+            logging.warning(f"Not enough vectors ({n}) to train {index_type}, building a flat index")
+            index = faiss.IndexFlatL2(d)
+        else:
+            quantizer = faiss.IndexFlatL2(d)
+            if index_type == "ivf_flat":
+                index = faiss.IndexIVFFlat(quantizer, d, nlist)
+            else:
+                index = faiss.IndexIVFPQ(quantizer, d, nlist, index_config.get("m", 64), nbits)
+            index.train(vectors)
+            index.nprobe = min(index_config.get("nprobe", 8), nlist)
+    else:
+        index = faiss.IndexFlatL2(d)
+
+    if n:
+        index.add(vectors)
+    return index
+
+
+def from_embeddings(
+    documents: List[Document],
+    vectors: List[List[float]],
+    embeddings: Embeddings,
+    index_config: dict,
+    ids: Optional[List[str]] = None,
+) -> FAISS:
+    """Create a FAISS vectorstore from precomputed vectors with the configured index."""
+    ids = ids or [str(uuid.uuid4()) for _ in documents]
+    index = build_index(np.asarray(vectors, dtype="float32"), index_config)
+    docstore = InMemoryDocstore(
+        {
+            id: Document(page_content=doc.page_content, metadata=doc.metadata)
+            for id, doc in zip(ids, documents)
+        }
+    )
+    return FAISS(embeddings.embed_query, index, docstore, dict(enumerate(ids)))
+
+
+def _to_mmap_layout(index: faiss.Index) -> faiss.Index:
+    """Return an index whose vectors live in inverted lists FAISS can mmap.
+
+    Flat indexes are always read into the heap, so they are rewritten as a
+    single-list IVF-Flat index, which scans the same vectors and returns the
+    same distances while keeping the codes in an mmap-able section of the file.
+    """
+    if not isinstance(index, faiss.IndexFlat):
+        # IVF indexes are mmap-able as they are; graph indexes cannot be mapped.
+        return index
+
+    d, metric = index.d, index.metric_type
+    quantizer = faiss.IndexFlat(d, metric)
+    quantizer.add(np.zeros((1, d), dtype="float32"))
+    ivf_index = faiss.IndexIVFFlat(quantizer, d, 1, metric)
+    ivf_index.is_trained = True
+    if index.ntotal:
+        ivf_index.add(index.reconstruct_n(0, index.ntotal))
+    return ivf_index
+
+
+def has_mmap_index(folder_path: Text) -> bool:
+    """Whether the mmap-able copy of index.faiss exists and is up to date."""
+    mmap_path = os.path.join(folder_path, MMAP_INDEX_FILE)
+    source_path = os.path.join(folder_path, "index.faiss")
+    return os.path.exists(mmap_path) and os.stat(mmap_path).st_mtime_ns >= os.stat(source_path).st_mtime_ns
+
+
+def write_mmap_index(folder_path: Text) -> Text:
+    """Write the mmap-able copy of index.faiss when missing or stale."""
+    mmap_path = os.path.join(folder_path, MMAP_INDEX_FILE)
+    if has_mmap_index(folder_path):
+        return mmap_path
+
+    index = _to_mmap_layout(faiss.read_index(os.path.join(folder_path, "index.faiss")))
+    tmp_path = f"{mmap_path}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, mmap_path)
+    return mmap_path
+
+
+def load_faiss(
+    folder_path: Text, embeddings: Embeddings, mode: Text = LOAD_MODE_MEMORY, create_mmap_index: bool = True
+) -> FAISS:
+    """Load a FAISS vectorstore saved with `FAISS.save_local`.
+
+    In mmap mode the vectors are memory-mapped read-only, so the OS page cache
+    is shared by every worker process that opens the same files. Without
+    `create_mmap_index`, used for folders that must not change, a folder
+    lacking the mmap-able copy is read into memory instead.
+    """
+    if mode != LOAD_MODE_MMAP:
+        return FAISS.load_local(folder_path=folder_path, embeddings=embeddings)
+
+    if not create_mmap_index and not has_mmap_index(folder_path):
+        logging.warning(f"{folder_path} has no {MMAP_INDEX_FILE}, loading it into memory")
+        return FAISS.load_local(folder_path=folder_path, embeddings=embeddings)
+
+    try:
+        mmap_path = write_mmap_index(folder_path)
+        index = faiss.read_index(mmap_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError as e:
+        logging.warning(f"Cannot memory-map {folder_path}, falling back to in-memory load: {e}")
+        return FAISS.load_local(folder_path=folder_path, embeddings=embeddings)
+
+    with open(os.path.join(folder_path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    return FAISS(embeddings.embed_query, index, docstore, index_to_docstore_id)
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import List, Optional
+from uuid import UUID, uuid4
+
+from fastapi.concurrency import run_in_threadpool
+from pymongo import ASCENDING, ReturnDocument
+
+from ai.core.constants import IngestDataConstants
+from ai.core.data_ingestor import DataIngestor
+from ai.core.metrics import metrics
+from ai.schemas.db_model import IngestJob, IngestJobFile, IngestJobStatus
+
+
+class IngestJobQueue:
+    """Ingestion jobs persisted in MongoDB and processed by a pool of workers.
+
+    Every server process runs its own workers, and they all take jobs from
+    the collection. A worker claims a job by switching it from pending to
+    running under a lease in one atomic update, so each job is processed by
+    exactly one worker. The lease is renewed while the job runs; a running
+    job whose lease has expired was left by a worker that died, and is
+    claimed again.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self, num_workers: int):
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(num_workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    async def enqueue(self, files: List[IngestJobFile], lang: str, job_id: Optional[UUID] = None) -> IngestJob:
+        job = IngestJob(files=files, lang=lang, content_hashes=sorted({file.sha256 for file in files if file.sha256}))
+        if job_id is not None:
+            job.id = job_id
+        await job.create()
+        if self._wakeup is not None:
+            self._wakeup.set()
+        metrics.incr("ingest_jobs.enqueued")
+        return job
+
+    @staticmethod
+    def upload_folder(job_id: UUID) -> str:
+        """Folder of the job's uploaded files, removed once the job has finished."""
+        return os.path.join(IngestDataConstants.TEMP_UPLOADED_FOLDER, str(job_id))
+
+    @staticmethod
+    async def find_by_hash(sha256: str) -> Optional[IngestJob]:
+        """A job that ingested, or is ingesting, a file with this content hash."""
+        return await IngestJob.find_one(
+            {
+                "$or": [
+                    {"content_hashes": sha256},
+                    {"files.sha256": sha256, "status": {"$ne": IngestJobStatus.failed.value}},
+                ]
+            }
+        )
+
+    async def claim(self) -> Optional[IngestJob]:
+        """Take the oldest pending job, or a running one whose lease expired."""
+        now = datetime.now()
+        raw_job = await IngestJob.get_motor_collection().find_one_and_update(
+            {
+                "$or": [
+                    {"status": IngestJobStatus.pending.value},
+                    {"status": IngestJobStatus.running.value, "lease_until": {"$lt": now}},
+                    # Left running by a worker from before leases existed.
+                    {"status": IngestJobStatus.running.value, "lease_until": None},
+                ]
+            },
+            {
+                "$set": {
+                    "status": IngestJobStatus.running.value,
+                    "worker": self.worker_id,
+                    "lease_until": now + timedelta(seconds=IngestDataConstants.INGEST_JOB_LEASE_SECONDS),
+                    "started_at": now,
+                }
+            },
+            sort=[("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        return IngestJob.parse_obj(raw_job) if raw_job is not None else None
+
+    async def _update(self, job: IngestJob, fields: dict) -> bool:
+        """Set `fields` on the job unless another worker took it over.
+
+        Only the given fields are written, so a progress update never
+        overwrites the lease or the worker; returns whether the job still
+        belongs to this worker.
+        """
+        result = await IngestJob.find_one(IngestJob.id == job.id, IngestJob.worker == self.worker_id).update(
+            {"$set": fields}
+        )
+        return result.matched_count > 0
+
+    async def _renew_lease(self, job: IngestJob, lease_lost: threading.Event):
+        while True:
+            await asyncio.sleep(IngestDataConstants.INGEST_JOB_LEASE_SECONDS / 4)
+            job.lease_until = datetime.now() + timedelta(seconds=IngestDataConstants.INGEST_JOB_LEASE_SECONDS)
+            if not await self._update(job, {"lease_until": job.lease_until}):
+                lease_lost.set()
+                return
+
+    async def _work(self):
+        while True:
+            # Cleared before claiming, so an enqueue during the claim is not missed.
+            self._wakeup.clear()
+            try:
+                job = await self.claim()
+            except Exception as e:
+                logging.exception(e)
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), IngestDataConstants.INGEST_JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(job)
+            except Exception as e:
+                logging.exception(e)
+
+    async def _process(self, job: IngestJob):
+        """Ingest the files of a claimed job while renewing its lease.
+
+        Once the lease is lost, e.g. after this worker stalled and another
+        one reclaimed the job, ingestion stops at its next progress report
+        and nothing more is written to the job.
+        """
+        loop = asyncio.get_running_loop()
+        lease_lost = threading.Event()
+        lease = asyncio.create_task(self._renew_lease(job, lease_lost))
+        # Progress is written in the order it was reported.
+        progress_lock = asyncio.Lock()
+        progress_writes: List[Future] = []
+
+        async def write_progress(fields: dict):
+            async with progress_lock:
+                if not lease_lost.is_set() and not await self._update(job, fields):
+                    lease_lost.set()
+
+        def on_progress(stats: dict):
+            if lease_lost.is_set():
+                raise RuntimeError(f"Ingest job {job.id} was taken over by another worker")
+            files_done = stats.get("files_done", job.files_done)
+            # Pages of the file being ingested, for single-file jobs.
+            file_progress = stats.get("pages_done", 0) / stats["num_pages"] if stats.get("num_pages") else 0
+            fields = {
+                "stage": stats["stage"],
+                "files_done": files_done,
+                "progress": min(files_done + file_progress, len(job.files)) / len(job.files),
+                "num_chunks": stats["num_chunks"],
+                "num_skipped_chunks": stats["num_skipped_chunks"],
+                "timings": dict(stats["timings"]),
+            }
+            # Called from the ingestion thread; the write runs on the event loop.
+            progress_writes.append(asyncio.run_coroutine_threadsafe(write_progress(fields), loop))
+
+        try:
+            try:
+                data_ingestor = DataIngestor(lang=job.lang, on_progress=on_progress)
+                data_ingestor_fn = {
+                    "pdf": data_ingestor.ingest_pdf,
+                    "json": data_ingestor.ingest_json,
+                }
+                if len(job.files) > 1:
+                    # Parse every file in the process pool. When a job is resumed,
+                    # chunks of files it already ingested are skipped by hash.
+                    await run_in_threadpool(
+                        data_ingestor.ingest_files,
+                        [(file.path, file.extension) for file in job.files],
+                    )
+                else:
+                    for file in job.files[job.files_done:]:
+                        await run_in_threadpool(data_ingestor_fn[file.extension], file.path)
+                        job.files_done += 1
+                        job.progress = job.files_done / len(job.files)
+                        await write_progress({"files_done": job.files_done, "progress": job.progress})
+                        if lease_lost.is_set():
+                            break
+
+                final = {"status": IngestJobStatus.completed.value, "stage": "completed"}
+            except Exception as e:
+                if not lease_lost.is_set():
+                    logging.exception(e)
+                final = {
+                    "status": IngestJobStatus.failed.value,
+                    "error": str(e),
+                    # Let the same files be uploaded again.
+                    "content_hashes": [],
+                }
+
+            # Progress still being written must not land after the final state.
+            await asyncio.gather(*(asyncio.wrap_future(write) for write in progress_writes), return_exceptions=True)
+            if lease_lost.is_set() or not await self._update(
+                job, dict(final, finished_at=datetime.now(), lease_until=None)
+            ):
+                logging.warning(f"Ingest job {job.id} was taken over by another worker, leaving it to them")
+                metrics.incr("ingest_jobs.leases_lost")
+                return
+        finally:
+            lease.cancel()
+
+        metrics.incr(f"ingest_jobs.{final['status']}")
+        shutil.rmtree(self.upload_folder(job.id), ignore_errors=True)
+
+
+ingest_job_queue = IngestJobQueue()
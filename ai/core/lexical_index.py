@@ -0,0 +1,93 @@
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Text, Tuple
+
+from langchain.docstore.document import Document
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def fold(text: Text) -> Text:
+    """Lowercase and strip diacritics, so "Độ mặn" and "do man" match.
+
+    "đ" is a separate letter rather than "d" with a combining mark, so NFD
+    does not decompose it and it is replaced explicitly.
+    """
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(char for char in text if unicodedata.category(char) != "Mn").casefold()
+
+
+def tokenize(text: Text) -> List[Text]:
+    return TOKEN_PATTERN.findall(fold(text))
+
+
+class LexicalIndex:
+    """In-memory BM25 inverted index over short texts such as questions.
+
+    Candidates are ranked with BM25. Because BM25 scores are unbounded, each
+    hit also gets a confidence between 0 and 1: the IDF-weighted share of
+    the query terms found in the document, times the share of the document
+    terms found in the query. A near-verbatim copy of an indexed question
+    scores close to 1, a question sharing a few words stays well below.
+    """
+
+    def __init__(self, documents: List[Document], k1: float = 1.5, b: float = 0.75):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[Text, List[Tuple[int, int]]] = defaultdict(list)
+        self._terms: List[Counter] = []
+        for position, document in enumerate(documents):
+            terms = Counter(tokenize(document.page_content))
+            self._terms.append(terms)
+            for term, frequency in terms.items():
+                self._postings[term].append((position, frequency))
+
+        self._lengths = [sum(terms.values()) for terms in self._terms]
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+        num_documents = len(documents)
+        self._idf = {
+            term: math.log(1 + (num_documents - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+        # Unknown query terms weigh as much as the rarest indexed term.
+        self._max_idf = max(self._idf.values(), default=0.0)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _bm25(self, query_terms: Iterable[Text]) -> Dict[int, float]:
+        scores: Dict[int, float] = defaultdict(float)
+        for term in query_terms:
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for position, frequency in self._postings[term]:
+                length_norm = 1 - self.b + self.b * self._lengths[position] / self._avg_length
+                scores[position] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+        return scores
+
+    def _confidence(self, query_terms: set, position: int) -> float:
+        document_terms = set(self._terms[position])
+        query_weight = sum(self._idf.get(term, self._max_idf) for term in query_terms)
+        document_weight = sum(self._idf[term] for term in document_terms)
+        shared_weight = sum(self._idf[term] for term in query_terms & document_terms)
+        if not query_weight or not document_weight:
+            return 0.0
+        return (shared_weight / query_weight) * (shared_weight / document_weight)
+
+    def search(self, query: Text, k: int = 4) -> List[Tuple[Document, float]]:
+        """Top `k` documents by BM25, with their confidence."""
+        query_terms = set(tokenize(query))
+        if not query_terms or not self.documents:
+            return []
+        scores = self._bm25(query_terms)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [(self.documents[position], self._confidence(query_terms, position)) for position in ranked]
+
+    def match(self, query: Text, k: int = 4, threshold: float = 0.9) -> List[Tuple[Document, float]]:
+        """Hits whose confidence reaches `threshold`, best first."""
+        hits = [(document, score) for document, score in self.search(query, k) if score >= threshold]
+        return sorted(hits, key=lambda hit: hit[1], reverse=True)
@@ -0,0 +1,68 @@
+import threading
+from collections import defaultdict, deque
+from typing import Callable, Deque, Dict, Optional
+
+
+class Metrics:
+    """Process-local counters and timings exposed through the metrics route."""
+
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._timings: Dict[str, Deque[float]] = {}
+        self._providers: Dict[str, Callable[[], dict]] = {}
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            samples = self._timings.get(name)
+            if samples is None:
+                samples = self._timings[name] = deque(maxlen=self.max_samples)
+            samples.append(seconds)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def average(self, name: str) -> Optional[float]:
+        with self._lock:
+            samples = self._timings.get(name)
+            return sum(samples) / len(samples) if samples else None
+
+    def register_provider(self, name: str, provider: Callable[[], dict]):
+        """Register a callable whose result is embedded in every snapshot."""
+        self._providers[name] = provider
+
+    @staticmethod
+    def _percentile(samples: list, percentile: float) -> float:
+        index = min(len(samples) - 1, int(round(percentile * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {name: sorted(samples) for name, samples in self._timings.items()}
+
+        result = {
+            "counters": counters,
+            "timings": {
+                name: {
+                    "count": len(samples),
+                    "avg": sum(samples) / len(samples),
+                    "p50": self._percentile(samples, 0.5),
+                    "p99": self._percentile(samples, 0.99),
+                }
+                for name, samples in timings.items()
+                if samples
+            },
+        }
+        for name, provider in self._providers.items():
+            result[name] = provider()
+        return result
+
+
+metrics = Metrics()
@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Iterator, List, Text, Tuple
+
+import tiktoken
+from langchain.embeddings.base import Embeddings
+
+from ai.core.metrics import metrics
+
+
+class TokenBucket:
+    """Token bucket refilled continuously up to `capacity`."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.available = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` from the bucket and return how long to wait before using it.
+
+        The bucket may go negative, which makes later callers queue behind
+        this reservation instead of starving it.
+        """
+        self._refill()
+        self.available -= amount
+        if self.available >= 0:
+            return 0.0
+        return -self.available / self.refill_per_second
+
+
+QUERIES = "queries"
+DOCUMENTS = "documents"
+
+
+class EmbeddingRateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for the embeddings API.
+
+    One instance is shared by everything in the process that calls the API,
+    from worker threads (`acquire`) as well as from the event loop
+    (`aacquire`). A `query_share` of both limits is reserved for query
+    embeddings in buckets of their own, so a chat request never queues
+    behind an ingestion batch.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, query_share: float = 0.1):
+        self.buckets: Dict[Text, Tuple[TokenBucket, TokenBucket]] = {}
+        for kind, share in ((QUERIES, query_share), (DOCUMENTS, 1 - query_share)):
+            requests, tokens = max(1.0, requests_per_minute * share), max(1.0, tokens_per_minute * share)
+            self.buckets[kind] = (TokenBucket(requests, requests / 60), TokenBucket(tokens, tokens / 60))
+        self._lock = threading.Lock()
+
+    def max_tokens(self, kind: Text = DOCUMENTS) -> int:
+        """Most tokens a single request of `kind` can reserve without waiting."""
+        return int(self.buckets[kind][1].capacity)
+
+    def _reserve(self, tokens: int, kind: Text) -> float:
+        requests_bucket, tokens_bucket = self.buckets[kind]
+        with self._lock:
+            wait = max(requests_bucket.reserve(1), tokens_bucket.reserve(tokens))
+        metrics.incr(f"embedding_rate_limiter.{kind}.requests")
+        metrics.incr(f"embedding_rate_limiter.{kind}.tokens", tokens)
+        metrics.observe(f"embedding_rate_limiter.{kind}.wait_seconds", wait)
+        return wait
+
+    def acquire(self, tokens: int, kind: Text = DOCUMENTS):
+        wait = self._reserve(tokens, kind)
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int, kind: Text = DOCUMENTS):
+        wait = self._reserve(tokens, kind)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        stats = {}
+        with self._lock:
+            for kind, (requests_bucket, tokens_bucket) in self.buckets.items():
+                requests_bucket._refill()
+                tokens_bucket._refill()
+                stats[f"{kind}_available_requests"] = int(requests_bucket.available)
+                stats[f"{kind}_available_tokens"] = int(tokens_bucket.available)
+        return stats
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """Embeddings wrapper sending each API request through an `EmbeddingRateLimiter`.
+
+    Documents are sent in batches of at most `batch_size` texts that also fit
+    in the documents' tokens-per-minute share, so one batch never reserves
+    more than a minute of budget.
+    """
+
+    def __init__(self, embeddings: Embeddings, rate_limiter: EmbeddingRateLimiter, batch_size: int):
+        self.embeddings = embeddings
+        self.rate_limiter = rate_limiter
+        self.batch_size = batch_size
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    def _count_tokens(self, texts: List[Text]) -> int:
+        return sum(len(tokens) for tokens in self.encoding.encode_batch(texts, disallowed_special=()))
+
+    def _batches(self, texts: List[Text]) -> Iterator[Tuple[List[Text], int]]:
+        """Consecutive batches of `texts` with their token counts."""
+        max_tokens = self.rate_limiter.max_tokens(DOCUMENTS)
+        token_counts = [len(tokens) for tokens in self.encoding.encode_batch(texts, disallowed_special=())]
+        batch, batch_tokens = [], 0
+        for text, num_tokens in zip(texts, token_counts):
+            if batch and (len(batch) >= self.batch_size or batch_tokens + num_tokens > max_tokens):
+                yield batch, batch_tokens
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += num_tokens
+        if batch:
+            yield batch, batch_tokens
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for batch, num_tokens in self._batches(texts):
+            self.rate_limiter.acquire(num_tokens, DOCUMENTS)
+            vectors.extend(self.embeddings.embed_documents(batch))
+        return vectors
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for batch, num_tokens in self._batches(texts):
+            await self.rate_limiter.aacquire(num_tokens, DOCUMENTS)
+            vectors.extend(await self.embeddings.aembed_documents(batch))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        self.rate_limiter.acquire(self._count_tokens([text]), QUERIES)
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await self.rate_limiter.aacquire(self._count_tokens([text]), QUERIES)
+        return await self.embeddings.aembed_query(text)
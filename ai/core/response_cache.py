@@ -0,0 +1,79 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Text, Tuple
+
+from ai.core.metrics import metrics
+from ai.core.text_normalization import normalize_text
+
+
+def fingerprint(
+    question: Text,
+    chat_history: List[Tuple[Text, Text]],
+    language: Optional[Text],
+    prompt_version: Text,
+    index_versions: Any,
+    named_days: Any = (),
+) -> Text:
+    """Key of a request: everything the answer depends on, normalized.
+
+    `named_days` are the days the question refers to, resolved, so that a
+    question about "today" gets a new key every day.
+    """
+    payload = [
+        normalize_text(question),
+        [[normalize_text(message) for message in turn] for turn in chat_history or []],
+        language,
+        prompt_version,
+        repr(index_versions),
+        repr(named_days),
+    ]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Exact-match answer cache with a TTL and LRU eviction."""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Text, Tuple[float, Text]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Text) -> Optional[Text]:
+        if not self.max_size:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                metrics.incr("response_cache.expired")
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        metrics.incr("response_cache.hits" if entry is not None else "response_cache.misses")
+        return entry[1] if entry is not None else None
+
+    def set(self, key: Text, answer: Text):
+        if not self.max_size or not answer:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        hits = metrics.counter("response_cache.hits")
+        misses = metrics.counter("response_cache.misses")
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hit_ratio": hits / (hits + misses) if hits + misses else None,
+        }
@@ -0,0 +1,505 @@
+"""
+Versioned, append-only vectorstore layout.
+
+    <root>/CURRENT                        name of the current manifest
+    <root>/manifests/<version>.json       base snapshot and segments of a version
+    <root>/snapshots/<snapshot_id>/...    immutable compacted bases
+    <root>/segments/<segment_id>/...      immutable segments, one per write
+
+Every snapshot and segment folder also lists the content hashes of its
+chunks in content_hashes.json, which ingestion uses to skip chunks the
+current version already holds.
+
+Writes save a small new segment, so their cost does not depend on the corpus
+size, then publish a new manifest by swapping CURRENT atomically. Readers see
+either the previous or the new version, never a partial one, and pick up a
+new version on their next request. Searches fan out over the base and every
+segment and merge the results. A background compaction folds the segments
+into a new base snapshot once there are
+`IngestDataConstants.SEGMENT_COMPACTION_THRESHOLD` of them. Folders no longer
+referenced by the last `IngestDataConstants.SNAPSHOT_RETENTION` manifests are
+garbage-collected.
+
+A folder without CURRENT is read in the legacy layout, with the base in
+<root>/index.faiss and the segments listed from <root>/segments; the first
+write migrates it.
+
+Readers take no lock: a reader whose folders were garbage-collected between
+reading CURRENT and opening them reads the new version instead (see
+`with_current_manifest`). Writers are serialized with `fcntl.flock`; where
+fcntl is missing (Windows), the lock only serializes the threads of one
+process, so a single process may write to a vectorstore there.
+"""
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Text, Tuple, TypeVar
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores import FAISS
+from langchain.vectorstores.base import VectorStore
+
+from ai.core.constants import IngestDataConstants
+from ai.core.embedding_store import ContentAddressedEmbeddings
+from ai.core.faiss_io import (
+    LOAD_MODE_MEMORY,
+    LOAD_MODE_MMAP,
+    MMAP_INDEX_FILE,
+    from_embeddings,
+    get_index_config,
+    load_faiss,
+    write_mmap_index,
+)
+from ai.core.metrics import metrics
+from config.config import Settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".lock"
+CONTENT_HASHES_FILE = "content_hashes.json"
+MANIFESTS_FOLDER = "manifests"
+SNAPSHOTS_FOLDER = "snapshots"
+SEGMENTS_FOLDER = "segments"
+# The legacy base lives in the root folder itself.
+LEGACY_BASE = "."
+# Reads of the current version retried after a concurrent garbage collection.
+READ_ATTEMPTS = 3
+
+T = TypeVar("T")
+
+
+class SegmentedVectorStore(VectorStore):
+    """Read-only view searching several FAISS stores as one (L2 distances)."""
+
+    def __init__(self, stores: List[FAISS]):
+        self.stores = stores
+
+    @property
+    def embedding_function(self) -> Callable:
+        return self.stores[0].embedding_function
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return self.stores[0]._select_relevance_score_fn()
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        docs_with_scores = []
+        for store in self.stores:
+            docs_with_scores.extend(
+                store.similarity_search_with_score_by_vector(embedding, k=k, **kwargs)
+            )
+        return sorted(docs_with_scores, key=lambda doc_with_score: doc_with_score[1])[:k]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding_function(query), k=k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def max_marginal_relevance_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        docs_with_scores = []
+        for store in self.stores:
+            docs_with_scores.extend(
+                store.max_marginal_relevance_search_with_score_by_vector(embedding, k=k, **kwargs)
+            )
+        return sorted(docs_with_scores, key=lambda doc_with_score: doc_with_score[1])[:k]
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("SegmentedVectorStore is read-only, use append_segment")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, **kwargs: Any):
+        raise NotImplementedError("SegmentedVectorStore is read-only, use append_segment")
+
+
+def has_base(vectorstore_path: Text) -> bool:
+    return os.path.exists(os.path.join(vectorstore_path, "index.faiss"))
+
+
+def _new_id() -> Text:
+    return f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+
+
+def _list_folders(path: Text) -> List[Text]:
+    if not os.path.isdir(path):
+        return []
+    return [name for name in sorted(os.listdir(path)) if not name.startswith(".")]
+
+
+def _write_atomic(path: Text, content: Text):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+_thread_locks: Dict[Text, threading.Lock] = {}
+
+
+@contextmanager
+def _write_lock(vectorstore_path: Text):
+    """Serialize manifest updates across threads and processes."""
+    os.makedirs(vectorstore_path, exist_ok=True)
+    if fcntl is None:
+        with _thread_locks.setdefault(os.path.normpath(vectorstore_path), threading.Lock()):
+            yield
+        return
+
+    with open(os.path.join(vectorstore_path, LOCK_FILE), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_manifest(vectorstore_path: Text) -> dict:
+    """The current version; folders are relative to `vectorstore_path`."""
+    for attempt in range(READ_ATTEMPTS):
+        try:
+            with open(os.path.join(vectorstore_path, CURRENT_FILE)) as f:
+                manifest_name = f.read().strip()
+        except FileNotFoundError:
+            break
+        try:
+            with open(os.path.join(vectorstore_path, MANIFESTS_FOLDER, manifest_name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # CURRENT moved on and the manifest it named was collected.
+            if attempt == READ_ATTEMPTS - 1:
+                raise
+
+    return {
+        "version": 0,
+        "base": LEGACY_BASE if has_base(vectorstore_path) else None,
+        "segments": [
+            os.path.join(SEGMENTS_FOLDER, name)
+            for name in _list_folders(os.path.join(vectorstore_path, SEGMENTS_FOLDER))
+        ],
+    }
+
+
+def manifest_folders(vectorstore_path: Text, manifest: dict) -> List[Text]:
+    """Folders of the base and the segments of `manifest`, in write order."""
+    folders = ([manifest["base"]] if manifest["base"] else []) + manifest["segments"]
+    return [os.path.normpath(os.path.join(vectorstore_path, folder)) for folder in folders]
+
+
+def with_current_manifest(
+    vectorstore_path: Text, read: Callable[[dict], T], manifest: Optional[dict] = None
+) -> T:
+    """Call `read` with the current manifest, or with `manifest` first if given.
+
+    Readers do not lock the vectorstore, so the folders of the manifest they
+    read can be garbage-collected by publishes landing before they open
+    them. `read` is then called again with the manifest CURRENT points to
+    now.
+    """
+    for attempt in range(READ_ATTEMPTS):
+        try:
+            return read(manifest if manifest is not None else read_manifest(vectorstore_path))
+        except FileNotFoundError:
+            if attempt == READ_ATTEMPTS - 1:
+                raise
+            metrics.incr("vectorstore.read_retries")
+            manifest = None
+
+
+def list_segments(vectorstore_path: Text) -> List[Text]:
+    """Segment folders of the current version in write order."""
+    manifest = read_manifest(vectorstore_path)
+    return [os.path.join(vectorstore_path, segment) for segment in manifest["segments"]]
+
+
+def _publish(vectorstore_path: Text, manifest: dict):
+    """Write `manifest` as the next version and point CURRENT at it.
+
+    Must be called with the write lock held.
+    """
+    manifests_path = os.path.join(vectorstore_path, MANIFESTS_FOLDER)
+    os.makedirs(manifests_path, exist_ok=True)
+
+    manifest = dict(manifest, version=manifest["version"] + 1, created_at=time.time())
+    manifest_name = f"{manifest['version']:020d}.json"
+    _write_atomic(os.path.join(manifests_path, manifest_name), json.dumps(manifest))
+    _write_atomic(os.path.join(vectorstore_path, CURRENT_FILE), manifest_name)
+
+    metrics.incr("vectorstore.versions_published")
+    gc(vectorstore_path)
+
+
+def _docstore_content_hashes(docstore) -> Set[Text]:
+    hashes = (doc.metadata.get(IngestDataConstants.CONTENT_HASH_KEY) for doc in docstore._dict.values())
+    return {hash for hash in hashes if hash}
+
+
+def _save_immutable(vectorstore: FAISS, parent_path: Text) -> Text:
+    """Save `vectorstore` under a new folder of `parent_path` and return its name."""
+    folder_id = _new_id()
+    tmp_path = os.path.join(parent_path, f".tmp-{folder_id}")
+    os.makedirs(parent_path, exist_ok=True)
+    vectorstore.save_local(tmp_path)
+    with open(os.path.join(tmp_path, CONTENT_HASHES_FILE), "w") as f:
+        json.dump(sorted(_docstore_content_hashes(vectorstore.docstore)), f)
+    if Settings().VECTORSTORE_LOAD_MODE == LOAD_MODE_MMAP:
+        # Written now, as the folder must not change once it is published.
+        write_mmap_index(tmp_path)
+    # Nothing ever sees a half-written folder.
+    os.rename(tmp_path, os.path.join(parent_path, folder_id))
+    return folder_id
+
+
+def append_segment(vectorstore_path: Text, vectorstore: FAISS) -> Text:
+    """Save `vectorstore` as a new segment, publish it and return its folder."""
+    segment_id = _save_immutable(vectorstore, os.path.join(vectorstore_path, SEGMENTS_FOLDER))
+    segment = os.path.join(SEGMENTS_FOLDER, segment_id)
+
+    with _write_lock(vectorstore_path):
+        manifest = read_manifest(vectorstore_path)
+        _publish(vectorstore_path, dict(manifest, segments=manifest["segments"] + [segment]))
+
+    metrics.incr("vectorstore.segments_written")
+    return os.path.join(vectorstore_path, segment)
+
+
+@lru_cache(maxsize=256)
+def _folder_content_hashes(folder: Text, mtime_ns: int) -> FrozenSet[Text]:
+    try:
+        with open(os.path.join(folder, CONTENT_HASHES_FILE)) as f:
+            return frozenset(json.load(f))
+    except FileNotFoundError:
+        # Saved before the hashes were listed next to the index.
+        with open(os.path.join(folder, "index.pkl"), "rb") as f:
+            docstore, _ = pickle.load(f)
+        return frozenset(_docstore_content_hashes(docstore))
+
+
+def content_hashes(vectorstore_path: Text) -> Set[Text]:
+    """Content hashes of the chunks in the current version of the vectorstore.
+
+    They are read from the folders the current manifest references, so they
+    stay right when the index is deleted, rebuilt, compacted or restored
+    from S3.
+    """
+    def read(manifest: dict) -> Set[Text]:
+        hashes = set()
+        for folder in manifest_folders(vectorstore_path, manifest):
+            hashes |= _folder_content_hashes(folder, os.stat(os.path.join(folder, "index.faiss")).st_mtime_ns)
+        return hashes
+
+    return with_current_manifest(vectorstore_path, read)
+
+
+@lru_cache(maxsize=256)
+def _folder_docstore_ids(folder: Text, mtime_ns: int) -> FrozenSet[Text]:
+    with open(os.path.join(folder, "index.pkl"), "rb") as f:
+        _, index_to_docstore_id = pickle.load(f)
+    return frozenset(index_to_docstore_id.values())
+
+
+def docstore_ids(vectorstore_path: Text) -> Set[Text]:
+    """Docstore ids of the chunks in the current version of the vectorstore."""
+    def read(manifest: dict) -> Set[Text]:
+        ids = set()
+        for folder in manifest_folders(vectorstore_path, manifest):
+            ids |= _folder_docstore_ids(folder, os.stat(os.path.join(folder, "index.pkl")).st_mtime_ns)
+        return ids
+
+    return with_current_manifest(vectorstore_path, read)
+
+
+def gc(vectorstore_path: Text):
+    """Remove manifests and folders no longer referenced by retained versions.
+
+    Must be called with the write lock held. Readers that still use a removed
+    folder keep working: in-memory stores are already loaded, and
+    memory-mapped files stay readable until they are unmapped. Readers about
+    to open a removed folder retry with the new version, see
+    `with_current_manifest`.
+    """
+    manifests_path = os.path.join(vectorstore_path, MANIFESTS_FOLDER)
+    manifest_names = sorted(name for name in os.listdir(manifests_path) if name.endswith(".json"))
+    retained, expired = (
+        manifest_names[-IngestDataConstants.SNAPSHOT_RETENTION:],
+        manifest_names[:-IngestDataConstants.SNAPSHOT_RETENTION],
+    )
+
+    referenced = set()
+    for name in retained:
+        with open(os.path.join(manifests_path, name)) as f:
+            manifest = json.load(f)
+        referenced.update(manifest_folders(vectorstore_path, manifest))
+
+    removed = 0
+    for folder_name in (SNAPSHOTS_FOLDER, SEGMENTS_FOLDER):
+        for name in _list_folders(os.path.join(vectorstore_path, folder_name)):
+            folder = os.path.normpath(os.path.join(vectorstore_path, folder_name, name))
+            if folder not in referenced:
+                shutil.rmtree(folder, ignore_errors=True)
+                removed += 1
+
+    if os.path.normpath(vectorstore_path) not in referenced and has_base(vectorstore_path):
+        for filename in ("index.faiss", "index.pkl", MMAP_INDEX_FILE):
+            if os.path.exists(os.path.join(vectorstore_path, filename)):
+                os.remove(os.path.join(vectorstore_path, filename))
+        removed += 1
+
+    for name in expired:
+        os.remove(os.path.join(manifests_path, name))
+
+    if removed:
+        metrics.incr("vectorstore.gc_removed", removed)
+        logging.info(f"Removed {removed} unreferenced snapshots and segments of {vectorstore_path}")
+
+
+def load_segmented(
+    vectorstore_path: Text,
+    embeddings: Embeddings,
+    mode: Text = LOAD_MODE_MEMORY,
+    loaded: Optional[Dict[Tuple, FAISS]] = None,
+    manifest: Optional[dict] = None,
+) -> Tuple[VectorStore, Dict[Tuple, FAISS]]:
+    """Load the base and all segments of a version, as a single FAISS store when possible.
+
+    `loaded` holds the stores of a previous load keyed by folder and
+    modification time; unchanged folders are reused instead of read again, so
+    picking up a freshly appended segment only reads that segment.
+    """
+    manifest = manifest or read_manifest(vectorstore_path)
+    folders = manifest_folders(vectorstore_path, manifest)
+    if not folders:
+        raise FileNotFoundError(f"No vectorstore found at {vectorstore_path}")
+
+    loaded = loaded or {}
+    stores = {}
+    for folder in folders:
+        key = (folder, os.stat(os.path.join(folder, "index.faiss")).st_mtime_ns)
+        stores[key] = loaded.get(key) or load_faiss(
+            folder,
+            embeddings,
+            mode=mode,
+            # Only the legacy base may still be rewritten in place.
+            create_mmap_index=manifest["version"] == 0,
+        )
+
+    store_list = list(stores.values())
+    vectorstore = store_list[0] if len(store_list) == 1 else SegmentedVectorStore(store_list)
+    return vectorstore, stores
+
+
+def _reconstruct_all(index: faiss.Index) -> np.ndarray:
+    ivf_index = faiss.try_extract_index_ivf(index)
+    if ivf_index is not None:
+        ivf_index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def compact(vectorstore_path: Text, embeddings: Embeddings):
+    """Merge the base and the segments of the current version into a new base snapshot.
+
+    The new base is built from the raw vectors in the embedding store when
+    `embeddings` has one. Quantized indexes such as IVF-PQ only give back
+    approximations of their vectors, and quantizing those again would lose
+    recall on every compaction; reconstructed vectors are only used for
+    chunks missing from the store.
+    """
+    start = time.perf_counter()
+
+    def read(manifest: dict) -> Tuple[dict, Dict[Text, Tuple[Document, np.ndarray]]]:
+        # Later writes win when the same document id was written more than once.
+        entries = {}
+        for folder in manifest_folders(vectorstore_path, manifest):
+            store = FAISS.load_local(folder, embeddings)
+            vectors = _reconstruct_all(store.index)
+            for position, doc_id in store.index_to_docstore_id.items():
+                entries.pop(doc_id, None)
+                entries[doc_id] = (store.docstore.search(doc_id), vectors[position])
+        return manifest, entries
+
+    manifest, entries = with_current_manifest(vectorstore_path, read)
+
+    ids = list(entries)
+    documents = [entries[id][0] for id in ids]
+    vectors = [entries[id][1] for id in ids]
+    if isinstance(embeddings, ContentAddressedEmbeddings):
+        raw_vectors = embeddings.stored_vectors([doc.page_content for doc in documents])
+        vectors = [vector if raw is None else raw for vector, raw in zip(vectors, raw_vectors)]
+        metrics.incr("vectorstore.compaction_reconstructed_vectors", sum(raw is None for raw in raw_vectors))
+
+    compacted = from_embeddings(
+        documents,
+        vectors,
+        embeddings,
+        index_config=get_index_config(vectorstore_path),
+        ids=ids,
+    )
+    snapshot_id = _save_immutable(compacted, os.path.join(vectorstore_path, SNAPSHOTS_FOLDER))
+
+    with _write_lock(vectorstore_path):
+        current = read_manifest(vectorstore_path)
+        if current["base"] != manifest["base"]:
+            # Another process compacted in the meantime; its snapshot wins.
+            shutil.rmtree(os.path.join(vectorstore_path, SNAPSHOTS_FOLDER, snapshot_id), ignore_errors=True)
+            return
+        # Keep the segments appended while compacting.
+        compacted_segments = set(manifest["segments"])
+        _publish(
+            vectorstore_path,
+            dict(
+                current,
+                base=os.path.join(SNAPSHOTS_FOLDER, snapshot_id),
+                segments=[segment for segment in current["segments"] if segment not in compacted_segments],
+            ),
+        )
+
+    metrics.incr("vectorstore.compactions")
+    metrics.observe("vectorstore.compaction_seconds", time.perf_counter() - start)
+    logging.info(
+        f"Compacted {len(manifest['segments'])} segments of {vectorstore_path} ({len(ids)} vectors)"
+    )
+
+
+_compaction_locks: Dict[Text, threading.Lock] = {}
+
+
+def schedule_compaction(vectorstore_path: Text, embeddings: Embeddings) -> Optional[threading.Thread]:
+    """Compact in a background thread once the segment threshold is reached."""
+    if len(list_segments(vectorstore_path)) < IngestDataConstants.SEGMENT_COMPACTION_THRESHOLD:
+        return None
+
+    lock = _compaction_locks.setdefault(os.path.normpath(vectorstore_path), threading.Lock())
+    if not lock.acquire(blocking=False):
+        return None
+
+    def run():
+        try:
+            compact(vectorstore_path, embeddings)
+        except Exception as e:
+            logging.exception(e)
+        finally:
+            lock.release()
+
+    thread = threading.Thread(target=run, name=f"compact-{vectorstore_path}", daemon=True)
+    thread.start()
+    return thread
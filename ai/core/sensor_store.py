@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Text, Tuple
+from uuid import UUID
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from bson import Binary
+from fastapi.concurrency import run_in_threadpool
+
+from ai.core.constants import SensorStoreConstants
+from ai.core.lexical_index import fold, tokenize
+from ai.core.metrics import metrics
+from ai.schemas.db_model import SensorDataLib, SensorDataVersion
+
+DATE_PATTERN = re.compile(r"\b(\d{1,2})[/-](\d{1,2})(?:[/-](\d{4}))?\b")
+
+
+def _id_key(value) -> Text:
+    """UUIDs come back from raw queries as BSON binaries."""
+    if isinstance(value, Binary):
+        value = value.as_uuid()
+    return str(value)
+
+
+def local_today() -> date:
+    """Today in the time zone of the sensors, whatever the server's."""
+    return datetime.now(ZoneInfo(SensorStoreConstants.TIMEZONE)).date()
+
+
+def _named_days(question: Text, folded: Text, today: date) -> Tuple:
+    days = []
+    if any(f" {word} " in folded for word in SensorStoreConstants.LATEST_WORDS + SensorStoreConstants.TODAY_WORDS):
+        days.append(today)
+    if any(f" {word} " in folded for word in SensorStoreConstants.YESTERDAY_WORDS):
+        days.append(today - timedelta(days=1))
+    days.extend(match.group(0) for match in DATE_PATTERN.finditer(fold(question)))
+    return tuple(days)
+
+
+@dataclass
+class SensorQuery:
+    location: int
+    parameter: int
+    day: Optional[date] = None
+
+
+class SensorSnapshot:
+    """Immutable columnar copy of the sensor readings.
+
+    Rows are sorted by location, parameter and time, so the readings of one
+    location and parameter are a contiguous slice, and a time range inside
+    it is found with a binary search. Prefix sums give the mean of any range
+    without scanning it.
+    """
+
+    def __init__(self, rows: List[dict]):
+        # SensorDataLib id -> answer, for the sensor library vectorstore hits.
+        self.answers: Dict[Text, Text] = {_id_key(row["_id"]): row["answer"] for row in rows}
+
+        self.locations: List[Text] = sorted({row["location"] for row in rows})
+        self.parameters: List[Text] = sorted({row["parameter"] for row in rows})
+        location_codes = {location: code for code, location in enumerate(self.locations)}
+        parameter_codes = {parameter: code for code, parameter in enumerate(self.parameters)}
+
+        locations = np.array([location_codes[row["location"]] for row in rows], dtype=np.int32)
+        parameters = np.array([parameter_codes[row["parameter"]] for row in rows], dtype=np.int32)
+        times = np.array([row["time"] for row in rows], dtype="datetime64[s]")
+        values = np.array([row["value"] for row in rows], dtype=np.float64)
+        units = np.array([row["unit"] for row in rows], dtype=object)
+
+        order = np.lexsort((times.astype(np.int64), parameters, locations))
+        self.location_column = locations[order]
+        self.parameter_column = parameters[order]
+        self.time_column = times[order]
+        self.value_column = values[order]
+        self.unit_column = units[order]
+        self.value_prefix_sums = np.concatenate(([0.0], np.cumsum(self.value_column)))
+
+        # (location, parameter) -> [start, end) of its rows.
+        self.groups: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        if len(rows):
+            keys = self.location_column.astype(np.int64) * len(self.parameters) + self.parameter_column
+            boundaries = np.flatnonzero(np.diff(keys)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(rows)]))
+            for start, end in zip(starts, ends):
+                self.groups[(int(self.location_column[start]), int(self.parameter_column[start]))] = (
+                    int(start),
+                    int(end),
+                )
+
+        # Longest names first, so "Ben Tre" does not shadow "Thanh pho Ben Tre".
+        self._folded_locations = sorted(
+            ((" ".join(tokenize(location)), code) for location, code in location_codes.items()),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+        self._folded_parameters = sorted(
+            ((" ".join(tokenize(parameter)), code) for parameter, code in parameter_codes.items()),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    def __len__(self) -> int:
+        return len(self.value_column)
+
+    def latest(self, location: int, parameter: int) -> Optional[dict]:
+        group = self.groups.get((location, parameter))
+        if group is None:
+            return None
+        return self._reading(group[1] - 1)
+
+    def range(self, location: int, parameter: int, start: datetime, end: datetime) -> Optional[dict]:
+        """Aggregates of the readings in [start, end)."""
+        group = self.groups.get((location, parameter))
+        if group is None:
+            return None
+        times = self.time_column[group[0] : group[1]]
+        first = group[0] + int(np.searchsorted(times, np.datetime64(start, "s"), side="left"))
+        last = group[0] + int(np.searchsorted(times, np.datetime64(end, "s"), side="left"))
+        if first == last:
+            return None
+
+        values = self.value_column[first:last]
+        return {
+            "count": last - first,
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "mean": (self.value_prefix_sums[last] - self.value_prefix_sums[first]) / (last - first),
+            "latest": self._reading(last - 1),
+        }
+
+    def _reading(self, row: int) -> dict:
+        return {
+            "location": self.locations[self.location_column[row]],
+            "parameter": self.parameters[self.parameter_column[row]],
+            "value": float(self.value_column[row]),
+            "unit": self.unit_column[row],
+            "time": self.time_column[row].item(),
+        }
+
+    def entities(self, question: Text, today: Optional[date] = None) -> Tuple:
+        """Locations, parameters and days a question names.
+
+        Questions that differ only in one of these, e.g. the salinity in Ben
+        Tre or in Tra Vinh today, embed almost identically but have
+        different answers. Relative days are resolved, so "today" names a
+        different day tomorrow.
+        """
+        folded = f" {' '.join(tokenize(question))} "
+        locations = tuple(name for name, _ in self._folded_locations if f" {name} " in folded)
+        parameters = tuple(name for name, _ in self._folded_parameters if f" {name} " in folded)
+        return locations, parameters, _named_days(question, folded, today or local_today())
+
+    def parse(self, question: Text, today: Optional[date] = None) -> Optional[SensorQuery]:
+        """Location, parameter and day of a structured question, if it names them."""
+        folded = f" {' '.join(tokenize(question))} "
+        location = next((code for name, code in self._folded_locations if f" {name} " in folded), None)
+        parameter = next((code for name, code in self._folded_parameters if f" {name} " in folded), None)
+        if location is None or parameter is None:
+            return None
+        # "Salinity in Ben Tre is high today, what should we do?" names a
+        # reading but asks for advice.
+        if any(f" {word} " in folded for word in SensorStoreConstants.INTENT_WORDS):
+            return None
+
+        # Without a time reference the question is likely not a lookup,
+        # e.g. how salinity affects crops, and is left to the LLM.
+        today = today or local_today()
+        if any(f" {word} " in folded for word in SensorStoreConstants.LATEST_WORDS):
+            return SensorQuery(location=location, parameter=parameter)
+        if any(f" {word} " in folded for word in SensorStoreConstants.TODAY_WORDS):
+            return SensorQuery(location=location, parameter=parameter, day=today)
+        if any(f" {word} " in folded for word in SensorStoreConstants.YESTERDAY_WORDS):
+            return SensorQuery(location=location, parameter=parameter, day=today - timedelta(days=1))
+
+        match = DATE_PATTERN.search(fold(question))
+        if match is None:
+            return None
+        try:
+            day = date(int(match.group(3) or today.year), int(match.group(2)), int(match.group(1)))
+        except ValueError:
+            return None
+        return SensorQuery(location=location, parameter=parameter, day=day)
+
+
+class SensorStore:
+    """In-memory sensor readings answering structured questions without the LLM.
+
+    It also holds the answer of every row keyed by id, for the hits of the
+    sensor library vectorstore. The snapshot is rebuilt from MongoDB at
+    startup and replaced in one assignment, so lookups never see a partially
+    loaded store. Every `db_builder` run bumps a version stamp in MongoDB,
+    which each process checks periodically to reload its own copy.
+    """
+
+    def __init__(self):
+        self.snapshot: Optional[SensorSnapshot] = None
+        self.version: Optional[int] = None
+        self._watcher: Optional[asyncio.Task] = None
+
+    def load(self, rows: Iterable[dict]):
+        start = time.perf_counter()
+        snapshot = SensorSnapshot(list(rows))
+        self.snapshot = snapshot
+        load_seconds = time.perf_counter() - start
+        metrics.observe("sensor_store.load_seconds", load_seconds)
+        logging.info(f"Loaded {len(snapshot)} sensor readings in {load_seconds:.3f}s")
+
+    @staticmethod
+    async def _stored_version() -> int:
+        stamp = await SensorDataVersion.get(SensorStoreConstants.VERSION_ID)
+        return stamp.version if stamp is not None else 0
+
+    async def refresh(self):
+        # Read before the rows: a load racing with this one bumps it again.
+        version = await self._stored_version()
+        rows = await SensorDataLib.get_motor_collection().find(
+            {}, {"_id": 1, "answer": 1, "location": 1, "parameter": 1, "value": 1, "unit": 1, "time": 1}
+        ).to_list(length=None)
+        await run_in_threadpool(self.load, rows)
+        self.version = version
+
+    async def refresh_if_stale(self) -> bool:
+        """Reload the readings if another process changed them since."""
+        if self.snapshot is not None and await self._stored_version() == self.version:
+            return False
+        await self.refresh()
+        metrics.incr("sensor_store.refreshes")
+        return True
+
+    async def publish(self):
+        """Bump the version stamp after loading SensorDataLib, and reload."""
+        await SensorDataVersion.get_motor_collection().update_one(
+            {"_id": SensorStoreConstants.VERSION_ID},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now()}},
+            upsert=True,
+        )
+        await self.refresh()
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_if_stale()
+            except Exception as e:
+                logging.exception(e)
+
+    async def start(self, interval: float = SensorStoreConstants.REFRESH_CHECK_SECONDS):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logging.exception(e)
+        self._watcher = asyncio.create_task(self._watch(interval))
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+
+    async def relevant_answer(self, sensor_data_id: Text) -> Optional[Text]:
+        """Answer of a SensorDataLib row, from the preloaded table when loaded."""
+        snapshot = self.snapshot
+        if snapshot is not None:
+            return snapshot.answers.get(str(sensor_data_id))
+
+        sensor_data = await SensorDataLib.get(UUID(sensor_data_id))
+        return sensor_data.answer if sensor_data else None
+
+    def entities(self, question: Text) -> Tuple:
+        """Locations, parameters and days of the question, see `SensorSnapshot.entities`."""
+        snapshot = self.snapshot
+        if snapshot is None:
+            return (), (), _named_days(question, f" {' '.join(tokenize(question))} ", local_today())
+        return snapshot.entities(question)
+
+    def answer(self, question: Text, language: Text = "Vietnamese") -> Optional[Text]:
+        """The answer to a structured question, or None to use the LLM."""
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None
+
+        start = time.perf_counter()
+        query = snapshot.parse(question)
+        answer = None
+        if query is not None:
+            if query.day is None:
+                reading = snapshot.latest(query.location, query.parameter)
+                if reading is not None:
+                    answer = self._format(SensorStoreConstants.LATEST_TEMPLATES, language, **reading)
+            else:
+                day_start = datetime.combine(query.day, datetime.min.time())
+                aggregates = snapshot.range(
+                    query.location, query.parameter, day_start, day_start + timedelta(days=1)
+                )
+                if aggregates is not None:
+                    answer = self._format(
+                        SensorStoreConstants.DAY_TEMPLATES,
+                        language,
+                        **aggregates["latest"],
+                        day=query.day,
+                        min=aggregates["min"],
+                        max=aggregates["max"],
+                        mean=aggregates["mean"],
+                    )
+
+        metrics.observe("sensor_store.answer_seconds", time.perf_counter() - start)
+        metrics.incr("sensor_store.hits" if answer else "sensor_store.misses")
+        return answer
+
+    @staticmethod
+    def _format(templates: Dict[Text, Text], language: Text, **fields) -> Text:
+        template = templates["English" if language == "English" else "Vietnamese"]
+        return template.format(**fields)
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "version": self.version,
+            "readings": len(snapshot),
+            "locations": len(snapshot.locations),
+            "parameters": len(snapshot.parameters),
+        }
+
+
+sensor_store = SensorStore()
+metrics.register_provider("sensor_store", sensor_store.stats)
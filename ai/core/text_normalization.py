@@ -0,0 +1,17 @@
+"""
+Text normalization shared by every cache key, kept free of app imports so
+low-level modules such as the embedding cache can use it.
+"""
+import re
+import unicodedata
+
+
+def replace_non_breaking_spaces(text: str) -> str:
+    """Non-breaking spaces, raw or escaped by the client, as plain spaces."""
+    return text.replace("\xa0", " ").replace("\\xa0", " ")
+
+
+def normalize_text(text: str) -> str:
+    """NFC, non-breaking spaces and runs of whitespace folded, casefolded."""
+    text = replace_non_breaking_spaces(unicodedata.normalize("NFC", text))
+    return re.sub(r"\s+", " ", text).strip().casefold()
@@ -4,6 +4,7 @@ from typing import Tuple
 from fastapi import HTTPException
 
 from ai.core.message_shortener import shorten_message
+from ai.core.text_normalization import replace_non_breaking_spaces
 from ai.schemas.schemas import QARequest
 
 
@@ -54,9 +55,7 @@ def preprocess_chat_history(
 
         if current_item is not None:
             # Normalize the message string
-            current_item["content"] = (
-                current_item["content"].replace("\xa0", " ").replace("\\xa0", " ")
-            )
+            current_item["content"] = replace_non_breaking_spaces(current_item["content"])
 
             # Shorten message if it is too long
             content_word_len = len(re.findall(r"\w+", current_item["content"]))
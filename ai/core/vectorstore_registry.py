@@ -0,0 +1,248 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from langchain.embeddings.base import Embeddings
+from langchain.retrievers import MergerRetriever
+from langchain.vectorstores.base import VectorStore
+
+from ai.core.constants import LangChainOpenAIConstants
+from ai.core.lexical_index import LexicalIndex
+from ai.core.metrics import metrics
+from ai.core.segmented_vectorstore import load_segmented, manifest_folders, with_current_manifest
+from ai.llm.data_loader.vectorestore_retriever import CustomVectorStoreRetriever
+from config.config import Settings
+
+INDEX_FILES = ("index.faiss", "index.pkl")
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of the current process in bytes (Linux only)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@dataclass
+class VectorStoreEntry:
+    name: str
+    folder_path: str
+    vectorstore: VectorStore
+    stores: Dict[Tuple, VectorStore]
+    signature: Tuple
+    version: int
+    load_seconds: float
+    rss_delta_bytes: Optional[int]
+    lexical_index: Optional[LexicalIndex] = None
+    loaded_at: float = field(default_factory=time.time)
+    retrievers: Dict[Tuple, MergerRetriever] = field(default_factory=dict)
+
+    def stats(self) -> dict:
+        stores = getattr(self.vectorstore, "stores", [self.vectorstore])
+        return {
+            "folder_path": self.folder_path,
+            "index_type": type(stores[0].index).__name__,
+            "num_segments": len(stores),
+            "num_vectors": sum(store.index.ntotal for store in stores),
+            "dimension": stores[0].index.d,
+            "lexical_documents": len(self.lexical_index) if self.lexical_index is not None else None,
+            "version": self.version,
+            "disk_bytes": sum(
+                os.path.getsize(os.path.join(folder, filename))
+                for folder, _ in self.stores
+                for filename in INDEX_FILES
+                if os.path.exists(os.path.join(folder, filename))
+            ),
+            "load_seconds": round(self.load_seconds, 4),
+            "rss_delta_bytes": self.rss_delta_bytes,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class VectorStoreRegistry:
+    """Loads each named FAISS vectorstore once per process and shares it.
+
+    Every lookup checks the CURRENT pointer of the vectorstore folder, so a
+    newly published version is picked up on the next request without a
+    restart; only its new snapshots and segments are read. The returned
+    vectorstores and retrievers are shared between requests and must be
+    treated as read-only; ingestion works on its own copy.
+    """
+
+    def __init__(self, load_mode: str = None):
+        self.load_mode = load_mode or Settings().VECTORSTORE_LOAD_MODE
+        self._entries: Dict[str, VectorStoreEntry] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _signature(folder_path: str, manifest: dict) -> Tuple:
+        """Signature of a version.
+
+        Snapshots and segments are immutable, so a version is identified by
+        its number and folders, and checking it only reads two small files.
+        """
+        folders = tuple(manifest_folders(folder_path, manifest))
+        if not folders:
+            raise FileNotFoundError(f"No vectorstore found at {folder_path}")
+        if manifest["version"] == 0:
+            # Legacy layout: the base may still be overwritten in place.
+            folders = tuple((folder, os.stat(os.path.join(folder, "index.faiss")).st_mtime_ns) for folder in folders)
+        return manifest["version"], folders
+
+    def _current(self, folder_path: str) -> Tuple[dict, Tuple]:
+        """The current manifest and its signature."""
+        return with_current_manifest(
+            folder_path, lambda manifest: (manifest, self._signature(folder_path, manifest))
+        )
+
+    @staticmethod
+    def _build_lexical_index(stores: Dict[Tuple, VectorStore]) -> LexicalIndex:
+        """BM25 index over the documents of every store, later writes winning."""
+        documents = {}
+        for store in stores.values():
+            for doc_id in store.index_to_docstore_id.values():
+                documents[doc_id] = store.docstore.search(doc_id)
+        return LexicalIndex(list(documents.values()))
+
+    def _index_lexically(self, entry: VectorStoreEntry):
+        """Build the BM25 index of a loaded entry and hand it to its retrievers.
+
+        Runs in a background thread, so neither the loading request nor the
+        requests waiting on the registry lock pay for it; until it is ready
+        the retrievers search by vector only.
+        """
+        start = time.perf_counter()
+        try:
+            lexical_index = self._build_lexical_index(entry.stores)
+        except Exception:
+            logging.exception(f"Failed to build the lexical index of vectorstore {entry.name}")
+            return
+        # Set before updating the retrievers, see `get_retriever`.
+        entry.lexical_index = lexical_index
+        for retriever in list(entry.retrievers.values()):
+            for vectorstore_retriever in retriever.retrievers:
+                vectorstore_retriever.lexical_index = lexical_index
+        seconds = time.perf_counter() - start
+        metrics.observe(f"vectorstore.{entry.name}.lexical_index_seconds", seconds)
+        logging.info(f"Built lexical index of vectorstore {entry.name} v{entry.version} in {seconds:.3f}s")
+
+    def _load(
+        self, name: str, folder_path: str, embeddings: Embeddings, manifest: dict, signature: Tuple
+    ) -> VectorStoreEntry:
+        rss_before = current_rss()
+        start = time.perf_counter()
+        previous = self._entries.get(name)
+        vectorstore, stores = load_segmented(
+            folder_path,
+            embeddings,
+            mode=self.load_mode,
+            loaded=previous.stores if previous is not None and previous.folder_path == folder_path else None,
+            manifest=manifest,
+        )
+        load_seconds = time.perf_counter() - start
+        rss_after = current_rss()
+        rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+
+        metrics.observe(f"vectorstore.{name}.load_seconds", load_seconds)
+        logging.info(
+            f"Loaded vectorstore {name} v{manifest['version']} from {folder_path} ({self.load_mode}) "
+            f"in {load_seconds:.3f}s "
+            f"(RSS delta: {rss_delta} bytes)"
+        )
+        entry = VectorStoreEntry(
+            name=name,
+            folder_path=folder_path,
+            vectorstore=vectorstore,
+            stores=stores,
+            signature=signature,
+            version=manifest["version"],
+            load_seconds=load_seconds,
+            rss_delta_bytes=rss_delta,
+        )
+        if name in LangChainOpenAIConstants.LEXICAL_INDEXES:
+            threading.Thread(target=self._index_lexically, args=(entry,), daemon=True).start()
+        return entry
+
+    def get_entry(self, name: str, folder_path: str, embeddings: Embeddings) -> VectorStoreEntry:
+        folder_path = os.path.normpath(folder_path)
+        manifest, signature = self._current(folder_path)
+
+        entry = self._entries.get(name)
+        if entry is not None and entry.folder_path == folder_path and entry.signature == signature:
+            return entry
+
+        def load(manifest: dict) -> VectorStoreEntry:
+            signature = self._signature(folder_path, manifest)
+            entry = self._entries.get(name)
+            if entry is None or entry.folder_path != folder_path or entry.signature != signature:
+                if entry is not None:
+                    metrics.incr(f"vectorstore.{name}.reloads")
+                entry = self._load(name, folder_path, embeddings, manifest, signature)
+                self._entries[name] = entry
+            return entry
+
+        with self._lock:
+            # Retried with the new version if a publish collected its folders meanwhile.
+            return with_current_manifest(folder_path, load, manifest=manifest)
+
+    def get_vectorstore(self, name: str, folder_path: str, embeddings: Embeddings) -> VectorStore:
+        return self.get_entry(name, folder_path, embeddings).vectorstore
+
+    def get_retriever(
+        self,
+        name: str,
+        folder_path: str,
+        embeddings: Embeddings,
+        search_kwargs: dict,
+        search_type: str = "similarity_score_threshold",
+    ) -> Tuple[VectorStore, MergerRetriever]:
+        entry = self.get_entry(name, folder_path, embeddings)
+        key = (search_type, tuple(sorted(search_kwargs.items())))
+
+        retriever = entry.retrievers.get(key)
+        if retriever is None:
+            retriever = MergerRetriever(
+                retrievers=[
+                    CustomVectorStoreRetriever(
+                        vectorstore=entry.vectorstore,
+                        search_type=search_type,
+                        search_kwargs=search_kwargs,
+                        embeddings=embeddings,
+                        lexical_index=entry.lexical_index,
+                        metadata={"name": name},
+                    )
+                ],
+            )
+            entry.retrievers[key] = retriever
+            # The lexical index may have been built since it was read above.
+            retriever.retrievers[0].lexical_index = entry.lexical_index
+        return entry.vectorstore, retriever
+
+    def versions(self) -> Dict[str, Tuple]:
+        """Signature of the loaded version of every vectorstore."""
+        return {name: entry.signature for name, entry in self._entries.items()}
+
+    def current_versions(self) -> Dict[str, Optional[Tuple]]:
+        """Signature of the published version of every loaded vectorstore.
+
+        Read from the CURRENT pointers, without loading anything.
+        """
+        versions = {}
+        for name, entry in list(self._entries.items()):
+            try:
+                versions[name] = self._current(entry.folder_path)[1]
+            except FileNotFoundError:
+                versions[name] = None
+        return versions
+
+    def stats(self) -> dict:
+        return {name: entry.stats() for name, entry in self._entries.items()}
+
+
+vectorstore_registry = VectorStoreRegistry()
+metrics.register_provider("vectorstores", vectorstore_registry.stats)
@@ -3,7 +3,6 @@ import logging
 import os
 import re
 from typing import Tuple
-from uuid import UUID
 
 import backoff
 import openai
@@ -17,22 +16,58 @@ from langchain.chat_models import ChatOpenAI
 from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.retrievers import MergerRetriever
 from langchain.schema import HumanMessage
-from langchain.vectorstores import FAISS
 from langchain.vectorstores.base import VectorStore
 
+from ai.core.answer_cache import SemanticAnswerCache
 from ai.core.constants import IngestDataConstants, LangChainOpenAIConstants
+from ai.core.embedding_cache import CachedEmbeddings, EmbeddingCache
+from ai.core.embedding_store import ContentAddressedEmbeddings, EmbeddingStore
+from ai.core.metrics import metrics
+from ai.core.rate_limiter import EmbeddingRateLimiter, RateLimitedEmbeddings
+from ai.core.sensor_store import sensor_store
+from ai.core.vectorstore_registry import vectorstore_registry
 from ai.llm.base_model.retrieval_chain import CustomConversationalRetrievalChain
 from ai.llm.data_loader.load_langchain_config import LangChainDataLoader
-from ai.llm.data_loader.vectorestore_retriever import CustomVectorStoreRetriever
-from ai.schemas.db_model import SensorDataLib
 from config.config import Settings
 
 os.environ["OPENAI_API_KEY"] = Settings().OPENAI_API_KEY
 
+embedding_cache = EmbeddingCache(
+    max_size=Settings().EMBEDDING_CACHE_SIZE,
+    persist_path=Settings().EMBEDDING_CACHE_PATH,
+)
+metrics.register_provider("embedding_cache", embedding_cache.stats)
+
+embedding_rate_limiter = EmbeddingRateLimiter(
+    requests_per_minute=Settings().EMBEDDING_REQUESTS_PER_MINUTE,
+    tokens_per_minute=Settings().EMBEDDING_TOKENS_PER_MINUTE,
+    query_share=Settings().EMBEDDING_QUERY_SHARE,
+)
+metrics.register_provider("embedding_rate_limiter", embedding_rate_limiter.stats)
+
+
+embedding_store = EmbeddingStore(Settings().EMBEDDING_STORE_PATH)
+
+answer_cache = SemanticAnswerCache(
+    max_size=Settings().SEMANTIC_CACHE_SIZE,
+    threshold=Settings().SEMANTIC_CACHE_THRESHOLD,
+)
+metrics.register_provider("answer_cache", answer_cache.stats)
+
 
 @backoff.on_exception(backoff.expo, openai.error.RateLimitError)
 def openai_embedding_with_backoff():
-    return OpenAIEmbeddings(chunk_size=IngestDataConstants.CHUNK_OVERLAP)
+    return CachedEmbeddings(
+        ContentAddressedEmbeddings(
+            RateLimitedEmbeddings(
+                OpenAIEmbeddings(chunk_size=IngestDataConstants.EMBEDDING_BATCH_SIZE),
+                embedding_rate_limiter,
+                batch_size=IngestDataConstants.EMBEDDING_BATCH_SIZE,
+            ),
+            embedding_store,
+        ),
+        embedding_cache,
+    )
 
 
 class LangchainOpenAI:
@@ -104,6 +139,7 @@ class LangchainOpenAI:
                 llm=self.llm_model, prompt=self.data_loader.prompts["condensePrompt"]
             ),
             max_tokens_limit=4000,
+            no_docs_answer=LangChainOpenAIConstants.DIAMOND_NO_DATA_ANSWER,
             output_parser=self.output_parser,
             return_source_documents=True,
             return_generated_question=True,
@@ -139,23 +175,13 @@ class LangchainOpenAI:
             vectorstore_search_kwargs = {"k": 5, "score_threshold": 0.3}
 
         try:
-            embeddings = openai_embedding_with_backoff()
-            vectorstore = FAISS.load_local(
-                folder_path=vectorstore_folder_path, embeddings=embeddings
-            )
-            vectorestore_retriever = CustomVectorStoreRetriever(
-                vectorstore=vectorstore,
-                search_type="similarity_score_threshold",
+            return vectorstore_registry.get_retriever(
+                name="help_center",
+                folder_path=vectorstore_folder_path,
+                embeddings=openai_embedding_with_backoff(),
                 search_kwargs=vectorstore_search_kwargs,
-                metadata={"name": "help_center"},
-            )
-
-            final_vectorstore_retriever = MergerRetriever(
-                retrievers=[vectorestore_retriever],
             )
 
-            return vectorstore, final_vectorstore_retriever
-
         except Exception as e:
             raise HTTPException(
                 status_code=500, detail="Error when loading vectorstore"
@@ -169,23 +195,13 @@ class LangchainOpenAI:
             vectorstore_search_kwargs = {"k": 5, "score_threshold": 0.65}
 
         try:
-            embeddings = openai_embedding_with_backoff()
-            vectorstore = FAISS.load_local(
-                folder_path=vectorstore_folder_path, embeddings=embeddings
-            )
-            vectorestore_retriever = CustomVectorStoreRetriever(
-                vectorstore=vectorstore,
-                search_type="similarity_score_threshold",
+            return vectorstore_registry.get_retriever(
+                name="diamond_dataset",
+                folder_path=vectorstore_folder_path,
+                embeddings=openai_embedding_with_backoff(),
                 search_kwargs=vectorstore_search_kwargs,
-                metadata={"name": "diamond_dataset"},
             )
 
-            final_vectorstore_retriever = MergerRetriever(
-                retrievers=[vectorestore_retriever],
-            )
-
-            return vectorstore, final_vectorstore_retriever
-
         except Exception as e:
             raise HTTPException(
                 status_code=500, detail=f"Error when loading diamond vectorstore, {e}"
@@ -199,32 +215,29 @@ class LangchainOpenAI:
             rspl_vts_search_kwargs = {"k": 1, "score_threshold": 0.3}
 
         try:
-            embeddings = openai_embedding_with_backoff()
-
-            if os.path.exists(f"{sensor_lib_vts_folder_path}/index.faiss"):
-                sensor_lib_vectorstore = FAISS.load_local(
-                    sensor_lib_vts_folder_path, embeddings
-                )
-
-                sensor_lib_retriever = CustomVectorStoreRetriever(
-                    vectorstore=sensor_lib_vectorstore,
-                    search_type="similarity_score_threshold",
-                    search_kwargs=rspl_vts_search_kwargs,
-                    metadata={"name": "sensor_lib"},
-                )
+            _, sensor_lib_retriever = vectorstore_registry.get_retriever(
+                name="sensor_lib",
+                folder_path=sensor_lib_vts_folder_path,
+                embeddings=openai_embedding_with_backoff(),
+                search_kwargs=rspl_vts_search_kwargs,
+            )
 
-            return MergerRetriever(retrievers=[sensor_lib_retriever])
+            return sensor_lib_retriever
         except Exception as e:  # noqa
             raise HTTPException(
                 status_code=500, detail=f"Error when loading sensorlib. {e}"
             )
 
+    @staticmethod
+    def prompt_version() -> str:
+        return os.environ.get("PROMPT_VERSION", "280823")
+
     @staticmethod
     def load_llm_model():
         with open(
             os.path.join(
                 LangChainOpenAIConstants.ROOT_PATH,
-                f"configs/llms/{os.environ.get('PROMPT_VERSION', '280823')}.yaml",
+                f"configs/llms/{LangchainOpenAI.prompt_version()}.yaml",
             )
         ) as f:
             model_configs = yaml.safe_load(f)
@@ -326,11 +339,12 @@ class LangchainOpenAI:
 
             relevant_questions = merged_documents
             if len(relevant_questions) > 0:
-                source = relevant_questions[0].metadata["source"].replace("\\", "/")
-                relevant_question_id = source.split("/")[-2]
-                query = await SensorDataLib.find_one(
-                    SensorDataLib.id == UUID(relevant_question_id)
-                )
-                if query:
-                    self.relevant_answer = query.answer
+                metadata = relevant_questions[0].metadata
+                relevant_question_id = metadata.get(IngestDataConstants.SENSOR_DATA_ID_KEY)
+                if relevant_question_id is None:
+                    # Indexed before the id was stored in the metadata.
+                    relevant_question_id = metadata["source"].replace("\\", "/").split("/")[-2]
+                answer = await sensor_store.relevant_answer(relevant_question_id)
+                if answer:
+                    self.relevant_answer = answer
                     self.score = merged_scores[0]["score"]
@@ -1,3 +1,4 @@
+import asyncio
 import inspect
 import logging
 import time
@@ -6,6 +7,7 @@ from typing import Any, Dict, List, Optional, Tuple
 from langchain.callbacks.manager import (
     AsyncCallbackManager,
     AsyncCallbackManagerForChainRun,
+    Callbacks,
 )
 from langchain.chains import ConversationalRetrievalChain, StuffDocumentsChain
 from langchain.chains.conversational_retrieval.base import _get_chat_history
@@ -14,15 +16,31 @@ from langchain.load.dump import dumpd
 from langchain.retrievers import MergerRetriever
 from langchain.schema import BaseOutputParser, Document
 
+from ai.core.constants import IngestDataConstants, LangChainOpenAIConstants
+from ai.core.metrics import metrics
+from ai.llm.data_loader.vectorestore_retriever import CustomVectorStoreRetriever, request_lookups
+
 
 class CustomConversationalRetrievalChain(ConversationalRetrievalChain):
     retriever: MergerRetriever
     output_parser: BaseOutputParser = None
+    retriever_timeout: Optional[float] = LangChainOpenAIConstants.RETRIEVER_TIMEOUT_SECONDS
+    no_docs_answer: Optional[str] = None
+    """Returned without calling the LLM when retrieval finds no documents."""
 
     async def _acall(
         self,
         inputs: Dict[str, Any],
         run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        # Chains of one request share its lookups, see `start_request_lookups`.
+        with request_lookups():
+            return await self._acall_with_lookups(inputs, run_manager)
+
+    async def _acall_with_lookups(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
     ) -> Dict[str, Any]:
         _run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
         question = inputs["question"]
@@ -45,6 +63,15 @@ class CustomConversationalRetrievalChain(ConversationalRetrievalChain):
         else:
             docs, scores = await self._aget_docs(new_question, inputs)  # type: ignore[call-arg]
 
+        if not docs and self.no_docs_answer is not None:
+            metrics.incr("retrieval_chain.no_docs_short_circuits")
+            output: Dict[str, Any] = {self.output_key: self.no_docs_answer, "scores": scores}
+            if self.return_source_documents:
+                output["source_documents"] = docs
+            if self.return_generated_question:
+                output["generated_question"] = new_question
+            return output
+
         new_inputs = inputs.copy()
         if self.rephrase_question:
             new_inputs["question"] = new_question
@@ -90,17 +117,28 @@ class CustomConversationalRetrievalChain(ConversationalRetrievalChain):
             **kwargs,
         )
         try:
-            # Get the results of all retrievers.
-            retriever_docs = [
-                (
-                    await retriever.aget_relevant_documents(
+            # Near-verbatim questions are answered from the lexical indexes,
+            # without embedding the question.
+            lexical_docs = [
+                retriever.lexical_search(question) for retriever in self.retriever.retrievers
+            ]
+            if all(docs is not None for docs in lexical_docs):
+                metrics.incr("retrieval_chain.embeddings_skipped")
+                embed_seconds = metrics.average("retrieval_chain.embed_seconds")
+                if embed_seconds is not None:
+                    metrics.observe("retrieval_chain.lexical_latency_saved_seconds", embed_seconds)
+
+            # Get the results of all retrievers concurrently, in retriever order.
+            retriever_docs = await asyncio.gather(
+                *[
+                    self._aget_retriever_docs(
+                        retriever,
                         question,
                         callbacks=run_manager.get_child("retriever_{}".format(i + 1)),
-                    ),
-                    retriever.metadata["name"],
-                )
-                for i, retriever in enumerate(self.retriever.retrievers)
-            ]
+                    )
+                    for i, retriever in enumerate(self.retriever.retrievers)
+                ]
+            )
 
             # Merge the results of the retrievers.
             merged_documents = []
@@ -128,6 +166,39 @@ class CustomConversationalRetrievalChain(ConversationalRetrievalChain):
             merged_documents, merged_scores
         )
 
+    async def _aget_retriever_docs(
+        self, retriever: CustomVectorStoreRetriever, question: str, callbacks: Callbacks
+    ) -> Tuple[List, str]:
+        """Search one retriever, returning no documents if it exceeds the timeout.
+
+        The timeout covers embedding the question too. Every vectorstore shares
+        one embedding model, so the retrievers of a request share one embedding
+        and each index is searched by vector.
+        """
+        name = retriever.metadata["name"]
+        start = time.perf_counter()
+        try:
+            docs_with_scores = await asyncio.wait_for(
+                retriever.aget_relevant_documents(question, callbacks=callbacks),
+                timeout=self.retriever_timeout,
+            )
+        except asyncio.TimeoutError:
+            logging.warning(f"Retriever {name} timed out after {self.retriever_timeout}s")
+            metrics.incr(f"retriever.{name}.timeouts")
+            docs_with_scores = []
+        finally:
+            metrics.observe(f"retriever.{name}.seconds", time.perf_counter() - start)
+
+        return docs_with_scores, name
+
+    def _num_tokens(self, doc: Document) -> int:
+        """Token count stored at ingestion, tokenizing only older documents without one."""
+        num_tokens = doc.metadata.get(IngestDataConstants.NUM_TOKENS_KEY)
+        if num_tokens is None:
+            metrics.incr("retrieval_chain.token_count_fallbacks")
+            num_tokens = self.combine_docs_chain.llm_chain.llm.get_num_tokens(doc.page_content)
+        return num_tokens
+
     def _reduce_tokens_below_limit_with_score(
         self, docs: List[Document], scores: List = None
     ) -> Tuple[List[Document], List[float]]:
@@ -136,10 +207,7 @@ class CustomConversationalRetrievalChain(ConversationalRetrievalChain):
         if self.max_tokens_limit and isinstance(
             self.combine_docs_chain, StuffDocumentsChain
         ):
-            tokens = [
-                self.combine_docs_chain.llm_chain.llm.get_num_tokens(doc.page_content)
-                for doc in docs
-            ]
+            tokens = [self._num_tokens(doc) for doc in docs]
             token_count = sum(tokens[:num_docs])
             while token_count > self.max_tokens_limit:
                 num_docs -= 1
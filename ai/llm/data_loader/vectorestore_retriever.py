@@ -1,15 +1,64 @@
 import asyncio
-from functools import partial
-from typing import Any, ClassVar, Collection, Dict, List
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, ClassVar, Collection, Dict, Iterator, List, Optional, Tuple
 
 from langchain.callbacks.manager import (
     AsyncCallbackManagerForRetrieverRun,
     CallbackManagerForRetrieverRun,
 )
+from langchain.embeddings.base import Embeddings
 from langchain.schema import BaseRetriever, Document
 from langchain.vectorstores import VectorStore
 from pydantic import Field, root_validator
 
+from ai.core.constants import LangChainOpenAIConstants
+from ai.core.lexical_index import LexicalIndex
+from ai.core.metrics import metrics
+
+
+@dataclass
+class RequestLookups:
+    """Lookups shared by the chains and retrievers serving one request.
+
+    Kept in a context variable rather than in the chain inputs, which end up
+    in the chain outputs and in callback payloads.
+    """
+
+    # Question -> embedding future, so chains running concurrently on the
+    # same request await one embeddings call.
+    embeddings: Dict[str, asyncio.Future] = field(default_factory=dict)
+    # (lexical index id, k, question) -> lexical hits, so an index is searched
+    # once per request however many times the question is checked. Keyed by
+    # the index, which is shared by the copies pydantic makes of a retriever.
+    lexical: Dict[Tuple[int, int, str], Optional[List]] = field(default_factory=dict)
+
+
+_request_lookups: ContextVar[Optional[RequestLookups]] = ContextVar("request_lookups", default=None)
+
+
+def start_request_lookups() -> RequestLookups:
+    """Share lookups between everything the current request runs from here on."""
+    lookups = RequestLookups()
+    _request_lookups.set(lookups)
+    return lookups
+
+
+@contextmanager
+def request_lookups() -> Iterator[RequestLookups]:
+    """The lookups of the current request, or new ones for the duration of the block."""
+    lookups = _request_lookups.get()
+    if lookups is not None:
+        yield lookups
+        return
+    token = _request_lookups.set(RequestLookups())
+    try:
+        yield _request_lookups.get()
+    finally:
+        _request_lookups.reset(token)
+
 
 class CustomVectorStoreRetriever(BaseRetriever):
     """Retriever class for VectorStore."""
@@ -20,6 +69,10 @@ class CustomVectorStoreRetriever(BaseRetriever):
     """Type of search to perform. Defaults to "similarity"."""
     search_kwargs: dict = Field(default_factory=dict)
     """Keyword arguments to pass to the search function."""
+    embeddings: Optional[Embeddings] = None
+    """Embeddings the vectorstore was loaded with, used for async query embedding."""
+    lexical_index: Optional[LexicalIndex] = None
+    """BM25 index of the vectorstore documents, checked before embedding the query."""
     allowed_search_types: ClassVar[Collection[str]] = (
         "similarity",
         "similarity_score_threshold",
@@ -49,9 +102,45 @@ class CustomVectorStoreRetriever(BaseRetriever):
                 )
         return values
 
+    def lexical_search(self, query: str) -> Optional[List]:
+        """High-confidence lexical hits for the query, or None to search by vector.
+
+        The result is kept in the request lookups, if any.
+        """
+        if self.lexical_index is None:
+            return None
+
+        lookups = _request_lookups.get()
+        if lookups is None:
+            return self._lexical_search(query)
+        key = (id(self.lexical_index), self.search_kwargs.get("k", 4), query)
+        if key not in lookups.lexical:
+            lookups.lexical[key] = self._lexical_search(query)
+        return lookups.lexical[key]
+
+    def _lexical_search(self, query: str) -> Optional[List]:
+        name = self.metadata["name"] if self.metadata else "default"
+        start = time.perf_counter()
+        docs_with_scores = self.lexical_index.match(
+            query,
+            k=self.search_kwargs.get("k", 4),
+            threshold=LangChainOpenAIConstants.LEXICAL_MATCH_THRESHOLD,
+        )
+        metrics.observe(f"lexical.{name}.seconds", time.perf_counter() - start)
+        metrics.incr(f"lexical.{name}.hits" if docs_with_scores else f"lexical.{name}.misses")
+        return docs_with_scores or None
+
+    def has_lexical_match(self, query: str) -> bool:
+        """Whether `lexical_search` answers the query without embedding it."""
+        return self.lexical_search(query) is not None
+
     def _get_relevant_documents(
         self, query: str, *, run_manager: CallbackManagerForRetrieverRun
     ) -> List:
+        docs_with_scores = self.lexical_search(query)
+        if docs_with_scores is not None:
+            return docs_with_scores
+
         if self.search_type == "similarity":
             docs_with_scores = self.vectorstore.similarity_search_with_score(
                 query, **self.search_kwargs
@@ -73,39 +162,70 @@ class CustomVectorStoreRetriever(BaseRetriever):
 
         return docs_with_scores
 
-    async def _aget_relevant_documents(
-        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
-    ) -> List:
-        if self.search_type == "similarity":
-            func = partial(
-                self.vectorstore.similarity_search_with_score,
-                query,
-                **self.search_kwargs,
-            )
-            docs_with_scores = await asyncio.get_event_loop().run_in_executor(
-                None, func
-            )
-        elif self.search_type == "similarity_score_threshold":
-            func = partial(
-                self.vectorstore.similarity_search_with_relevance_scores,
-                query,
-                **self.search_kwargs,
+    async def aembed_query(self, query: str) -> List[float]:
+        """Embed the query with the embeddings the vectorstore was loaded with."""
+        start = time.perf_counter()
+        if self.embeddings is not None:
+            embedding = await self.embeddings.aembed_query(query)
+        else:
+            embedding = await asyncio.get_event_loop().run_in_executor(
+                None, self.vectorstore.embedding_function, query
             )
+        metrics.observe("retrieval_chain.embed_seconds", time.perf_counter() - start)
+        return embedding
 
-            docs_with_scores = await asyncio.get_event_loop().run_in_executor(
-                None, func
+    async def aembed_query_once(self, query: str) -> List[float]:
+        """`aembed_query`, embedding each question once per request."""
+        lookups = _request_lookups.get()
+        if lookups is None:
+            return await self.aembed_query(query)
+        future = lookups.embeddings.get(query)
+        if future is None:
+            future = lookups.embeddings[query] = asyncio.ensure_future(self.aembed_query(query))
+        # shield keeps a cancelled chain from cancelling it for the others.
+        return await asyncio.shield(future)
+
+    def _search_by_vector(self, embedding: List[float]) -> List:
+        if self.search_type == "similarity":
+            docs_with_scores = self.vectorstore.similarity_search_with_score_by_vector(
+                embedding, **self.search_kwargs
             )
+        elif self.search_type == "similarity_score_threshold":
+            search_kwargs = dict(self.search_kwargs)
+            score_threshold = search_kwargs.pop("score_threshold")
+            relevance_score_fn = self.vectorstore._select_relevance_score_fn()
+            docs_with_scores = [
+                (doc, relevance_score_fn(score))
+                for doc, score in self.vectorstore.similarity_search_with_score_by_vector(
+                    embedding, **search_kwargs
+                )
+            ]
+            docs_with_scores = [
+                (doc, score) for doc, score in docs_with_scores if score >= score_threshold
+            ]
         elif self.search_type == "mmr":
-            embedding = self.vectorstore.embedding_function(query)
-            func = partial(
-                self.vectorstore.max_marginal_relevance_search_with_score_by_vector,
-                embedding,
-                **self.search_kwargs,
-            )
-            docs_with_scores = await asyncio.get_event_loop().run_in_executor(
-                None, func
+            docs_with_scores = (
+                self.vectorstore.max_marginal_relevance_search_with_score_by_vector(
+                    embedding, **self.search_kwargs
+                )
             )
         else:
             raise ValueError(f"search_type of {self.search_type} not allowed.")
 
         return docs_with_scores
+
+    async def aget_relevant_documents_by_vector(self, embedding: List[float]) -> List:
+        """Search with a precomputed query embedding, skipping the embedding call."""
+        return await asyncio.get_event_loop().run_in_executor(
+            None, self._search_by_vector, embedding
+        )
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List:
+        docs_with_scores = self.lexical_search(query)
+        if docs_with_scores is not None:
+            return docs_with_scores
+
+        embedding = await self.aembed_query_once(query)
+        return await self.aget_relevant_documents_by_vector(embedding)
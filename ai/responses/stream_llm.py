@@ -5,6 +5,7 @@ Credits:
 """
 import enum
 import functools
+import re
 from typing import Any, Awaitable, Callable, Dict, Optional, Union
 
 from fastapi.responses import StreamingResponse
@@ -120,6 +121,25 @@ class BaseLangchainStreamingResponse(StreamingResponse):
             background=background,
             **kwargs,
         )
+
+    @classmethod
+    def from_text(
+        cls,
+        text: str,
+        background: Optional[BackgroundTask] = None,
+        **kwargs: Any,
+    ) -> "BaseLangchainStreamingResponse":
+        """Stream a ready answer word by word, the way chain answers are streamed."""
+        async def chain_executor(send: Send):
+            for token in re.findall(r"\S+\s*|\s+", text):
+                await send(token)
+            return {"answer": text}
+
+        return cls(
+            chain_executor=chain_executor,
+            background=background,
+            **kwargs,
+        )
     
 class ConversationalRetrievalStreamingResponse(BaseLangchainStreamingResponse):
     """BaseLangchainStreamingResponse class wrapper for ConversationalRetrievalStreamingResponse instances."""
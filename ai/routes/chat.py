@@ -1,18 +1,43 @@
+import asyncio
+import contextlib
 import logging
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from uuid import UUID
 
 from langchain import LLMChain
-from langchain.callbacks import get_openai_callback
+from langchain.callbacks import OpenAICallbackHandler, get_openai_callback
 from langchain.memory import ConversationBufferMemory
+from langchain.retrievers import MergerRetriever
+from langchain.schema import LLMResult
 from langdetect import detect
+from starlette.background import BackgroundTask
 
 from ai.callback.handler.stream_llm import StreamingLLMCallbackHandler
+from ai.core.answer_cache import CachedAnswer
+from ai.core.constants import LangChainOpenAIConstants
+from ai.core.metrics import metrics
+from ai.core.response_cache import ResponseCache, fingerprint
+from ai.core.sensor_store import sensor_store
 from ai.core.utils import check_goodbye, check_hello, preprocess_suggestion_request
-from ai.llm.base_model.langchain_openai import LangchainOpenAI
+from ai.core.vectorstore_registry import vectorstore_registry
+from ai.llm.base_model.langchain_openai import LangchainOpenAI, answer_cache
 from ai.llm.data_loader.load_langchain_config import LangChainDataLoader
-from ai.responses.stream_llm import ConversationalRetrievalStreamingResponse
+from ai.llm.data_loader.vectorestore_retriever import start_request_lookups
+from ai.responses.stream_llm import (
+    BaseLangchainStreamingResponse,
+    ConversationalRetrievalStreamingResponse,
+)
 from ai.schemas.schemas import QARequest
+from config.config import Settings
 from config.constants import ErrorChatMessage
 
+response_cache = ResponseCache(
+    max_size=Settings().RESPONSE_CACHE_SIZE,
+    ttl_seconds=Settings().RESPONSE_CACHE_TTL_SECONDS,
+)
+metrics.register_provider("response_cache", response_cache.stats)
+
 
 async def chat(request: QARequest) -> str:
     processed_request = preprocess_suggestion_request(request)
@@ -20,6 +45,17 @@ async def chat(request: QARequest) -> str:
     question = processed_request.get("question")
     language = processed_request.get("language")
 
+    # Structured sensor questions are answered from the in-memory readings,
+    # which are always fresher than a cached answer.
+    sensor_answer = sensor_store.answer(question, language=language or "Vietnamese")
+    if sensor_answer is not None:
+        return sensor_answer
+
+    response_key = _response_cache_key(processed_request)
+    cached_answer = response_cache.get(response_key)
+    if cached_answer is not None:
+        return cached_answer
+
     if check_hello(question):
         chain = LLMChain(
             llm=LangchainOpenAI.load_llm_model()[2],
@@ -70,6 +106,24 @@ async def chat(request: QARequest) -> str:
             #         )
             #     return output["answer"]
 
+            # Shared by both tiers so the question is embedded only once.
+            start_request_lookups()
+
+            # Follow-up questions depend on the history, so only standalone
+            # questions go through the answer cache.
+            cache_entry = None
+            if not chat_history:
+                cached, cache_entry = await _lookup_answer_cache(
+                    chain, chain.diamond_retriever, question
+                )
+                if cached is not None:
+                    return cached.answer
+
+            if Settings().SPECULATIVE_CHAT:
+                answer = await speculative_chat(chain, question, chat_history)
+                _store_answer(response_key, cache_entry, question, answer, chain.lang, cb.total_tokens)
+                return answer
+
             qa_chain = chain.get_diamond_chain()
             result = await qa_chain.acall(
                 {
@@ -78,7 +132,7 @@ async def chat(request: QARequest) -> str:
                     "dataset": "diamond",
                 }
             )
-            if result["answer"] == "NO DATA":
+            if result["answer"] == LangChainOpenAIConstants.DIAMOND_NO_DATA_ANSWER:
                 qa_chain = chain.get_chain()
                 response = await qa_chain.acall(
                     {
@@ -88,7 +142,10 @@ async def chat(request: QARequest) -> str:
                     }
                 )
             else:
-                return result["answer"]
+                response = result
+            _store_answer(
+                response_key, cache_entry, question, response["answer"], chain.lang, cb.total_tokens
+            )
 
     except Exception as e:
         logging.exception(e)
@@ -98,6 +155,180 @@ async def chat(request: QARequest) -> str:
     return response["answer"]
 
 
+async def _lookup_answer_cache(
+    chain: LangchainOpenAI, retriever: MergerRetriever, question: str
+) -> Tuple[Optional[CachedAnswer], Optional[Tuple[List[float], Hashable, Hashable]]]:
+    """Look the question up in the answer cache.
+
+    `retriever` is the first one the chain queries. When its lexical index
+    answers the question, the chain never embeds it, so neither does the
+    cache and the question is not cached. The lexical hits and the embedding
+    are kept in the request lookups, so on a miss the chains reuse them
+    instead of searching or embedding the question again. Returns the hit,
+    and what `_store_answer` needs to cache the answer.
+    """
+    if retriever.retrievers[0].lexical_search(question) is not None:
+        metrics.incr("answer_cache.lexical_skips")
+        return None, None
+
+    embedding = await chain.vectorstore_retriever.retrievers[0].aembed_query_once(question)
+    # Answers are only valid for the knowledge base and prompts they came from.
+    context = (
+        LangchainOpenAI.prompt_version(),
+        tuple(sorted(vectorstore_registry.versions().items())),
+    )
+    entities = sensor_store.entities(question)
+    return answer_cache.get(embedding, chain.lang, context, entities), (embedding, context, entities)
+
+
+def _response_cache_key(processed_request: dict) -> str:
+    # The published index versions are read from disk, so a new knowledge
+    # base version is seen even while every request is a cache hit. Answers
+    # about "today" are keyed on the date, so they are not replayed tomorrow.
+    return fingerprint(
+        processed_request.get("question"),
+        processed_request.get("chat_history"),
+        processed_request.get("language"),
+        LangchainOpenAI.prompt_version(),
+        sorted(vectorstore_registry.current_versions().items()),
+        sensor_store.entities(processed_request.get("question"))[2],
+    )
+
+
+def _store_answer(
+    response_key: str,
+    cache_entry: Optional[Tuple[List[float], Hashable, Hashable]],
+    question: str,
+    answer: Optional[str],
+    language: str,
+    tokens: int,
+):
+    if not answer:
+        return
+    response_cache.set(response_key, answer)
+    if cache_entry is None:
+        return
+    embedding, context, entities = cache_entry
+    answer_cache.add(
+        embedding,
+        CachedAnswer(question=question, answer=answer, language=language, tokens=tokens, entities=entities),
+        context,
+    )
+
+
+def _store_streamed_answer(
+    response_key: str,
+    cache_entry: Optional[Tuple[List[float], Hashable, Hashable]],
+    question: str,
+    language: str,
+    stream_handler: StreamingLLMCallbackHandler,
+    outputs: Any = None,
+):
+    # `outputs` is the error message when the chain failed.
+    if isinstance(outputs, dict):
+        _store_answer(
+            response_key, cache_entry, question, outputs.get("answer"), language, stream_handler.total_tokens
+        )
+
+
+class _SpeculativeCallbackHandler(OpenAICallbackHandler):
+    """Token usage of a tier, including calls that never finished.
+
+    A cancelled OpenAI call reports no usage, so the prompt of every call
+    still in flight is counted with `count_tokens` as a lower-bound estimate
+    of what it cost.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int]):
+        super().__init__()
+        self._count_tokens = count_tokens
+        self._in_flight: Dict[UUID, int] = {}
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self._in_flight[kwargs["run_id"]] = sum(self._count_tokens(prompt) for prompt in prompts)
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        self._in_flight.pop(kwargs["run_id"], None)
+        super().on_llm_end(response, **kwargs)
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        self._in_flight.pop(kwargs["run_id"], None)
+
+    @property
+    def estimated_tokens(self) -> int:
+        return self.total_tokens + sum(self._in_flight.values())
+
+
+async def _timed_acall(qa_chain, inputs: dict, callbacks: list) -> Tuple[dict, float]:
+    start = time.perf_counter()
+    result = await qa_chain.acall(inputs, callbacks=callbacks)
+    return result, time.perf_counter() - start
+
+
+async def speculative_chat(
+    chain: LangchainOpenAI, question: str, chat_history: list
+) -> str:
+    """Run the diamond and knowledge-base tiers at once and keep the winner.
+
+    The diamond answer wins when it is a hit and the knowledge-base tier is
+    cancelled; otherwise the knowledge-base answer is awaited. Latency saved
+    against the sequential path and tokens spent on the losing tier are
+    recorded in metrics; the latter is estimated from the prompt size for
+    calls cut off before reporting their usage.
+    """
+    diamond_cb = OpenAICallbackHandler()
+    normal_cb = _SpeculativeCallbackHandler(chain.llm_model.get_num_tokens)
+    start = time.perf_counter()
+
+    diamond_task = asyncio.create_task(
+        _timed_acall(
+            chain.get_diamond_chain(),
+            {
+                "question": question,
+                "chat_history": chat_history,
+                "dataset": "diamond",
+            },
+            callbacks=[diamond_cb],
+        )
+    )
+    normal_task = asyncio.create_task(
+        _timed_acall(
+            chain.get_chain(),
+            {
+                "question": question,
+                "chat_history": chat_history,
+                "dataset": "normal",
+            },
+            callbacks=[normal_cb],
+        )
+    )
+
+    try:
+        result, diamond_seconds = await diamond_task
+        if result["answer"] != LangChainOpenAIConstants.DIAMOND_NO_DATA_ANSWER:
+            normal_task.cancel()
+            # Let the knowledge-base tier unwind so usage reported while it is
+            # cancelled is counted; its outcome no longer matters.
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await normal_task
+            metrics.incr("speculative_chat.diamond_hits")
+            metrics.incr("speculative_chat.wasted_tokens", normal_cb.estimated_tokens)
+            return result["answer"]
+
+        response, normal_seconds = await normal_task
+        # The sequential path would have run both tiers back to back.
+        metrics.incr("speculative_chat.diamond_misses")
+        metrics.observe(
+            "speculative_chat.latency_saved_seconds",
+            diamond_seconds + normal_seconds - (time.perf_counter() - start),
+        )
+        return response["answer"]
+    finally:
+        for task in (diamond_task, normal_task):
+            if not task.done():
+                task.cancel()
+
+
 async def stream_chat(request: QARequest):
     try:
         processed_request = preprocess_suggestion_request(request)
@@ -105,23 +336,60 @@ async def stream_chat(request: QARequest):
         question = processed_request.get("question")
         language = processed_request.get("language")
 
-        qa_chain = LangchainOpenAI(
+        sensor_answer = sensor_store.answer(question, language=language or "Vietnamese")
+        if sensor_answer is not None:
+            return BaseLangchainStreamingResponse.from_text(
+                sensor_answer, media_type="text/event-stream"
+            )
+
+        response_key = _response_cache_key(processed_request)
+        cached_answer = response_cache.get(response_key)
+        if cached_answer is not None:
+            return BaseLangchainStreamingResponse.from_text(
+                cached_answer, media_type="text/event-stream"
+            )
+
+        chain = LangchainOpenAI(
             question=question,
             metadata=processed_request.get("metadata"),
             language=language,
-        ).get_stream_chain(stream_handler=StreamingLLMCallbackHandler())
+        )
+        stream_handler = StreamingLLMCallbackHandler()
+        qa_chain = chain.get_stream_chain(stream_handler=stream_handler)
 
         chat_history = processed_request.get("chat_history")
 
+        inputs = {
+            "question": processed_request.get("question"),
+            "chat_history": chat_history,
+        }
+        cache_entry = None
+
         if check_hello(question):
-            chat_history = ""
+            inputs["chat_history"] = ""
+        elif not chat_history:
+            start_request_lookups()
+            cached, cache_entry = await _lookup_answer_cache(
+                chain, chain.vectorstore_retriever, question
+            )
+            if cached is not None:
+                return BaseLangchainStreamingResponse.from_text(
+                    cached.answer, media_type="text/event-stream"
+                )
+
+        background = BackgroundTask(
+            _store_streamed_answer,
+            response_key=response_key,
+            cache_entry=cache_entry,
+            question=question,
+            language=chain.lang,
+            stream_handler=stream_handler,
+        )
 
         return ConversationalRetrievalStreamingResponse.from_chain(
             qa_chain,
-            {
-                "question": processed_request.get("question"),
-                "chat_history": chat_history,
-            },
+            inputs,
+            background=background,
             media_type="text/event-stream",
         )
 
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+
+from ai.core.metrics import metrics
+
+router = APIRouter()
+
+
+@router.get("")
+async def get_metrics():
+    return metrics.snapshot()
@@ -1,26 +1,36 @@
+import hashlib
 import logging
-from fastapi import APIRouter, Body, Depends, HTTPException, BackgroundTasks
+import shutil
+from typing import List
+from uuid import UUID, uuid4
+from fastapi import APIRouter, Body, Depends, HTTPException, BackgroundTasks, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
+from pymongo.errors import DuplicateKeyError
 
 from config.config import Settings
 import csv
 import os
 import asyncio
-from ai.schemas.schemas import ImportFileRequest, ImportMultipleFilesRequest, ImportSensorDataRequest
+from ai.schemas.schemas import (
+    ImportFileRequest,
+    ImportMultipleFilesRequest,
+    ImportSensorDataRequest,
+    IngestJobStatusResponse,
+)
 from ai.core.data_ingestor import DataIngestor
 from ai.core.constants import IngestDataConstants
+from ai.core.ingest_jobs import ingest_job_queue
+from ai.schemas.db_model import IngestJob, IngestJobFile
 
 OPENAI_API_KEY = Settings().OPENAI_API_KEY
 MAX_FILE_SIZE = IngestDataConstants.MAX_FILE_SIZE
 ALLOWED_EXTENSIONS = IngestDataConstants.ALLOWED_EXTENSIONS
+UPLOAD_CHUNK_SIZE = IngestDataConstants.UPLOAD_CHUNK_SIZE
 
 router = APIRouter()
 
-@router.post("/import-file")
-async def import_file(request: ImportFileRequest = Depends()):
-    file = request.file
-    lang = request.lang
-
+def validate_upload(file: UploadFile) -> str:
     file_size = os.fstat(file.file.fileno()).st_size
 
     if file_size > MAX_FILE_SIZE:
@@ -32,63 +42,113 @@ async def import_file(request: ImportFileRequest = Depends()):
             status_code=400,
             detail="Invalid file format. Only PDF, CSV, TXT and XLSX files are allowed.",
         )
-    
-    data_ingestor = DataIngestor(lang=lang)
-    data_ingestor_fn = {
-        "pdf": data_ingestor.ingest_pdf,
-        "json": data_ingestor.ingest_json
-    }
-
+    return file_extension
+
+async def save_upload(file: UploadFile, file_extension: str, folder: str, index: int) -> IngestJobFile:
+    """Stream the upload to disk in fixed-size chunks, hashing it on the way."""
+    os.makedirs(folder, exist_ok=True)
+    file_path = os.path.join(folder, f"{index}.{file_extension}")
+    sha256 = hashlib.sha256()
+    size = 0
+
+    with open(file_path, "wb") as f:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_FILE_SIZE:
+                f.close()
+                shutil.rmtree(folder, ignore_errors=True)
+                raise HTTPException(status_code=413, detail="File size exceeds the allowed limit")
+            sha256.update(chunk)
+            f.write(chunk)
+
+    return IngestJobFile(
+        filename=file.filename,
+        path=file_path,
+        extension=file_extension,
+        sha256=sha256.hexdigest(),
+        size=size,
+    )
+
+async def _without_duplicates(job_files: List[IngestJobFile], duplicates: List[dict]) -> List[IngestJobFile]:
+    """Drop the files already ingested or being ingested, adding them to `duplicates`."""
+    new_files, hashes = [], set()
+    for job_file in job_files:
+        existing_job = await ingest_job_queue.find_by_hash(job_file.sha256)
+        if existing_job is not None or job_file.sha256 in hashes:
+            os.remove(job_file.path)
+            # Repeated within the upload: filled in with the new job's id.
+            job_id = str(existing_job.id) if existing_job is not None else None
+            duplicates.append({"filename": job_file.filename, "jobId": job_id})
+        else:
+            hashes.add(job_file.sha256)
+            new_files.append(job_file)
+    return new_files
+
+async def enqueue_uploads(files: List[UploadFile], lang: str) -> JSONResponse:
+    """Save the uploads and enqueue the ones that were not ingested before."""
+    file_extensions = [validate_upload(file) for file in files]
+
+    job_id = uuid4()
+    folder = ingest_job_queue.upload_folder(job_id)
+    job_files, duplicates = [], []
     try:
-        file_path = os.path.join(IngestDataConstants.TEMP_UPLOADED_FOLDER, "temp." + file_extension)
-
-        with open(file_path, "wb", encoding='utf-8') as f:
-            contents = await file.read()
-            f.write(contents)
+        for index, (file, file_extension) in enumerate(zip(files, file_extensions)):
+            job_files.append(await save_upload(file, file_extension, folder, index))
+
+        job = None
+        while job is None:
+            job_files = await _without_duplicates(job_files, duplicates)
+            if not job_files:
+                shutil.rmtree(folder, ignore_errors=True)
+                return JSONResponse(status_code=200, content={"jobId": None, "duplicates": duplicates})
+            try:
+                job = await ingest_job_queue.enqueue(job_files, lang=lang, job_id=job_id)
+            except DuplicateKeyError:
+                # A concurrent upload of one of the files was enqueued first.
+                continue
+        for duplicate in duplicates:
+            duplicate["jobId"] = duplicate["jobId"] or str(job.id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        shutil.rmtree(folder, ignore_errors=True)
+        return JSONResponse(status_code=500, content={"errorCode": 500, "errorMessage": str(e)})
 
-        metadata = data_ingestor_fn[file_extension](file_path)
-        metadata = {} if metadata is None else metadata
+    return JSONResponse(status_code=202, content={"jobId": str(job.id), "duplicates": duplicates})
 
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"errorCode": 500, "errorMessage": e})
-    
-    return JSONResponse(status_code=200, content={"Add Document To VectorDB Successfully!"})
+@router.post("/import-file")
+async def import_file(request: ImportFileRequest = Depends()):
+    return await enqueue_uploads([request.file], lang=request.lang)
 
 @router.post("/import-multi-files")
 async def import_multi_files(
     request: ImportMultipleFilesRequest=Depends()
 ):
-    files = request.files
-    lang = request.lang
+    return await enqueue_uploads(request.files, lang=request.lang)
 
-    try:
-        for file in files:
-            import_file_request = ImportFileRequest(file=file, lang = lang)
-            await import_file(request=import_file_request)
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"errorCode": 500, "errorMessage": e})
-    
-    return JSONResponse(status_code=200, content={"Add Document To VectorDB Successfully!"})
+@router.get("/jobs/{id}", response_model=IngestJobStatusResponse)
+async def get_ingest_job(id: UUID):
+    job = await IngestJob.get(id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return IngestJobStatusResponse.from_job(job)
 
 @router.post("/import-sensor-data-question")
 async def import_sensor_data_question(question: str, id: str):
     data_ingestor = DataIngestor()
     try:
-        data_ingestor.load_sensor_data_question(question, id)
+        await run_in_threadpool(data_ingestor.load_sensor_data_question, question, id)
     except Exception as e:
         logging.error(e)
 
 async def import_data():
     try:
-        with open('files/sensordata.csv', 'r', encoding='utf-8') as file:
-            csvreader = csv.reader(file)
-            data = []
-            for row in csvreader:
-                data.append({"id": row[0], "question": row[1]})
-
-        for idx, question in enumerate(data):
-            print("INDEX", idx)
-            await import_sensor_data_question(question["question"], question["id"])
+        with open(IngestDataConstants.SENSOR_DATA_CSV, 'r', encoding='utf-8') as file:
+            rows = ({"id": row[0], "question": row[1]} for row in csv.reader(file))
+            await run_in_threadpool(DataIngestor().bulk_load_sensor_data_questions, rows)
         print("DONE")
     except Exception as e:
         logging.error(e)
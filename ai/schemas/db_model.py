@@ -1,7 +1,10 @@
 from uuid import UUID, uuid4
 from beanie import Document
-from pydantic import Field
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, IndexModel
 from datetime import datetime
+from enum import Enum
+from typing import Dict, List, Optional
 
 class SensorDataLib(Document):
     id: UUID = Field(default_factory=uuid4)
@@ -29,3 +32,90 @@ class SensorDataLib(Document):
 
     class Settings:
         name = "sensor_data_lib"
+
+
+class SensorDataVersion(Document):
+    """Bumped after every load of SensorDataLib, so each process can tell
+    whether its in-memory copy of the readings is stale."""
+    id: str
+    version: int = 0
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+    class Settings:
+        name = "sensor_data_versions"
+
+
+class IngestJobStatus(str, Enum):
+    pending = 'pending'
+    running = 'running'
+    completed = 'completed'
+    failed = 'failed'
+
+
+class IngestJobFile(BaseModel):
+    filename: str
+    path: str
+    extension: str
+    sha256: Optional[str]
+    size: Optional[int]
+
+
+class IngestJob(Document):
+    id: UUID = Field(default_factory=uuid4)
+    lang: str = ""
+    files: List[IngestJobFile]
+    status: IngestJobStatus = IngestJobStatus.pending
+    stage: str = "queued"
+    progress: float = 0
+    files_done: int = 0
+    num_chunks: int = 0
+    num_skipped_chunks: int = 0
+    timings: Dict[str, float] = Field(default_factory=dict)
+    error: Optional[str]
+    created_at: datetime = Field(default_factory=datetime.now)
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    # Hashes of the files while the job has not failed, unique across jobs,
+    # so two concurrent uploads of a file cannot both be enqueued.
+    content_hashes: List[str] = Field(default_factory=list)
+    # Worker holding the job while it runs, until `lease_until`.
+    worker: Optional[str]
+    lease_until: Optional[datetime]
+
+    class Config:
+        arbitrary_types_allowed = True
+        json_schema_extra = {
+            "example": {
+                "id": "aaa23890-6d64-46e3-a60c-00f08c5fd51e",
+                "lang": "vi",
+                "files": [
+                    {
+                        "filename": "report.pdf",
+                        "path": "tmp/uploaded/aaa23890-6d64-46e3-a60c-00f08c5fd51e/0.pdf",
+                        "extension": "pdf",
+                        "sha256": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08",
+                        "size": 1048576
+                    }
+                ],
+                "status": "running",
+                "stage": "embedding",
+                "progress": 0.5,
+                "files_done": 0,
+                "num_chunks": 64,
+                "num_skipped_chunks": 0,
+                "timings": {"parsing": 1.2, "embedding": 3.4, "indexing": 0.1}
+            }
+        }
+
+    class Settings:
+        name = "ingest_jobs"
+        indexes = [
+            "files.sha256",
+            "status",
+            IndexModel(
+                [("content_hashes", ASCENDING)],
+                unique=True,
+                # Jobs without hashes, failed or older ones, are left out.
+                partialFilterExpression={"content_hashes": {"$type": "string"}},
+            ),
+        ]
@@ -1,7 +1,11 @@
-from typing import Annotated, Optional
+from datetime import datetime
+from typing import Annotated, Dict, List, Optional
+from uuid import UUID
 from fastapi import Body, File, UploadFile
 from pydantic import BaseModel
 
+from ai.schemas.db_model import IngestJob, IngestJobStatus
+
 class ImportFileRequest(BaseModel):
     file: Annotated[
         UploadFile,
@@ -43,3 +47,39 @@ class ImportSensorDataRequest(BaseModel):
     ]
     """
     questions: list = Body(None, description="list of questions with ids")
+
+
+class IngestJobStatusResponse(BaseModel):
+    """Public status of an ingest job, without server paths or worker leases."""
+    id: UUID
+    filenames: List[str]
+    status: IngestJobStatus
+    stage: str
+    progress: float
+    files_done: int
+    num_chunks: int
+    num_skipped_chunks: int
+    timings: Dict[str, float]
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    @classmethod
+    def from_job(cls, job: IngestJob) -> "IngestJobStatusResponse":
+        return cls(filenames=[file.filename for file in job.files], **job.dict(exclude={"files"}))
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "id": "aaa23890-6d64-46e3-a60c-00f08c5fd51e",
+                "filenames": ["report.pdf"],
+                "status": "running",
+                "stage": "embedding",
+                "progress": 0.5,
+                "files_done": 0,
+                "num_chunks": 64,
+                "num_skipped_chunks": 0,
+                "timings": {"parsing": 1.2, "embedding": 3.4, "indexing": 0.1}
+            }
+        }
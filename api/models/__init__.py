@@ -2,6 +2,6 @@ from api.models.user import User
 from api.models.conversation import Conversation
 from api.models.message import Message
 from api.models.feedback import Feedback
-from ai.schemas.db_model import SensorDataLib
+from ai.schemas.db_model import IngestJob, SensorDataLib, SensorDataVersion
 
-__all__ = [User, Conversation, Message, Feedback, SensorDataLib]
+__all__ = [User, Conversation, Message, Feedback, SensorDataLib, SensorDataVersion, IngestJob]
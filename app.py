@@ -1,11 +1,15 @@
 import logging
 
 from fastapi import Depends, FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_paginate import add_pagination
 
 from ai.core.aws_service import AWSService
 from ai.core.db_builder import db_builder
+from ai.core.ingest_jobs import ingest_job_queue
+from ai.core.sensor_store import sensor_store
+from ai.routes.metrics import router as MetricsRouter
 from ai.routes.retrieval_system import router as DataIngestorRouter
 from api.auth.jwt_bearer import JWTBearer
 from api.database import initiate_database
@@ -15,6 +19,7 @@ from api.routes.conversation import router as ConversationRouter
 from api.routes.feedback import router as FeedbackRouter
 from api.routes.me import router as MeRouter
 from api.routes.message import router as MessageRouter
+from config.config import Settings
 
 logging.basicConfig(level=logging.INFO)
 
@@ -36,10 +41,17 @@ app.add_middleware(
 @app.on_event("startup")
 async def start_database():
     await initiate_database()
+    if Settings().S3_SYNC_ON_STARTUP:
+        # Pull the vectorstores changed since the last sync before serving.
+        await run_in_threadpool(AWSService().download_from_s3)
+    await ingest_job_queue.start(Settings().INGEST_WORKERS)
+    await sensor_store.start()
 
 
-# s3_client = AWSService()
-# s3_client.download_from_s3()
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await ingest_job_queue.stop()
+    await sensor_store.stop()
 
 
 @app.get("/", tags=["Root"])
@@ -49,8 +61,8 @@ async def read_root():
 
 @app.get("/insert-sensordata", tags=["Data"])
 async def insert_sensordata():
-    await db_builder()
-    return {"status": True}
+    stats = await db_builder()
+    return {"status": True, **stats}
 
 
 app.include_router(AuthRouter, tags=["Auth"], prefix="/v1/auth")
@@ -87,5 +99,11 @@ app.include_router(
     prefix="/v1/ingest",
     dependencies=[Depends(token_listener)],
 )
+app.include_router(
+    MetricsRouter,
+    tags=["Metrics"],
+    prefix="/v1/metrics",
+    dependencies=[Depends(token_listener)],
+)
 
 add_pagination(app)
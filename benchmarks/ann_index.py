@@ -0,0 +1,85 @@
+"""
+Compare approximate index types against the exact flat baseline.
+
+Vectors come from an existing vectorstore (or are generated with --synthetic).
+A held-out set of them is used as queries: each index type is built over the
+rest, and recall@k against exact search, p50/p99 search latency, build time and
+serialized index size are reported.
+
+Usage (from the repository root):
+    python -m benchmarks.ann_index --folder files/vectorstores --queries 200 --k 5
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from ai.core.faiss_io import build_index
+
+INDEX_CONFIGS = {
+    "flat": {"type": "flat"},
+    "hnsw": {"type": "hnsw", "M": 32, "efConstruction": 40, "efSearch": 64},
+    "ivf_flat": {"type": "ivf_flat", "nprobe": 8},
+    "ivf_pq": {"type": "ivf_pq", "nprobe": 8, "m": 64, "nbits": 8},
+}
+
+
+def load_vectors(args) -> np.ndarray:
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((args.synthetic, args.dimension)).astype("float32")
+    else:
+        index = faiss.read_index(f"{args.folder}/index.faiss")
+        vectors = index.reconstruct_n(0, index.ntotal)
+    # OpenAI embeddings are unit length.
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def search_latencies(index: faiss.Index, queries: np.ndarray, k: int):
+    labels, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        labels.append(ids[0])
+    return np.array(labels), np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", default="files/vectorstores")
+    parser.add_argument("--synthetic", type=int, default=0, help="generate this many random vectors instead")
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    rng = np.random.default_rng(1)
+    order = rng.permutation(len(vectors))
+    queries, base = vectors[order[: args.queries]], vectors[order[args.queries :]]
+
+    ground_truth = None
+    print(f"{'index':<10}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p99 ms':>10}{'build s':>10}{'size MB':>10}")
+    for name, config in INDEX_CONFIGS.items():
+        start = time.perf_counter()
+        index = build_index(base, config)
+        build_seconds = time.perf_counter() - start
+
+        labels, latencies = search_latencies(index, queries, args.k)
+        if ground_truth is None:
+            ground_truth = labels
+        recall = np.mean(
+            [len(set(found) & set(expected)) / args.k for found, expected in zip(labels, ground_truth)]
+        )
+        size_mb = faiss.serialize_index(index).nbytes / 1024 / 1024
+        print(
+            f"{name:<10}{recall:>10.3f}{np.percentile(latencies, 50):>10.3f}"
+            f"{np.percentile(latencies, 99):>10.3f}{build_seconds:>10.2f}{size_mb:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
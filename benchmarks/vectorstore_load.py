@@ -0,0 +1,88 @@
+"""
+Compare the in-memory and mmap FAISS loaders across several worker processes.
+
+Each worker loads the same vectorstore, runs one query with a random vector and
+reports its RSS, its proportional set size (shared pages divided between the
+processes mapping them) and the load + first-query latency.
+
+Usage (from the repository root):
+    python -m benchmarks.vectorstore_load --folder files/vectorstores --workers 4
+"""
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+from langchain.embeddings import FakeEmbeddings
+
+from ai.core.faiss_io import LOAD_MODE_MEMORY, LOAD_MODE_MMAP, load_faiss
+
+
+def _read_proc_kb(path: str, field: str) -> int:
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return -1
+
+
+def _worker(folder: str, mode: str, barrier, results):
+    start = time.perf_counter()
+    vectorstore = load_faiss(folder, FakeEmbeddings(size=1), mode=mode)
+    load_seconds = time.perf_counter() - start
+
+    query = np.random.rand(vectorstore.index.d).astype("float32").tolist()
+    start = time.perf_counter()
+    vectorstore.similarity_search_with_score_by_vector(query, k=5)
+    first_query_seconds = time.perf_counter() - start
+
+    # Measure while every worker still holds its index.
+    barrier.wait()
+    results.put(
+        {
+            "load_ms": load_seconds * 1000,
+            "first_query_ms": first_query_seconds * 1000,
+            "rss_mb": _read_proc_kb("/proc/self/status", "VmRSS") / 1024,
+            "pss_mb": _read_proc_kb("/proc/self/smaps_rollup", "Pss") / 1024,
+        }
+    )
+    barrier.wait()
+
+
+def run(folder: str, mode: str, workers: int) -> list:
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(folder, mode, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", default="files/vectorstores")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'rss/worker MB':>15}{'pss/worker MB':>15}{'load ms':>10}{'first query ms':>16}")
+    for mode in (LOAD_MODE_MEMORY, LOAD_MODE_MMAP):
+        samples = run(args.folder, mode, args.workers)
+        average = {key: sum(s[key] for s in samples) / len(samples) for key in samples[0]}
+        print(
+            f"{mode:<8}{average['rss_mb']:>15.1f}{average['pss_mb']:>15.1f}"
+            f"{average['load_ms']:>10.1f}{average['first_query_ms']:>16.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
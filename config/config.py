@@ -19,6 +19,21 @@ class Settings(BaseSettings):
     AWS_ACCESS_KEY: str = "aws_access_key"
     AWS_S3_BUCKET: str = "aws_bucket"
     AWS_REGION: str = "aws_region"
+    AWS_S3_ENDPOINT_URL: Optional[str] = None
+    S3_SYNC_ON_STARTUP: bool = False
+    VECTORSTORE_LOAD_MODE: str = "memory"
+    EMBEDDING_CACHE_SIZE: int = 10000
+    EMBEDDING_CACHE_PATH: Optional[str] = None
+    EMBEDDING_REQUESTS_PER_MINUTE: int = 3000
+    EMBEDDING_TOKENS_PER_MINUTE: int = 1000000
+    EMBEDDING_QUERY_SHARE: float = 0.1
+    EMBEDDING_STORE_PATH: str = "files/embeddings.sqlite3"
+    INGEST_WORKERS: int = 2
+    SPECULATIVE_CHAT: bool = False
+    SEMANTIC_CACHE_SIZE: int = 5000
+    SEMANTIC_CACHE_THRESHOLD: float = 0.97
+    RESPONSE_CACHE_SIZE: int = 10000
+    RESPONSE_CACHE_TTL_SECONDS: int = 3600
 
     # Mail
     SMTP_HOST: str = "smtp_host"
@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Settings are read when the app modules are imported, so the on-disk stores
+# are pointed at a scratch folder before any test module imports them.
+_scratch = tempfile.mkdtemp(prefix="nuocgpt-tests-")
+os.environ.setdefault("EMBEDDING_STORE_PATH", os.path.join(_scratch, "embeddings.sqlite3"))
+os.environ.setdefault("OPENAI_API_KEY", "test")
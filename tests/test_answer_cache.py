@@ -0,0 +1,93 @@
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+from ai.core.answer_cache import CachedAnswer, SemanticAnswerCache
+from ai.core.sensor_store import SensorSnapshot
+
+TODAY = date(2023, 9, 15)
+CONTEXT = ("prompts-v1", ())
+
+
+def embedding(seed, noise=0.0):
+    """A fixed direction per seed, optionally nudged off it."""
+    rng = np.random.default_rng(seed)
+    vector = rng.standard_normal(16)
+    if noise:
+        vector = vector + noise * np.random.default_rng(seed + 1000).standard_normal(16)
+    return vector.tolist()
+
+
+def entry(question, answer="answer", language="Vietnamese", entities=()):
+    return CachedAnswer(question=question, answer=answer, language=language, tokens=100, entities=entities)
+
+
+@pytest.fixture
+def snapshot():
+    rows = [
+        {
+            "_id": str(i),
+            "answer": "",
+            "location": location,
+            "parameter": "Độ mặn",
+            "value": 1.0,
+            "unit": "g/l",
+            "time": datetime(2023, 9, 15),
+        }
+        for i, location in enumerate(["Bến Tre", "Trà Vinh"])
+    ]
+    return SensorSnapshot(rows)
+
+
+def test_near_duplicate_question_hits():
+    cache = SemanticAnswerCache(max_size=10, threshold=0.97)
+    cache.add(embedding(1), entry("Cách tưới lúa khi nhiễm mặn?"), CONTEXT)
+
+    hit = cache.get(embedding(1, noise=0.01), "Vietnamese", CONTEXT)
+
+    assert hit is not None and hit.question == "Cách tưới lúa khi nhiễm mặn?"
+    assert cache.get(embedding(2), "Vietnamese", CONTEXT) is None
+
+
+def test_questions_about_different_locations_do_not_collide(snapshot):
+    cache = SemanticAnswerCache(max_size=10, threshold=0.97)
+    ben_tre = "độ mặn Bến Tre hôm nay"
+    tra_vinh = "độ mặn Trà Vinh hôm nay"
+    cache.add(embedding(1), entry(ben_tre, answer="2 g/l"), CONTEXT)
+    cache.add(embedding(3), entry(tra_vinh, answer="5 g/l", entities=snapshot.entities(tra_vinh, TODAY)), CONTEXT)
+    cache.add(embedding(1), entry(ben_tre, answer="2 g/l", entities=snapshot.entities(ben_tre, TODAY)), CONTEXT)
+
+    # The two questions embed almost identically.
+    hit = cache.get(embedding(1, noise=0.01), "Vietnamese", CONTEXT, snapshot.entities(tra_vinh, TODAY))
+    assert hit is None
+    hit = cache.get(embedding(1, noise=0.01), "Vietnamese", CONTEXT, snapshot.entities(ben_tre, TODAY))
+    assert hit.answer == "2 g/l"
+
+
+def test_relative_days_resolve_to_different_entities(snapshot):
+    question = "độ mặn Bến Tre hôm nay"
+
+    assert snapshot.entities(question, TODAY) == (("ben tre",), ("do man",), (TODAY,))
+    assert snapshot.entities(question, TODAY) != snapshot.entities(question, date(2023, 9, 16))
+    assert snapshot.entities("Cách tưới lúa?", TODAY) == ((), (), ())
+
+
+def test_answers_are_kept_per_language_and_context():
+    cache = SemanticAnswerCache(max_size=10, threshold=0.97)
+    cache.add(embedding(1), entry("question", language="English"), CONTEXT)
+
+    assert cache.get(embedding(1), "Vietnamese", CONTEXT) is None
+    assert cache.get(embedding(1), "English", CONTEXT) is not None
+    assert cache.get(embedding(1), "English", ("prompts-v2", ())) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_full_cache_keeps_the_newest_half():
+    cache = SemanticAnswerCache(max_size=4, threshold=0.97)
+    for seed in range(5):
+        cache.add(embedding(seed), entry(f"question {seed}"), CONTEXT)
+
+    assert cache.stats()["size"] == 2
+    assert cache.get(embedding(0), "Vietnamese", CONTEXT) is None
+    assert cache.get(embedding(4), "Vietnamese", CONTEXT).question == "question 4"
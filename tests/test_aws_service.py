@@ -0,0 +1,145 @@
+import os
+
+import boto3
+import pytest
+from moto import mock_s3
+
+from ai.core import aws_service
+from ai.core.aws_service import AWSService
+
+BUCKET = "test-bucket"
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def service():
+    with mock_s3():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket=BUCKET)
+        service = AWSService(s3_client=s3)
+        service.s3_bucket = BUCKET
+        # Small parts, so a few megabytes already take the multipart path.
+        service.transfer_config.multipart_threshold = 5 * MB
+        service.transfer_config.multipart_chunksize = 5 * MB
+        yield service
+
+
+def write(folder, key, content):
+    path = os.path.join(folder, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def populate(folder):
+    write(folder, "vectorstore/segments/1/index.faiss", b"a" * (6 * MB))
+    write(folder, "vectorstore/segments/1/index.pkl", b"docstore")
+    write(folder, "vectorstore/manifests/1.json", b"{}")
+    write(folder, "vectorstore/CURRENT", b"1")
+
+
+def test_local_etags_match_s3_for_multipart_uploads(service, tmp_path):
+    folder = str(tmp_path)
+    populate(folder)
+
+    service.upload_to_s3(folder)
+
+    remote = service._remote_manifest()
+    assert remote["vectorstore/segments/1/index.faiss"].endswith("-2")
+    assert remote == service._local_manifest(folder)
+
+
+def test_unchanged_files_are_not_transferred_again(service, tmp_path):
+    source, replica = str(tmp_path / "source"), str(tmp_path / "replica")
+    populate(source)
+
+    assert service.upload_to_s3(source)["transferred"] == 4
+    assert service.upload_to_s3(source)["transferred"] == 0
+    assert service.download_from_s3(replica)["transferred"] == 4
+    assert service.download_from_s3(replica)["transferred"] == 0
+
+    write(source, "vectorstore/segments/1/index.pkl", b"changed")
+    assert service.upload_to_s3(source)["transferred"] == 1
+    assert service.download_from_s3(replica)["transferred"] == 1
+
+
+def test_pointer_files_are_transferred_last(service, tmp_path, monkeypatch):
+    folder = str(tmp_path)
+    populate(folder)
+    uploaded = []
+    upload_file = service.s3.upload_file
+    monkeypatch.setattr(
+        service.s3, "upload_file", lambda path, *args, **kwargs: uploaded.append(path) or upload_file(path, *args, **kwargs)
+    )
+
+    service.upload_to_s3(folder)
+
+    assert uploaded[-1].endswith("CURRENT")
+    assert len(uploaded) == 4
+
+
+def test_download_mirrors_deletions_of_synced_files_only(service, tmp_path):
+    source, replica = str(tmp_path / "source"), str(tmp_path / "replica")
+    populate(source)
+    service.upload_to_s3(source)
+    service.download_from_s3(replica)
+    # Written locally and never synced.
+    write(replica, "embeddings.sqlite3", b"local")
+
+    os.remove(os.path.join(source, "vectorstore/segments/1/index.pkl"))
+    assert service.upload_to_s3(source)["deleted"] == 1
+    assert "vectorstore/segments/1/index.pkl" not in service._remote_manifest()
+
+    assert service.download_from_s3(replica)["deleted"] == 1
+    assert not os.path.exists(os.path.join(replica, "vectorstore/segments/1/index.pkl"))
+    assert os.path.exists(os.path.join(replica, "embeddings.sqlite3"))
+
+
+def test_upload_keeps_objects_that_were_never_synced(service, tmp_path):
+    folder = str(tmp_path)
+    populate(folder)
+    service.s3.put_object(Bucket=BUCKET, Key="other/report.csv", Body=b"x")
+
+    service.upload_to_s3(folder)
+    report = service.upload_to_s3(folder)
+
+    assert report["deleted"] == 0
+    assert "other/report.csv" in service._remote_manifest()
+
+
+def test_local_databases_and_checkpoints_are_never_uploaded(service, tmp_path):
+    folder = str(tmp_path)
+    populate(folder)
+    write(folder, "embeddings.sqlite3", b"local")
+    write(folder, "embeddings.sqlite3-wal", b"local")
+    write(folder, "sensordata.csv.progress", b"120")
+    write(folder, "vectorstore/segments/1/index.mmap.faiss", b"local")
+
+    service.upload_to_s3(folder)
+
+    assert sorted(service._remote_manifest()) == [
+        "vectorstore/CURRENT",
+        "vectorstore/manifests/1.json",
+        "vectorstore/segments/1/index.faiss",
+        "vectorstore/segments/1/index.pkl",
+    ]
+
+
+def test_download_builds_mmap_indexes_before_the_pointers(service, tmp_path, monkeypatch):
+    source, replica = str(tmp_path / "source"), str(tmp_path / "replica")
+    populate(source)
+    service.upload_to_s3(source)
+    monkeypatch.setenv("VECTORSTORE_LOAD_MODE", "mmap")
+    events = []
+    monkeypatch.setattr(aws_service, "write_mmap_index", lambda folder: events.append(("mmap", folder)))
+    download_file = service.s3.download_file
+    monkeypatch.setattr(
+        service.s3,
+        "download_file",
+        lambda bucket, key, *args, **kwargs: events.append(("download", key)) or download_file(bucket, key, *args, **kwargs),
+    )
+
+    service.download_from_s3(replica)
+
+    assert events[-1] == ("download", "vectorstore/CURRENT")
+    assert ("mmap", os.path.join(replica, "vectorstore/segments/1")) in events
@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+from uuid import uuid4
+
+from langchain.docstore.document import Document
+from langchain.retrievers import MergerRetriever
+from langchain.schema import LLMResult
+
+from ai.core.constants import LangChainOpenAIConstants
+from ai.core.lexical_index import LexicalIndex
+from ai.core.metrics import metrics
+from ai.llm.data_loader.vectorestore_retriever import CustomVectorStoreRetriever, start_request_lookups
+from ai.routes.chat import _lookup_answer_cache, speculative_chat
+
+
+class FakeTierChain:
+    """Answers after `delay`, reporting its usage even when cancelled."""
+
+    def __init__(self, answer, delay=0.0, total_tokens=50):
+        self.answer = answer
+        self.delay = delay
+        self.total_tokens = total_tokens
+
+    async def acall(self, inputs, callbacks):
+        handler, run_id = callbacks[0], uuid4()
+        handler.on_llm_start({}, ["prompt"], run_id=run_id)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            handler.on_llm_end(
+                LLMResult(
+                    generations=[],
+                    llm_output={
+                        "token_usage": {"total_tokens": self.total_tokens},
+                        "model_name": "gpt-3.5-turbo",
+                    },
+                ),
+                run_id=run_id,
+            )
+        return {"answer": self.answer}
+
+
+def make_chain(diamond, normal):
+    return SimpleNamespace(
+        get_diamond_chain=lambda: diamond,
+        get_chain=lambda: normal,
+        llm_model=SimpleNamespace(get_num_tokens=len),
+    )
+
+
+def test_diamond_hit_counts_usage_reported_by_the_cancelled_tier():
+    chain = make_chain(FakeTierChain("diamond answer"), FakeTierChain("normal answer", delay=10, total_tokens=50))
+    wasted_tokens = metrics.counter("speculative_chat.wasted_tokens")
+
+    answer = asyncio.run(speculative_chat(chain, "salinity?", []))
+
+    assert answer == "diamond answer"
+    assert metrics.counter("speculative_chat.wasted_tokens") == wasted_tokens + 50
+
+
+def test_diamond_miss_returns_the_knowledge_base_answer():
+    chain = make_chain(
+        FakeTierChain(LangChainOpenAIConstants.DIAMOND_NO_DATA_ANSWER), FakeTierChain("normal answer", delay=0.01)
+    )
+    misses = metrics.counter("speculative_chat.diamond_misses")
+
+    assert asyncio.run(speculative_chat(chain, "salinity?", [])) == "normal answer"
+    assert metrics.counter("speculative_chat.diamond_misses") == misses + 1
+
+
+class CountingLexicalIndex(LexicalIndex):
+    def __init__(self, texts):
+        super().__init__([Document(page_content=text) for text in texts])
+        self.queries = []
+
+    def match(self, query, *args, **kwargs):
+        self.queries.append(query)
+        return super().match(query, *args, **kwargs)
+
+
+def test_answer_cache_lookup_shares_the_lexical_hits_with_the_chain():
+    question = "salinity in ben tre today"
+    retriever = CustomVectorStoreRetriever.construct(
+        search_kwargs={"k": 2}, metadata={"name": "diamond"}, lexical_index=CountingLexicalIndex([question])
+    )
+    skips = metrics.counter("answer_cache.lexical_skips")
+
+    async def scenario():
+        start_request_lookups()
+        cached, entry = await _lookup_answer_cache(None, MergerRetriever(retrievers=[retriever]), question)
+        # What the chain runs next for the same question.
+        return cached, entry, retriever.lexical_search(question)
+
+    cached, entry, hits = asyncio.run(scenario())
+
+    assert (cached, entry) == (None, None)
+    assert hits[0][0].page_content == question
+    assert retriever.lexical_index.queries == [question]
+    assert metrics.counter("answer_cache.lexical_skips") == skips + 1
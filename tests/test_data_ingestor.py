@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+
+from ai.core import data_ingestor
+from ai.core.constants import IngestDataConstants
+from ai.core.data_ingestor import DataIngestor
+from ai.core.segmented_vectorstore import docstore_ids, read_manifest
+
+DIMENSION = 8
+
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic vectors derived from the text, recording what is embedded."""
+
+    model = "hash"
+
+    def __init__(self):
+        self.embedded = []
+
+    def _embed(self, text):
+        rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+        return rng.standard_normal(DIMENSION).astype("float32").tolist()
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    embeddings = CountingEmbeddings()
+    monkeypatch.setattr(data_ingestor, "openai_embedding_with_backoff", lambda: embeddings)
+    monkeypatch.setattr(data_ingestor, "schedule_compaction", lambda *args: None)
+    return embeddings
+
+
+@pytest.fixture
+def ingestor(tmp_path, monkeypatch):
+    monkeypatch.setattr(IngestDataConstants, "STREAM_BATCH_SIZE", 2)
+    ingestor = DataIngestor()
+    ingestor.vectorstore_path = str(tmp_path)
+    ingestor.sensor_data_lib_path = str(tmp_path / "sensor_data_lib")
+    return ingestor
+
+
+def test_bulk_load_skips_questions_already_loaded(ingestor, embeddings):
+    rows = [{"id": "a", "question": "Độ mặn Bến Tre hôm nay?"}, {"id": "b", "question": "Độ pH Trà Vinh hôm nay?"}]
+    assert ingestor.bulk_load_sensor_data_questions(rows) == 2
+
+    loaded = ingestor.bulk_load_sensor_data_questions(rows + [{"id": "c", "question": "Mực nước Cần Thơ hôm qua?"}])
+
+    assert loaded == 1
+    assert docstore_ids(ingestor.sensor_data_lib_path) == {"a", "b", "c"}
+    assert embeddings.embedded.count("Độ mặn Bến Tre hôm nay?") == 1
+
+
+def pages(count, fail_after=None):
+    for number in range(count):
+        if number == fail_after:
+            raise ValueError("corrupt page")
+        yield Document(page_content=f"page {number} of the salinity report", metadata={"source": "report.pdf", "page": number})
+
+
+def test_streaming_ingest_writes_a_segment_per_batch(ingestor, embeddings):
+    progress = []
+    ingestor.on_progress = lambda stats: progress.append(stats["num_chunks"])
+
+    ingestor._save_vectorstore_streaming(pages(5), ingestor.vectorstore_path)
+
+    assert len(read_manifest(ingestor.vectorstore_path)["segments"]) == 3
+    assert progress == [2, 4, 5]
+    assert len(embeddings.embedded) == 5
+
+
+def test_streaming_ingest_raises_parse_errors_after_saving_parsed_chunks(ingestor, embeddings):
+    with pytest.raises(ValueError, match="corrupt page"):
+        ingestor._save_vectorstore_streaming(pages(5, fail_after=2), ingestor.vectorstore_path)
+
+    assert len(read_manifest(ingestor.vectorstore_path)["segments"]) == 1
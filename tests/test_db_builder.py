@@ -0,0 +1,42 @@
+import asyncio
+from datetime import datetime
+from uuid import uuid4
+
+from beanie import init_beanie
+from mongomock_motor import AsyncMongoMockClient
+
+from ai.core.db_builder import _parse_batch
+from ai.schemas.db_model import SensorDataLib
+
+
+def csv_row(time="2023-09-15 08:30:00", value="2.5"):
+    return [str(uuid4()), "Độ mặn ở Bến Tre?", "2.5 g/l", "Độ mặn", "Bến Tre", value, "g/l", time]
+
+
+def test_parse_batch_builds_upserts_and_skips_invalid_rows():
+    async def scenario():
+        await init_beanie(database=AsyncMongoMockClient()["db_builder_test"], document_models=[SensorDataLib])
+        rows = [
+            csv_row(),
+            csv_row(time="2023-09-15"),
+            csv_row(time="2023-9-5 7:00:00"),
+            csv_row(time="2023-9-5"),
+            csv_row(time="15/09/2023 08:30"),
+            csv_row(value="n/a"),
+            ["too", "short"],
+        ]
+
+        operations, num_invalid = _parse_batch(rows)
+
+        assert num_invalid == 3
+        documents = [operation._doc for operation in operations]
+        assert [document["time"] for document in documents] == [
+            datetime(2023, 9, 15, 8, 30),
+            datetime(2023, 9, 15),
+            datetime(2023, 9, 5, 7),
+            datetime(2023, 9, 5),
+        ]
+        for operation, document in zip(operations, documents):
+            assert operation._filter == {"_id": document["_id"]}
+
+    asyncio.run(scenario())
@@ -0,0 +1,32 @@
+import tiktoken
+from langchain.docstore.document import Document
+
+from ai.core.constants import IngestDataConstants
+from ai.core.document_parser import add_token_counts, split_documents, text_splitter
+
+
+def num_tokens(text):
+    return len(tiktoken.encoding_for_model(IngestDataConstants.TOKENIZER_MODEL).encode(text))
+
+
+def test_add_token_counts_keeps_existing_metadata():
+    documents = [Document(page_content="Độ mặn ở Bến Tre hôm nay?", metadata={"source": "q.txt"})]
+
+    add_token_counts(documents)
+
+    assert documents[0].metadata == {
+        "source": "q.txt",
+        IngestDataConstants.NUM_TOKENS_KEY: num_tokens("Độ mặn ở Bến Tre hôm nay?"),
+    }
+
+
+def test_split_chunks_are_counted_with_the_splitter_tokenizer(monkeypatch):
+    monkeypatch.setattr(IngestDataConstants, "CHUNK_SIZE", 20)
+    monkeypatch.setattr(IngestDataConstants, "CHUNK_OVERLAP", 5)
+    text = " ".join(f"Đoạn {i} nói về độ mặn và nước ngọt ở đồng bằng sông Cửu Long." for i in range(10))
+
+    chunks = split_documents([Document(page_content=text, metadata={"source": "a.pdf"})], text_splitter())
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.metadata[IngestDataConstants.NUM_TOKENS_KEY] == num_tokens(chunk.page_content)
@@ -0,0 +1,62 @@
+import asyncio
+
+from langchain.embeddings.base import Embeddings
+
+from ai.core.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings(Embeddings):
+    model = "counting"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return [float(len(text)), 0.5]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+def test_repeated_queries_are_embedded_once():
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, EmbeddingCache(max_size=10))
+
+    first = embeddings.embed_query("Độ mặn là gì?")
+    # Same text up to case, spacing and Unicode normalization.
+    assert embeddings.embed_query("  độ\xa0mặn  là gì? ") == first
+    assert asyncio.run(embeddings.aembed_query("ĐỘ MẶN LÀ GÌ?")) == first
+    # Escaped by the client, as the response cache keys handle it.
+    assert embeddings.embed_query("Độ\\xa0mặn là gì?") == first
+
+    assert inner.calls == ["Độ mặn là gì?"]
+
+
+def test_keys_include_the_model():
+    cache = EmbeddingCache()
+    cache.set("model-a", "question", [1.0])
+
+    assert cache.get("model-a", "question") == [1.0]
+    assert cache.get("model-b", "question") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = EmbeddingCache(max_size=2)
+    cache.set("m", "a", [1.0])
+    cache.set("m", "b", [2.0])
+    cache.get("m", "a")
+    cache.set("m", "c", [3.0])
+
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") == [1.0]
+
+
+def test_persisted_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    EmbeddingCache(persist_path=path).set("m", "question", [0.25, 0.5])
+
+    assert EmbeddingCache(persist_path=path).get("m", "question") == [0.25, 0.5]
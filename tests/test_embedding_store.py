@@ -0,0 +1,51 @@
+from langchain.embeddings.base import Embeddings
+
+from ai.core import embedding_store
+from ai.core.embedding_store import ContentAddressedEmbeddings, EmbeddingStore, content_hash
+
+
+class CountingEmbeddings(Embeddings):
+    model = "counting"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_only_missing_chunks_are_embedded(tmp_path):
+    inner = CountingEmbeddings()
+    embeddings = ContentAddressedEmbeddings(inner, EmbeddingStore(str(tmp_path / "embeddings.sqlite3")))
+
+    first = embeddings.embed_documents(["a", "bb"])
+    second = embeddings.embed_documents(["bb", "ccc", "ccc"])
+
+    assert first == [[1.0, 0.5], [2.0, 0.5]]
+    assert second == [[2.0, 0.5], [3.0, 0.5], [3.0, 0.5]]
+    # Duplicates within a call are embedded once too.
+    assert inner.calls == [["a", "bb"], ["ccc"]]
+
+
+def test_stored_vectors_never_call_the_api(tmp_path):
+    inner = CountingEmbeddings()
+    embeddings = ContentAddressedEmbeddings(inner, EmbeddingStore(str(tmp_path / "embeddings.sqlite3")))
+    embeddings.embed_documents(["a"])
+
+    assert embeddings.stored_vectors(["a", "b"]) == [[1.0, 0.5], None]
+    assert inner.calls == [["a"]]
+
+
+def test_vectors_are_keyed_by_model_and_persisted(tmp_path, monkeypatch):
+    path = str(tmp_path / "embeddings.sqlite3")
+    EmbeddingStore(path).put_many({content_hash("m", "text"): [0.25]})
+    # Lookups larger than one SQLite statement are batched.
+    monkeypatch.setattr(embedding_store, "QUERY_BATCH_SIZE", 2)
+
+    store = EmbeddingStore(path)
+    hashes = [content_hash("other", "text"), content_hash("m", "x"), content_hash("m", "text")]
+    assert store.get_many(hashes) == {content_hash("m", "text"): [0.25]}
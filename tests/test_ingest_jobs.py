@@ -0,0 +1,200 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from beanie import init_beanie
+from mongomock_motor import AsyncMongoMockClient
+
+from ai.core import ingest_jobs
+from ai.core.constants import IngestDataConstants
+from ai.core.ingest_jobs import IngestJobQueue
+from ai.schemas.db_model import IngestJob, IngestJobFile, IngestJobStatus
+from ai.schemas.schemas import IngestJobStatusResponse
+
+
+async def init_db():
+    await init_beanie(database=AsyncMongoMockClient()["ingest_jobs_test"], document_models=[IngestJob])
+
+
+async def create_job(name: str, **fields) -> IngestJob:
+    job = IngestJob(
+        files=[IngestJobFile(filename=f"{name}.pdf", path=f"tmp/{name}.pdf", extension="pdf")],
+        **fields,
+    )
+    await job.create()
+    return job
+
+
+def test_each_job_is_claimed_by_one_worker():
+    async def scenario():
+        await init_db()
+        jobs = [await create_job(str(i)) for i in range(3)]
+        queues = [IngestJobQueue(), IngestJobQueue()]
+
+        claims = await asyncio.gather(*(queue.claim() for queue in queues * 3))
+
+        claimed = [job for job in claims if job is not None]
+        assert sorted(job.id for job in claimed) == sorted(job.id for job in jobs)
+        for job in claimed:
+            assert job.status == IngestJobStatus.running
+            assert job.worker in {queue.worker_id for queue in queues}
+
+    asyncio.run(scenario())
+
+
+def test_oldest_job_is_claimed_first():
+    async def scenario():
+        await init_db()
+        now = datetime.now()
+        newer = await create_job("newer", created_at=now)
+        older = await create_job("older", created_at=now - timedelta(minutes=1))
+        queue = IngestJobQueue()
+
+        assert (await queue.claim()).id == older.id
+        assert (await queue.claim()).id == newer.id
+        assert await queue.claim() is None
+
+    asyncio.run(scenario())
+
+
+def test_running_job_is_only_reclaimed_after_its_lease_expires():
+    async def scenario():
+        await init_db()
+        live = await create_job(
+            "live",
+            status=IngestJobStatus.running,
+            worker="other",
+            lease_until=datetime.now() + timedelta(minutes=1),
+        )
+        expired = await create_job(
+            "expired",
+            status=IngestJobStatus.running,
+            worker="dead",
+            lease_until=datetime.now() - timedelta(minutes=1),
+        )
+        queue = IngestJobQueue()
+
+        reclaimed = await queue.claim()
+        assert reclaimed.id == expired.id
+        assert reclaimed.worker == queue.worker_id
+        assert reclaimed.lease_until > datetime.now()
+        assert await queue.claim() is None
+        assert (await IngestJob.get(live.id)).worker == "other"
+
+    asyncio.run(scenario())
+
+
+def test_finished_jobs_are_never_claimed():
+    async def scenario():
+        await init_db()
+        await create_job("done", status=IngestJobStatus.completed)
+        await create_job("broken", status=IngestJobStatus.failed)
+
+        assert await IngestJobQueue().claim() is None
+
+    asyncio.run(scenario())
+
+
+def test_failed_jobs_do_not_count_as_duplicates():
+    async def scenario():
+        await init_db()
+        job = await create_job("report", content_hashes=["abc"])
+        queue = IngestJobQueue()
+
+        assert (await queue.find_by_hash("abc")).id == job.id
+
+        job.status = IngestJobStatus.failed
+        job.content_hashes = []
+        await job.save()
+        assert await queue.find_by_hash("abc") is None
+
+    asyncio.run(scenario())
+
+
+def test_upload_folder_is_per_job():
+    job_id = uuid4()
+    assert IngestJobQueue.upload_folder(job_id).endswith(str(job_id))
+
+
+class FakeDataIngestor:
+    """Streams a four-page PDF, reporting progress after every page."""
+
+    page_seconds = 0.0
+
+    def __init__(self, lang="", on_progress=None):
+        self.on_progress = on_progress
+        self.stats = {"stage": "embedding", "num_chunks": 0, "num_skipped_chunks": 0, "timings": {}, "num_pages": 4}
+
+    def ingest_pdf(self, path):
+        for page in range(1, 5):
+            time.sleep(self.page_seconds)
+            self.stats["pages_done"] = page
+            self.stats["num_chunks"] += 2
+            self.on_progress(self.stats)
+
+
+def test_single_file_job_reports_page_progress(monkeypatch):
+    monkeypatch.setattr(ingest_jobs, "DataIngestor", FakeDataIngestor)
+    progress = []
+    update = IngestJobQueue._update
+
+    async def record_update(self, job, fields):
+        if "num_chunks" in fields:
+            progress.append(fields["progress"])
+        return await update(self, job, fields)
+
+    monkeypatch.setattr(IngestJobQueue, "_update", record_update)
+
+    async def scenario():
+        await init_db()
+        await create_job("report")
+        queue = IngestJobQueue()
+
+        await queue._process(await queue.claim())
+
+        stored = await IngestJob.find_one()
+        assert stored.status == IngestJobStatus.completed
+        assert (stored.progress, stored.files_done, stored.num_chunks) == (1, 1, 8)
+        assert stored.lease_until is None
+        assert progress == [0.25, 0.5, 0.75, 1.0]
+
+    asyncio.run(scenario())
+
+
+def test_job_taken_over_by_another_worker_is_left_alone(monkeypatch):
+    monkeypatch.setattr(ingest_jobs, "DataIngestor", FakeDataIngestor)
+    monkeypatch.setattr(FakeDataIngestor, "page_seconds", 0.05)
+    monkeypatch.setattr(IngestDataConstants, "INGEST_JOB_LEASE_SECONDS", 0.04)
+
+    async def scenario():
+        await init_db()
+        await create_job("report")
+        queue = IngestJobQueue()
+        job = await queue.claim()
+        # The lease expired and another worker reclaimed the job.
+        await IngestJob.find_one(IngestJob.id == job.id).update({"$set": {"worker": "other"}})
+
+        await queue._process(job)
+
+        stored = await IngestJob.get(job.id)
+        assert stored.worker == "other"
+        assert stored.status == IngestJobStatus.running
+        assert stored.num_chunks == 0
+
+    asyncio.run(scenario())
+
+
+def test_public_status_hides_paths_and_leases():
+    job = IngestJob(
+        files=[IngestJobFile(filename="report.pdf", path="tmp/uploaded/x/0.pdf", extension="pdf")],
+        status=IngestJobStatus.running,
+        worker="host:1:abc",
+        lease_until=datetime.now(),
+    )
+
+    status = IngestJobStatusResponse.from_job(job).dict()
+
+    assert status["filenames"] == ["report.pdf"]
+    assert status["status"] == IngestJobStatus.running
+    assert not {"files", "worker", "lease_until", "content_hashes"} & set(status)
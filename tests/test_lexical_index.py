@@ -0,0 +1,50 @@
+from langchain.docstore.document import Document
+
+from ai.core.lexical_index import LexicalIndex, fold, tokenize
+
+QUESTIONS = [
+    "Độ mặn ở Bến Tre hôm nay là bao nhiêu?",
+    "Cách tưới lúa khi nước bị nhiễm mặn?",
+    "Hạn mặn năm 2020 ảnh hưởng thế nào đến Trà Vinh?",
+]
+
+
+def make_index(texts=QUESTIONS):
+    return LexicalIndex([Document(page_content=text) for text in texts])
+
+
+def test_fold_strips_diacritics_and_case():
+    assert fold("Độ Mặn") == "do man"
+    assert tokenize("Đồng bằng, sông Cửu Long!") == ["dong", "bang", "song", "cuu", "long"]
+
+
+def test_verbatim_question_matches_with_full_confidence():
+    index = make_index()
+
+    hits = index.match("do man o ben tre hom nay la bao nhieu")
+
+    assert [hit.page_content for hit, _ in hits] == [QUESTIONS[0]]
+    assert hits[0][1] > 0.99
+
+
+def test_question_sharing_a_few_words_stays_below_threshold():
+    index = make_index()
+
+    assert index.match("Độ mặn ở Trà Vinh hôm nay?") == []
+    best, confidence = index.search("Độ mặn ở Trà Vinh hôm nay?", k=1)[0]
+    assert best.page_content == QUESTIONS[0]
+    assert 0 < confidence < 0.9
+
+
+def test_unknown_terms_lower_the_confidence():
+    index = make_index()
+
+    (_, known), = index.search(QUESTIONS[1], k=1)
+    (_, with_unknown), = index.search(QUESTIONS[1] + " xoài", k=1)
+
+    assert with_unknown < known
+
+
+def test_empty_index_and_empty_query():
+    assert make_index([]).search("độ mặn") == []
+    assert make_index().search("?!") == []
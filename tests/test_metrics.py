@@ -0,0 +1,28 @@
+from ai.core.metrics import Metrics
+
+
+def test_counters_and_timings():
+    metrics = Metrics(max_samples=3)
+    metrics.incr("hits")
+    metrics.incr("hits", 2)
+    for seconds in (5.0, 1.0, 2.0, 3.0):
+        metrics.observe("load_seconds", seconds)
+
+    assert metrics.counter("hits") == 3
+    assert metrics.counter("misses") == 0
+    # Only the latest `max_samples` are kept.
+    assert metrics.average("load_seconds") == 2.0
+    assert metrics.average("unknown") is None
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {"hits": 3}
+    assert snapshot["timings"]["load_seconds"] == {"count": 3, "avg": 2.0, "p50": 2.0, "p99": 3.0}
+
+
+def test_providers_are_embedded_in_snapshots():
+    metrics = Metrics()
+    metrics.incr("cache.hits")
+    # Providers may read counters while the snapshot is taken.
+    metrics.register_provider("cache", lambda: {"hits": metrics.counter("cache.hits")})
+
+    assert metrics.snapshot()["cache"] == {"hits": 1}
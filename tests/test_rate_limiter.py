@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from ai.core import rate_limiter
+from ai.core.rate_limiter import (
+    DOCUMENTS,
+    QUERIES,
+    EmbeddingRateLimiter,
+    RateLimitedEmbeddings,
+    TokenBucket,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class WhitespaceEncoding:
+    """One token per word, so token counts are easy to reason about."""
+
+    def encode_batch(self, texts, **kwargs):
+        return [text.split() for text in texts]
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+    def embed_query(self, text):
+        return [float(len(text))]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(rate_limiter.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def make_embeddings(limiter, batch_size=100):
+    embeddings = RateLimitedEmbeddings(FakeEmbeddings(), limiter, batch_size=batch_size)
+    embeddings.encoding = WhitespaceEncoding()
+    return embeddings
+
+
+def test_bucket_waits_for_refill_once_empty(clock):
+    bucket = TokenBucket(capacity=60, refill_per_second=1)
+
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(30) == pytest.approx(30.0)
+
+    clock.now = 30.0
+    # The overdraft has been paid back, nothing more is available yet.
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+
+def test_bucket_refill_is_capped(clock):
+    bucket = TokenBucket(capacity=10, refill_per_second=1)
+    clock.now = 1000.0
+    assert bucket.reserve(10) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+
+def test_queries_do_not_wait_behind_documents(clock):
+    limiter = EmbeddingRateLimiter(requests_per_minute=600, tokens_per_minute=1000, query_share=0.1)
+
+    assert limiter._reserve(900, DOCUMENTS) == 0.0
+    assert limiter._reserve(900, DOCUMENTS) > 0
+    assert limiter._reserve(50, QUERIES) == 0.0
+
+
+def test_max_tokens_is_the_documents_share():
+    limiter = EmbeddingRateLimiter(requests_per_minute=600, tokens_per_minute=1000, query_share=0.2)
+    assert limiter.max_tokens(DOCUMENTS) == 800
+    assert limiter.max_tokens(QUERIES) == 200
+
+
+def test_document_batches_stay_within_the_token_share(clock, no_sleep):
+    limiter = EmbeddingRateLimiter(requests_per_minute=6000, tokens_per_minute=100, query_share=0.1)
+    embeddings = make_embeddings(limiter)
+    texts = [" ".join(["word"] * 40)] * 5
+
+    vectors = embeddings.embed_documents(texts)
+
+    assert len(vectors) == len(texts)
+    batches = embeddings.embeddings.batches
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert all(sum(len(text.split()) for text in batch) <= limiter.max_tokens() for batch in batches)
+
+
+def test_document_batches_respect_batch_size(clock, no_sleep):
+    limiter = EmbeddingRateLimiter(requests_per_minute=6000, tokens_per_minute=10 ** 6)
+    embeddings = make_embeddings(limiter, batch_size=3)
+
+    embeddings.embed_documents(["a"] * 7)
+
+    assert [len(batch) for batch in embeddings.embeddings.batches] == [3, 3, 1]
+
+
+def test_oversized_text_is_sent_alone(clock, no_sleep):
+    limiter = EmbeddingRateLimiter(requests_per_minute=6000, tokens_per_minute=100, query_share=0.1)
+    embeddings = make_embeddings(limiter)
+
+    embeddings.embed_documents(["a", " ".join(["word"] * 200), "b"])
+
+    assert [len(batch) for batch in embeddings.embeddings.batches] == [1, 1, 1]
+
+
+def test_query_embeddings_use_the_query_share(clock, no_sleep):
+    limiter = EmbeddingRateLimiter(requests_per_minute=600, tokens_per_minute=1000, query_share=0.1)
+    embeddings = make_embeddings(limiter)
+
+    asyncio.run(embeddings.aembed_query("how salty is the river"))
+
+    assert limiter.buckets[QUERIES][1].available == pytest.approx(95)
+    assert limiter.buckets[DOCUMENTS][1].available == pytest.approx(900)
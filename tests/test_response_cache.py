@@ -0,0 +1,51 @@
+import unicodedata
+from datetime import date
+
+from ai.core import response_cache as response_cache_module
+from ai.core.response_cache import ResponseCache, fingerprint
+from ai.core.text_normalization import normalize_text
+
+
+def key(question, chat_history=None, named_days=()):
+    return fingerprint(question, chat_history, "Vietnamese", "prompts-v1", [("help_center", (1, ()))], named_days)
+
+
+def test_normalize_text_folds_spacing_and_case():
+    assert normalize_text("  Độ\xa0mặn\\xa0là  GÌ?\n") == "độ mặn là gì?"
+    # Decomposed and precomposed Vietnamese are the same text.
+    assert normalize_text(unicodedata.normalize("NFD", "mặn")) == normalize_text("mặn")
+
+
+def test_fingerprint_ignores_formatting_but_not_content():
+    assert key("Độ mặn là gì?") == key("  độ\xa0mặn là   gì? ")
+    assert key("Độ mặn là gì?") != key("Độ pH là gì?")
+    assert key("Còn ở đó?", [("Độ mặn Bến Tre?", "2 g/l")]) != key("Còn ở đó?", [("Độ mặn Trà Vinh?", "5 g/l")])
+
+
+def test_fingerprint_changes_with_the_named_days():
+    question = "Độ mặn Bến Tre hôm nay?"
+    assert key(question, named_days=(date(2023, 9, 15),)) != key(question, named_days=(date(2023, 9, 16),))
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache_module.time, "monotonic", lambda: now[0])
+    cache = ResponseCache(max_size=10, ttl_seconds=60)
+    cache.set("key", "answer")
+
+    now[0] += 59
+    assert cache.get("key") == "answer"
+    now[0] += 2
+    assert cache.get("key") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_size=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("1", "3")
@@ -0,0 +1,157 @@
+import asyncio
+
+from langchain.callbacks.base import AsyncCallbackHandler
+from langchain.chains import LLMChain
+from langchain.docstore.document import Document
+from langchain.chains.question_answering import load_qa_chain
+from langchain.embeddings.base import Embeddings
+from langchain.llms.fake import FakeListLLM
+from langchain.prompts import PromptTemplate
+from langchain.retrievers import MergerRetriever
+from langchain.vectorstores import FAISS
+
+from ai.core.lexical_index import LexicalIndex
+from ai.core.metrics import metrics
+from ai.llm.base_model.retrieval_chain import CustomConversationalRetrievalChain
+from ai.llm.data_loader.vectorestore_retriever import CustomVectorStoreRetriever, start_request_lookups
+
+
+class CountingEmbeddings(Embeddings):
+    """Two-dimensional vectors from the text length, counting query calls."""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.queries = []
+
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text):
+        self.queries.append(text)
+        await asyncio.sleep(self.delay)
+        return self.embed_query(text)
+
+
+class CountingLexicalIndex(LexicalIndex):
+    def __init__(self, texts):
+        super().__init__([Document(page_content=text) for text in texts])
+        self.queries = []
+
+    def match(self, query, *args, **kwargs):
+        self.queries.append(query)
+        return super().match(query, *args, **kwargs)
+
+
+class RetrieverStarts(AsyncCallbackHandler):
+    def __init__(self):
+        self.queries = []
+
+    async def on_retriever_start(self, serialized, query, **kwargs):
+        self.queries.append(query)
+
+
+def make_retriever(name, texts, embeddings, search_type="similarity", **search_kwargs):
+    return CustomVectorStoreRetriever(
+        vectorstore=FAISS.from_texts(texts, embeddings),
+        search_type=search_type,
+        search_kwargs={"k": 2, **search_kwargs},
+        embeddings=embeddings,
+        metadata={"name": name},
+    )
+
+
+def make_chain(retrievers, answers=("answer",), **fields):
+    llm = FakeListLLM(responses=list(answers))
+    return CustomConversationalRetrievalChain(
+        retriever=MergerRetriever(retrievers=retrievers),
+        combine_docs_chain=load_qa_chain(llm),
+        question_generator=LLMChain(llm=llm, prompt=PromptTemplate.from_template("{question} {chat_history}")),
+        return_source_documents=True,
+        **fields,
+    )
+
+
+def test_question_is_embedded_once_per_request_and_kept_out_of_outputs():
+    embeddings = CountingEmbeddings()
+
+    async def scenario():
+        start_request_lookups()
+        chains = [
+            make_chain([make_retriever("a", ["salinity", "rice"], embeddings)]),
+            make_chain([make_retriever("b", ["drought", "canal"], embeddings)]),
+        ]
+        return await asyncio.gather(
+            *(chain.acall({"question": "salinity?", "chat_history": []}) for chain in chains)
+        )
+
+    outputs = asyncio.run(scenario())
+
+    assert embeddings.queries == ["salinity?"]
+    for output in outputs:
+        assert output["answer"] == "answer"
+        assert set(output) == {"question", "chat_history", "answer", "scores", "source_documents"}
+
+
+def test_each_retriever_reports_to_the_chain_callbacks():
+    embeddings = CountingEmbeddings()
+    chain = make_chain(
+        [
+            make_retriever("a", ["salinity", "rice"], embeddings),
+            make_retriever("b", ["drought", "canal"], embeddings),
+        ]
+    )
+    handler = RetrieverStarts()
+
+    asyncio.run(chain.acall({"question": "salinity?", "chat_history": []}, callbacks=[handler]))
+
+    # The merged retrieval plus one child run per retriever.
+    assert handler.queries == ["salinity?"] * 3
+
+
+def test_retriever_timeout_covers_embedding_the_question():
+    embeddings = CountingEmbeddings(delay=1)
+    chain = make_chain([make_retriever("slow", ["salinity", "rice"], embeddings)], retriever_timeout=0.05)
+    timeouts = metrics.counter("retriever.slow.timeouts")
+
+    output = asyncio.run(chain.acall({"question": "salinity?", "chat_history": []}))
+
+    assert output["source_documents"] == []
+    assert metrics.counter("retriever.slow.timeouts") == timeouts + 1
+
+
+def test_no_docs_answer_skips_the_llm():
+    embeddings = CountingEmbeddings()
+    retriever = make_retriever(
+        "diamond", ["salinity", "rice"], embeddings, search_type="similarity_score_threshold", score_threshold=0.99
+    )
+    # No responses: any LLM call would fail.
+    chain = make_chain([retriever], answers=(), no_docs_answer="no data")
+    short_circuits = metrics.counter("retrieval_chain.no_docs_short_circuits")
+
+    output = asyncio.run(chain.acall({"question": "how deep is the canal today?", "chat_history": []}))
+
+    assert output["answer"] == "no data"
+    assert output["source_documents"] == []
+    assert metrics.counter("retrieval_chain.no_docs_short_circuits") == short_circuits + 1
+
+
+def test_lexical_index_is_searched_once_per_request():
+    embeddings = CountingEmbeddings()
+    texts = ["salinity in ben tre today", "rice planting season"]
+    retriever = make_retriever("a", texts, embeddings)
+    retriever.lexical_index = CountingLexicalIndex(texts)
+    chain = make_chain([retriever])
+
+    async def scenario():
+        start_request_lookups()
+        assert retriever.has_lexical_match("salinity in ben tre today")
+        return await chain.acall({"question": "salinity in ben tre today", "chat_history": []})
+
+    output = asyncio.run(scenario())
+
+    assert retriever.lexical_index.queries == ["salinity in ben tre today"]
+    assert embeddings.queries == []
+    assert output["source_documents"][0].page_content == "salinity in ben tre today"
@@ -0,0 +1,155 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+
+from ai.core import segmented_vectorstore
+from ai.core.constants import IngestDataConstants
+from ai.core.embedding_store import ContentAddressedEmbeddings, EmbeddingStore, content_hash
+from ai.core.faiss_io import from_embeddings
+from ai.core.segmented_vectorstore import (
+    SNAPSHOTS_FOLDER,
+    append_segment,
+    compact,
+    content_hashes,
+    load_segmented,
+    manifest_folders,
+    read_manifest,
+    with_current_manifest,
+)
+
+DIMENSION = 8
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic vectors derived from the text."""
+
+    model = "hash"
+
+    def _embed(self, text):
+        rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+        return rng.standard_normal(DIMENSION).astype("float32").tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def make_segment(texts, embeddings=None):
+    embeddings = embeddings or HashEmbeddings()
+    documents = [
+        Document(page_content=text, metadata={IngestDataConstants.CONTENT_HASH_KEY: content_hash("hash", text)})
+        for text in texts
+    ]
+    return from_embeddings(documents, embeddings.embed_documents(texts), embeddings, index_config={"type": "flat"})
+
+
+def loaded_texts(path):
+    vectorstore, _ = load_segmented(path, HashEmbeddings())
+    stores = getattr(vectorstore, "stores", [vectorstore])
+    return sorted(store.docstore.search(doc_id).page_content for store in stores for doc_id in store.index_to_docstore_id.values())
+
+
+def test_each_append_publishes_a_new_version(tmp_path):
+    path = str(tmp_path)
+
+    append_segment(path, make_segment(["a"]))
+    append_segment(path, make_segment(["b"]))
+
+    manifest = read_manifest(path)
+    assert manifest["version"] == 2
+    assert len(manifest["segments"]) == 2
+    assert loaded_texts(path) == ["a", "b"]
+
+
+def test_gc_keeps_only_folders_of_retained_versions(tmp_path, monkeypatch):
+    monkeypatch.setattr(IngestDataConstants, "SNAPSHOT_RETENTION", 1)
+    path = str(tmp_path)
+    append_segment(path, make_segment(["a"]))
+    compact(path, HashEmbeddings())
+
+    manifest = read_manifest(path)
+    assert manifest["segments"] == []
+    on_disk = {
+        os.path.normpath(os.path.join(path, folder, name))
+        for folder in ("segments", "snapshots")
+        for name in os.listdir(os.path.join(path, folder))
+    }
+    assert on_disk == set(manifest_folders(path, manifest))
+    assert len(os.listdir(os.path.join(path, "manifests"))) == 1
+
+
+def test_reader_retries_when_its_folders_were_collected(tmp_path, monkeypatch):
+    monkeypatch.setattr(IngestDataConstants, "SNAPSHOT_RETENTION", 1)
+    path = str(tmp_path)
+    append_segment(path, make_segment(["a"]))
+    stale = read_manifest(path)
+    # Two publishes land before the reader opens the folders of `stale`.
+    append_segment(path, make_segment(["b"]))
+    compact(path, HashEmbeddings())
+
+    seen = []
+
+    def read(manifest):
+        seen.append(manifest["version"])
+        return load_segmented(path, HashEmbeddings(), manifest=manifest)
+
+    with_current_manifest(path, read, manifest=stale)
+
+    assert seen == [stale["version"], read_manifest(path)["version"]]
+
+
+def test_reader_gives_up_after_repeated_failures(tmp_path):
+    path = str(tmp_path)
+    append_segment(path, make_segment(["a"]))
+    calls = []
+
+    def read(manifest):
+        calls.append(manifest)
+        raise FileNotFoundError
+
+    with pytest.raises(FileNotFoundError):
+        with_current_manifest(path, read)
+    assert len(calls) == segmented_vectorstore.READ_ATTEMPTS
+
+
+def test_content_hashes_follow_the_current_version(tmp_path):
+    path = str(tmp_path)
+    append_segment(path, make_segment(["a", "b"]))
+    assert content_hashes(path) == {content_hash("hash", "a"), content_hash("hash", "b")}
+
+    compact(path, HashEmbeddings())
+    assert content_hashes(path) == {content_hash("hash", "a"), content_hash("hash", "b")}
+
+    # Deleting the index forgets its chunks, so they are ingested again.
+    shutil.rmtree(path)
+    assert content_hashes(path) == set()
+
+
+def test_compaction_uses_stored_raw_vectors(tmp_path, monkeypatch):
+    path = str(tmp_path / "store")
+    embeddings = ContentAddressedEmbeddings(HashEmbeddings(), EmbeddingStore(str(tmp_path / "embeddings.sqlite3")))
+    texts = ["a", "b", "c"]
+    raw_vectors = embeddings.embed_documents(texts)
+    segment = make_segment(texts, embeddings)
+    # Stand in for a lossy index: the indexed vectors differ from the raw ones.
+    segment.index.reset()
+    segment.index.add(np.zeros((len(texts), DIMENSION), dtype="float32"))
+    append_segment(path, segment)
+
+    compact(path, embeddings)
+
+    manifest = read_manifest(path)
+    assert manifest["base"].startswith(SNAPSHOTS_FOLDER)
+    vectorstore, _ = load_segmented(path, embeddings)
+    by_text = {
+        vectorstore.docstore.search(doc_id).page_content: vectorstore.index.reconstruct(position)
+        for position, doc_id in vectorstore.index_to_docstore_id.items()
+    }
+    for text, raw in zip(texts, raw_vectors):
+        np.testing.assert_allclose(by_text[text], raw, rtol=1e-6)
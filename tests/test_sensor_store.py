@@ -0,0 +1,120 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from beanie import init_beanie
+from mongomock_motor import AsyncMongoMockClient
+
+from ai.core import sensor_store as sensor_store_module
+from ai.core.sensor_store import SensorSnapshot, SensorStore, local_today
+from ai.schemas.db_model import SensorDataLib, SensorDataVersion
+
+TODAY = date(2023, 9, 15)
+
+
+def row(location, parameter, time, value, unit="g/l"):
+    return {
+        "_id": f"{location}-{parameter}-{time.isoformat()}",
+        "answer": f"{parameter} {location} {value}",
+        "location": location,
+        "parameter": parameter,
+        "value": value,
+        "unit": unit,
+        "time": time,
+    }
+
+
+@pytest.fixture
+def snapshot():
+    return SensorSnapshot(
+        [
+            row("Bến Tre", "Độ mặn", datetime(2023, 9, 15, 8), 2.0),
+            row("Bến Tre", "Độ mặn", datetime(2023, 9, 14, 8), 1.0),
+            row("Bến Tre", "Độ mặn", datetime(2023, 9, 15, 20), 4.0),
+            row("Thành phố Bến Tre", "Độ mặn", datetime(2023, 9, 15, 9), 9.0),
+            row("Trà Vinh", "Độ pH", datetime(2023, 9, 15, 10), 7.1, unit=""),
+        ]
+    )
+
+
+def test_parse_recognizes_location_parameter_and_relative_day(snapshot):
+    query = snapshot.parse("Độ mặn ở Bến Tre hôm nay?", today=TODAY)
+    assert snapshot.locations[query.location] == "Bến Tre"
+    assert snapshot.parameters[query.parameter] == "Độ mặn"
+    assert query.day == TODAY
+
+    assert snapshot.parse("do man ben tre hom qua", today=TODAY).day == TODAY - timedelta(days=1)
+    assert snapshot.parse("Độ mặn Bến Tre hiện tại", today=TODAY).day is None
+    assert snapshot.parse("Độ mặn Bến Tre ngày 3/9", today=TODAY).day == date(2023, 9, 3)
+
+
+def test_parse_prefers_the_longest_location(snapshot):
+    query = snapshot.parse("Độ mặn Thành phố Bến Tre hôm nay", today=TODAY)
+    assert snapshot.locations[query.location] == "Thành phố Bến Tre"
+
+
+def test_parse_leaves_questions_without_a_lookup_to_the_llm(snapshot):
+    # No time reference.
+    assert snapshot.parse("Độ mặn ở Bến Tre ảnh hưởng lúa thế nào?", today=TODAY) is None
+    # Unknown location.
+    assert snapshot.parse("Độ mặn ở Sóc Trăng hôm nay?", today=TODAY) is None
+    # Invalid date.
+    assert snapshot.parse("Độ mặn Bến Tre ngày 31/2", today=TODAY) is None
+    # Advice about a reading.
+    assert snapshot.parse("Hiện tại độ mặn ở Bến Tre cao, nên làm gì?", today=TODAY) is None
+    assert snapshot.parse("Why is the Độ mặn in Bến Tre high today?", today=TODAY) is None
+
+
+def test_range_aggregates_one_day(snapshot):
+    query = snapshot.parse("Độ mặn Bến Tre hôm nay", today=TODAY)
+    day_start = datetime(2023, 9, 15)
+
+    aggregates = snapshot.range(query.location, query.parameter, day_start, day_start + timedelta(days=1))
+
+    assert aggregates["count"] == 2
+    assert (aggregates["min"], aggregates["max"], aggregates["mean"]) == (2.0, 4.0, 3.0)
+    assert aggregates["latest"]["time"] == datetime(2023, 9, 15, 20)
+
+
+def test_answer_uses_the_sensors_time_zone(snapshot, monkeypatch):
+    # 18:00 UTC on the 14th is already the 15th in Vietnam (UTC+7).
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2023, 9, 14, 18, tzinfo=timezone.utc).astimezone(tz)
+
+    monkeypatch.setattr(sensor_store_module, "datetime", FrozenDatetime)
+    assert local_today() == TODAY
+
+    store = SensorStore()
+    store.snapshot = snapshot
+    answer = store.answer("Độ mặn Bến Tre hôm nay", language="English")
+
+    assert answer.startswith("The Độ mặn at Bến Tre on 15/09/2023: average 3.00 g/l")
+
+
+def test_other_processes_reload_after_a_publish():
+    async def add_reading(value):
+        await SensorDataLib(
+            question="q", answer="a", parameter="Độ mặn", location="Bến Tre", value=value, unit="g/l",
+            time=datetime(2023, 9, 15, int(value)),
+        ).create()
+
+    async def scenario():
+        await init_beanie(
+            database=AsyncMongoMockClient()["sensor_store_test"], document_models=[SensorDataLib, SensorDataVersion]
+        )
+        await add_reading(1)
+        builder, server = SensorStore(), SensorStore()
+        await server.refresh()
+        assert not await server.refresh_if_stale()
+
+        await add_reading(2)
+        await builder.publish()
+
+        assert await server.refresh_if_stale()
+        assert len(server.snapshot) == 2
+        assert server.version == builder.version == 1
+        assert not await server.refresh_if_stale()
+
+    asyncio.run(scenario())
@@ -0,0 +1,58 @@
+import os
+
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores import FAISS
+
+from ai.core.vectorstore_registry import VectorStoreRegistry
+
+
+class LengthEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+def publish(path, texts, mtime_ns):
+    FAISS.from_texts(texts, LengthEmbeddings()).save_local(path)
+    # Same-second rewrites must still look changed.
+    for filename in ("index.faiss", "index.pkl"):
+        os.utime(os.path.join(path, filename), ns=(mtime_ns, mtime_ns))
+
+
+def test_vectorstore_is_loaded_once_and_shared(tmp_path):
+    path = str(tmp_path)
+    publish(path, ["a", "bb"], 1_000_000_000)
+    registry = VectorStoreRegistry()
+
+    first = registry.get_vectorstore("kb", path, LengthEmbeddings())
+
+    assert first.index.ntotal == 2
+    assert registry.get_vectorstore("kb", path, LengthEmbeddings()) is first
+
+
+def test_changed_index_is_reloaded(tmp_path):
+    path = str(tmp_path)
+    publish(path, ["a", "bb"], 1_000_000_000)
+    registry = VectorStoreRegistry()
+    first = registry.get_vectorstore("kb", path, LengthEmbeddings())
+
+    publish(path, ["a", "bb", "ccc"], 2_000_000_000)
+    second = registry.get_vectorstore("kb", path, LengthEmbeddings())
+
+    assert second is not first
+    assert second.index.ntotal == 3
+
+
+def test_retrievers_are_shared_per_search_settings(tmp_path):
+    path = str(tmp_path)
+    publish(path, ["a", "bb"], 1_000_000_000)
+    registry = VectorStoreRegistry()
+
+    _, retriever = registry.get_retriever("kb", path, LengthEmbeddings(), {"k": 2, "score_threshold": 0.5})
+    _, same = registry.get_retriever("kb", path, LengthEmbeddings(), {"score_threshold": 0.5, "k": 2})
+    _, other = registry.get_retriever("kb", path, LengthEmbeddings(), {"k": 3, "score_threshold": 0.5})
+
+    assert same is retriever
+    assert other is not retriever